@@ -0,0 +1,169 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from blog.analysis_cache import get_cached_analysis, store_analysis, \
+    is_cached
+from blog.analyzers import AnalysisResult, LocationSentiment
+from blog.caching import bump
+from blog.location_stats import update_stats
+from blog.metrics import timed
+from blog.models import Location, LocationReview, Tag
+from blog.search import update_search_vectors
+from blog.unread import announce
+
+
+@lru_cache(maxsize=None)
+def get_analyzer(path):
+    """
+    Load and instantiate an analysis backend once per process.
+
+    :param path: Dotted path to an Analyzer subclass
+    :return: Analyzer instance
+    """
+    return import_string(path)()
+
+
+def analyse_post(post, use_fallback=True):
+    """
+    Run Natural Language analysis on a post and store the results.
+
+    Documents that were analysed before reuse the cached result instead of
+    calling the API. If the configured backend is unreachable and
+    `use_fallback` is set, the fallback backend's result is applied so the
+    post still gets reviews and tags.
+
+    :param post: Instance of Post to be analysed
+    :param use_fallback: Fall back when the backend is unreachable instead
+        of raising, for the last attempt of a job
+    """
+    text = build_text(post)
+    result = cached_analysis(text)
+    if result is None:
+        analyzer = get_analyzer(settings.NL_ANALYZER)
+        fallback = getattr(settings, 'NL_ANALYZER_FALLBACK', None) \
+            if use_fallback else None
+        try:
+            with timed('nl_time'):
+                result = analyzer.analyse(text)
+        except analyzer.unavailable_errors:
+            if not fallback:
+                raise
+            with timed('nl_time'):
+                result = get_analyzer(fallback).analyse(text)
+        else:
+            if analyzer.cacheable:
+                store_analysis(text, result)
+    apply_analysis(post, result)
+
+
+def warm_analysis(post):
+    """
+    Analyse a post into the result cache without storing its reviews and
+    tags.
+
+    :param post: Instance of Post
+    :return: True if a result was added to the cache
+    """
+    text = build_text(post)
+    if is_cached(text):
+        return False
+    analyzer = get_analyzer(settings.NL_ANALYZER)
+    if not analyzer.cacheable:
+        return False
+    store_analysis(text, analyzer.analyse(text))
+    return True
+
+
+def cached_analysis(text):
+    """
+    Return the cached analysis result for a document, if there is one.
+
+    :param text: Document text built from a post's title and content
+    :return: AnalysisResult or None
+    """
+    cached = get_cached_analysis(text)
+    if cached is None:
+        return None
+    locations, categories = cached
+    return AnalysisResult(
+        [LocationSentiment(*location) for location in locations], categories)
+
+
+def apply_analysis(post, result):
+    """
+    Store the locations reviewed in a post and tag it with its categories.
+
+    Repeated mentions of a location are collapsed, and all rows are written
+    in bulk inside one transaction. Bulk writes send no signals, so the
+    stats of the reviewed locations are updated, and the reviews of a
+    published post announced to the locations' followers, here.
+
+    :param post: Instance of Post that was analysed
+    :param result: AnalysisResult for the post
+    """
+    reviews = {name: (sentiment, magnitude)
+               for name, sentiment, magnitude in result.locations}
+    categories = list(dict.fromkeys(result.categories))
+    with transaction.atomic():
+        locations = resolve_names(Location, reviews)
+        existing = {review.location_id: review for review in
+                    LocationReview.objects.filter(
+                        post=post, location__in=locations.values())}
+        created = list()
+        updated = list()
+        replaced = list()
+        for name, (sentiment, magnitude) in reviews.items():
+            location = locations[name]
+            review = existing.get(location.id)
+            if review is None:
+                created.append(LocationReview(
+                    post=post, location=location, sentiment=sentiment,
+                    magnitude=magnitude))
+            elif (review.sentiment, review.magnitude) != (sentiment,
+                                                          magnitude):
+                replaced.append((location.id, review.sentiment,
+                                 review.magnitude))
+                review.sentiment = sentiment
+                review.magnitude = magnitude
+                updated.append(review)
+        LocationReview.objects.bulk_create(created)
+        LocationReview.objects.bulk_update(updated,
+                                           ['sentiment', 'magnitude'])
+        if post.is_published:
+            update_stats(
+                added=[(review.location_id, review.sentiment,
+                        review.magnitude) for review in created + updated],
+                removed=replaced, reviewed_at=post.created_at)
+            announce(post)
+        post.tags.set(resolve_names(Tag, categories).values())
+    # bulk writes send no signals, so the cached pages are dropped here
+    bump(f'post:{post.pk}', *[f'location:{location.pk}'
+                              for location in locations.values()])
+
+
+def resolve_names(model, names):
+    """
+    Fetch the rows of a model with a unique `name`, creating missing ones.
+
+    :param model: Location or Tag
+    :param names: Iterable of names
+    :return: Dictionary mapping each name to its instance
+    """
+    names = list(names)
+    if not names:
+        return dict()
+    model.objects.bulk_create([model(name=name) for name in names],
+                              ignore_conflicts=True)
+    instances = {instance.name: instance
+                 for instance in model.objects.filter(name__in=names)}
+    # bulk_create skips post_save, so new rows get their vector here
+    update_search_vectors(model, [instance.pk for instance in
+                                  instances.values()], missing_only=True)
+    return instances
+
+
+def build_text(post):
+    return f"<p>{post.title}</p>{post.content}"
@@ -0,0 +1,102 @@
+import hashlib
+import random
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from blog.models import AnalysisCacheEntry
+
+
+def document_key(text):
+    """
+    Hash a post document after normalising case and whitespace.
+
+    :param text: Document text built from a post's title and content
+    :return: Hex digest identifying the document
+    """
+    normalised = re.sub(r'\s+', ' ', text).strip().casefold()
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+def get_cached_analysis(text):
+    """
+    Look up a stored analysis result for a document.
+
+    :param text: Document text built from a post's title and content
+    :return: Tuple of (locations, categories) as stored, or None if the
+        document has not been analysed
+    """
+    entry = AnalysisCacheEntry.objects.filter(key=document_key(text)).first()
+    if entry is None:
+        return None
+    AnalysisCacheEntry.objects.filter(pk=entry.pk).update(
+        hits=F('hits') + 1, last_used_at=now())
+    return entry.locations, entry.categories
+
+
+def is_cached(text):
+    """
+    Check whether a document has a stored result, without counting a hit.
+
+    :param text: Document text built from a post's title and content
+    :return: True if the document has been analysed
+    """
+    return AnalysisCacheEntry.objects.filter(key=document_key(text)).exists()
+
+
+def store_analysis(text, result):
+    """
+    Store the analysis result for a document.
+
+    Old entries are evicted after a random ANALYSIS_CACHE_EVICT_PROBABILITY
+    share of the writes, so the table is not counted on every one; run
+    'manage.py analysis_cache trim' to evict on a schedule instead.
+
+    :param text: Document text built from a post's title and content
+    :param result: AnalysisResult for the document
+    """
+    key = document_key(text)
+    values = {'locations': [list(location) for location in result.locations],
+              'categories': list(result.categories), 'last_used_at': now()}
+    try:
+        with transaction.atomic():
+            AnalysisCacheEntry.objects.update_or_create(key=key,
+                                                        defaults=values)
+    except IntegrityError:
+        AnalysisCacheEntry.objects.filter(key=key).update(**values)
+    if random.random() < getattr(settings,
+                                 'ANALYSIS_CACHE_EVICT_PROBABILITY', 0.01):
+        evict()
+
+
+def evict(max_entries=None):
+    """
+    Delete the least recently used entries beyond the cache size limit.
+
+    :param max_entries: Number of entries to keep, defaults to
+        ANALYSIS_CACHE_MAX_ENTRIES
+    :return: Number of entries deleted
+    """
+    if max_entries is None:
+        max_entries = getattr(settings, 'ANALYSIS_CACHE_MAX_ENTRIES', 10000)
+    excess = AnalysisCacheEntry.objects.count() - max_entries
+    if excess <= 0:
+        return 0
+    stale = AnalysisCacheEntry.objects.order_by(
+        'last_used_at').values_list('pk', flat=True)[:excess]
+    deleted, _ = AnalysisCacheEntry.objects.filter(
+        pk__in=list(stale)).delete()
+    return deleted
+
+
+def purge():
+    """
+    Delete every cached analysis result.
+
+    :return: Number of entries deleted
+    """
+    deleted, _ = AnalysisCacheEntry.objects.all().delete()
+    return deleted
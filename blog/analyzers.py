@@ -0,0 +1,259 @@
+import html
+import os
+import re
+import threading
+from collections import namedtuple, Counter
+
+from google.api_core.exceptions import DeadlineExceeded, InvalidArgument, \
+    ServiceUnavailable
+from google.auth.exceptions import TransportError
+from google.cloud import language_v1beta2 as language
+from google.cloud.language_v1beta2 import Entity, EntityMention, Document
+
+AnalysisResult = namedtuple('AnalysisResult', ['locations', 'categories'])
+LocationSentiment = namedtuple('LocationSentiment',
+                               ['name', 'sentiment', 'magnitude'])
+
+
+class Analyzer:
+    """
+    Base class for Natural Language analysis backends.
+
+    Subclasses turn a post document into an AnalysisResult. Errors listed in
+    `unavailable_errors` mean the backend could not be reached, which lets
+    a fallback backend take over.
+    """
+    unavailable_errors = ()
+    cacheable = True
+
+    def analyse(self, text):
+        """
+        Analyse a post document.
+
+        :param text: HTML document built from a post's title and content
+        :return: AnalysisResult
+        """
+        raise NotImplementedError
+
+
+class GoogleAnalyzer(Analyzer):
+    """
+    Analyse documents with the Google Cloud Natural Language API.
+    """
+    # only outages; request, permission and quota errors must surface
+    unavailable_errors = (ServiceUnavailable, DeadlineExceeded,
+                          TransportError)
+
+    def __init__(self):
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+
+    def get_client(self):
+        """
+        Return the process-wide LanguageServiceClient, creating it on first
+        use.
+
+        gRPC channels must not be shared across a fork, so a worker process
+        forked from a parent that already built a client gets its own.
+
+        :return: LanguageServiceClient instance
+        """
+        pid = os.getpid()
+        if self._client is None or self._client_pid != pid:
+            with self._client_lock:
+                if self._client is None or self._client_pid != pid:
+                    self._client = language.LanguageServiceClient()
+                    self._client_pid = pid
+        return self._client
+
+    def analyse(self, text):
+        """
+        Fetch entity sentiment and categories in one annotate_text request.
+
+        Documents too short to classify are retried for entity sentiment
+        only.
+
+        :param text: HTML document built from a post's title and content
+        :return: AnalysisResult
+        """
+        document = Document(content=text, type=Document.Type.HTML)
+        features = language.AnnotateTextRequest.Features(
+            extract_entity_sentiment=True, classify_text=True)
+        try:
+            response = self.get_client().annotate_text(document=document,
+                                                       features=features)
+        except InvalidArgument:
+            features.classify_text = False
+            response = self.get_client().annotate_text(document=document,
+                                                       features=features)
+        return self.parse_annotation(response)
+
+    @staticmethod
+    def parse_annotation(response):
+        """
+        Extract proper-noun locations and category names from a response.
+
+        :param response: AnnotateTextResponse from the Natural Language API
+        :return: AnalysisResult
+        """
+        locations = list()
+        for entity in response.entities:
+            if Entity.Type(entity.type).name == 'LOCATION':
+                for mention in entity.mentions:
+                    if EntityMention.Type(mention.type).name == 'PROPER':
+                        locations.append(LocationSentiment(
+                            entity.name.lower(), entity.sentiment.score,
+                            entity.sentiment.magnitude))
+        categories = [category.name.split('/')[-1]
+                      for category in response.categories]
+        return AnalysisResult(locations, categories)
+
+
+class LocalAnalyzer(Analyzer):
+    """
+    Analyse documents offline with deterministic heuristics.
+
+    Locations are capitalised phrases following a place preposition such as
+    "in Lagos" or "to New York". A location's sentiment is the average
+    polarity of the sentiment words in the sentences mentioning it, and
+    categories come from keyword counts. Results are rough but stable, which
+    is what load tests and degraded operation need.
+    """
+    cacheable = False
+
+    PREPOSITIONS = {'in', 'to', 'at', 'from', 'visit', 'visited', 'visiting',
+                    'near', 'around', 'across', 'through', 'toured',
+                    'explored', 'reached', 'left'}
+    CONNECTORS = {'of', 'de', 'del', 'da', 'la', 'le', 'on', 'upon'}
+    PRONOUNS = {'I', 'We', 'You', 'He', 'She', 'They', 'It', 'My', 'Our',
+                'The', 'A', 'An', 'This', 'That'}
+    POSITIVE = {'amazing', 'awesome', 'beautiful', 'best', 'breathtaking',
+                'calm', 'charming', 'clean', 'cozy', 'delicious',
+                'enjoy', 'enjoyed', 'excellent', 'fantastic', 'friendly',
+                'fun', 'good', 'gorgeous', 'great', 'happy', 'incredible',
+                'love', 'loved', 'lovely', 'nice', 'peaceful', 'perfect',
+                'pleasant', 'recommend', 'relaxing', 'stunning', 'wonderful'}
+    NEGATIVE = {'avoid', 'awful', 'bad', 'boring', 'crowded', 'dangerous',
+                'dirty', 'disappointed', 'disappointing', 'expensive',
+                'hate', 'hated', 'horrible', 'noisy', 'overpriced', 'poor',
+                'rude', 'sad', 'scary', 'terrible', 'ugly', 'unsafe',
+                'worst'}
+    NEGATIONS = {'not', 'never', 'no', "n't", 'hardly'}
+    CATEGORIES = {
+        'Beaches & Islands': {'beach', 'beaches', 'island', 'islands',
+                              'coast', 'sea', 'ocean', 'sand', 'surf'},
+        'Mountain & Ski Resorts': {'mountain', 'mountains', 'ski', 'hike',
+                                   'hiking', 'trail', 'peak', 'summit'},
+        'Restaurants': {'restaurant', 'restaurants', 'food', 'cuisine',
+                        'dish', 'dishes', 'eat', 'ate', 'dinner', 'lunch'},
+        'Hotels & Accommodations': {'hotel', 'hotels', 'hostel', 'resort',
+                                    'room', 'booked', 'airbnb'},
+        'Air Travel': {'flight', 'flights', 'airport', 'airline', 'plane',
+                       'flew'},
+        'Museums & Galleries': {'museum', 'museums', 'gallery', 'galleries',
+                                'exhibition', 'art'},
+        'Parks & Gardens': {'park', 'parks', 'garden', 'gardens', 'zoo',
+                            'wildlife', 'safari'},
+        'Nightlife': {'bar', 'bars', 'club', 'clubs', 'party', 'nightlife'},
+    }
+    CATEGORY_THRESHOLD = 2
+    MAX_CATEGORIES = 3
+
+    def analyse(self, text):
+        """
+        Find location phrases and score them against a small lexicon.
+
+        :param text: HTML document built from a post's title and content
+        :return: AnalysisResult
+        """
+        plain = re.sub(r'</?(p|br|div|li|h[1-6])\b[^>]*>', '\n', text,
+                       flags=re.IGNORECASE)
+        plain = html.unescape(re.sub(r'<[^>]+>', ' ', plain))
+        sentences = [sentence for sentence in re.split(r'[.!?\n]+', plain)
+                     if sentence.strip()]
+        scores = dict()
+        for sentence in sentences:
+            words = re.findall(r"[\w'&-]+", sentence)
+            polarity = self.polarity(words)
+            for name in self.find_locations(words):
+                scores.setdefault(name.lower(), list()).append(polarity)
+        locations = list()
+        for name, polarities in scores.items():
+            hits = [score for score, magnitude in polarities if magnitude]
+            sentiment = sum(hits) / len(hits) if hits else 0.0
+            magnitude = sum(magnitude for score, magnitude in polarities)
+            locations.append(LocationSentiment(name, round(sentiment, 3),
+                                               round(magnitude, 3)))
+        return AnalysisResult(locations, self.classify(plain))
+
+    def find_locations(self, words):
+        """
+        Yield capitalised phrases that directly follow a place preposition.
+
+        :param words: Words of one sentence
+        :return: Generator of location names
+        """
+        index = 0
+        while index < len(words) - 1:
+            if words[index].lower() in self.PREPOSITIONS and \
+                    self.is_name(words[index + 1]):
+                end = index + 1
+                while end + 1 < len(words) and (
+                        self.is_name(words[end + 1]) or (
+                        words[end + 1] in self.CONNECTORS and
+                        end + 2 < len(words) and
+                        self.is_name(words[end + 2]))):
+                    end += 1
+                yield ' '.join(words[index + 1:end + 1])
+                index = end
+            index += 1
+
+    def is_name(self, word):
+        """
+        Check whether a word can be part of a proper noun.
+
+        :param word: Word to check
+        :return: True if the word is capitalised and not a pronoun
+        """
+        return word[:1].isupper() and word not in self.PRONOUNS
+
+    def polarity(self, words):
+        """
+        Score the sentiment words of a sentence.
+
+        :param words: Words of one sentence
+        :return: Tuple of (score between -1 and 1, magnitude)
+        """
+        total = 0
+        count = 0
+        negate = False
+        for word in words:
+            word = word.lower()
+            if word in self.NEGATIONS or word.endswith("n't"):
+                negate = True
+                continue
+            value = 1 if word in self.POSITIVE else \
+                -1 if word in self.NEGATIVE else 0
+            if value:
+                total += -value if negate else value
+                count += 1
+                negate = False
+        if not count:
+            return 0.0, 0.0
+        return total / count, count * 0.5
+
+    def classify(self, text):
+        """
+        Pick the categories whose keywords appear most often in a document.
+
+        :param text: Plain text of the document
+        :return: List of category names
+        """
+        words = Counter(re.findall(r'\w+', text.lower()))
+        counts = Counter({
+            category: sum(words[keyword] for keyword in keywords)
+            for category, keywords in self.CATEGORIES.items()})
+        return [category for category, count in
+                counts.most_common(self.MAX_CATEGORIES)
+                if count >= self.CATEGORY_THRESHOLD]
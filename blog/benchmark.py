@@ -0,0 +1,304 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from blog.models import Profile, Post, Location, LocationReview, Tag, \
+    PostLike, Comment
+from blog.text import summarize
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'benchmark'
+WORDS = ('trip', 'beach', 'museum', 'food', 'hike', 'market', 'sunset',
+         'train', 'hotel', 'street', 'coffee', 'old', 'town', 'river',
+         'mountain', 'view', 'walk', 'night', 'local', 'amazing', 'quiet')
+
+
+def power_law_weights(count, exponent):
+    """
+    Zipf-like weights, so that a few items get most of the activity.
+
+    :param count: Number of items
+    :param exponent: Skew, higher values concentrate activity more
+    :return: List of weights, the first item being the heaviest
+    """
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def spread_timestamps(model, instances, rng, days):
+    """
+    Move auto_now_add timestamps into the past so time windows and
+    pagination see a realistic history.
+
+    :param model: Model of the instances
+    :param instances: Saved instances
+    :param rng: Random generator
+    :param days: Age of the oldest timestamp
+    """
+    current = now()
+    for instance in instances:
+        instance.created_at = current - timedelta(
+            seconds=rng.randrange(days * 86400))
+    model.objects.bulk_update(instances, ['created_at'], batch_size=500)
+
+
+@transaction.atomic
+def seed(users=200, follows=3000, posts=1000, likes=5000, comments=2000,
+         locations=100, tags=30, skew=1.1, days=30, random_seed=1):
+    """
+    Create benchmark data with power-law skew: a few profiles have most of
+    the followers and a few posts most of the likes and comments.
+
+    Rows are inserted in bulk, so signals do not run; rebuild the feeds,
+    profile counts, hot scores, location stats, trending locations, search
+    vectors and recommendations afterwards.
+
+    :return: Dictionary mapping model name to number of rows created
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    start = User.objects.filter(
+        username__startswith=USERNAME_PREFIX).count()
+    created_users = User.objects.bulk_create([
+        User(username=f'{USERNAME_PREFIX}{start + index}', password=password,
+             first_name=rng.choice(WORDS).title(),
+             last_name=rng.choice(WORDS).title())
+        for index in range(users)])
+    created_users = User.objects.filter(
+        username__in=[user.username for user in created_users])
+    Profile.objects.bulk_create([
+        Profile(user=user, about='Benchmark profile') for user in
+        created_users])
+    profiles = list(Profile.objects.filter(
+        user__in=created_users).order_by('id'))
+    place_names = {f'{rng.choice(WORDS).title()} {index}'
+                   for index in range(locations)}
+    Location.objects.bulk_create([Location(name=name) for name in place_names],
+                                 ignore_conflicts=True)
+    places = list(Location.objects.filter(name__in=place_names))
+    tag_names = {f'{rng.choice(WORDS)} {index}' for index in range(tags)}
+    Tag.objects.bulk_create([Tag(name=name) for name in tag_names],
+                            ignore_conflicts=True)
+    categories = list(Tag.objects.filter(name__in=tag_names))
+
+    profile_weights = power_law_weights(len(profiles), skew)
+    Following = Profile.users_following.through
+    edges = {(rng.choice(profiles).id, followed.id) for followed in
+             rng.choices(profiles, profile_weights, k=follows)}
+    Following.objects.bulk_create([
+        Following(from_profile_id=follower, to_profile_id=followed)
+        for follower, followed in edges if follower != followed],
+        ignore_conflicts=True)
+
+    new_posts = list()
+    for author in rng.choices(profiles, profile_weights, k=posts):
+        place = rng.choice(places)
+        content = ''.join(
+            f'<p>{" ".join(rng.choices(WORDS, k=rng.randint(20, 60)))} '
+            f'in {place.name}.</p>' for _ in range(rng.randint(1, 6)))
+        excerpt, word_count, reading_time = summarize(content)
+        new_posts.append(Post(
+            title=' '.join(rng.choices(WORDS, k=4)).title(), content=content,
+            author=author, is_published=rng.random() < 0.9, excerpt=excerpt,
+            word_count=word_count, reading_time=reading_time))
+    Post.objects.bulk_create(new_posts)
+    new_posts = list(Post.objects.filter(author__in=profiles).order_by('id'))
+    spread_timestamps(Post, new_posts, rng, days)
+    LocationReview.objects.bulk_create([
+        LocationReview(post=post, location=location,
+                       sentiment=round(rng.uniform(-1, 1), 2),
+                       magnitude=round(rng.uniform(0, 3), 2))
+        for post in new_posts
+        for location in set(rng.sample(places, rng.randint(1, 3)))])
+    PostTags = Post.tags.through
+    PostTags.objects.bulk_create([
+        PostTags(post_id=post.id, tag_id=tag.id) for post in new_posts
+        for tag in set(rng.sample(categories, rng.randint(1, 3)))],
+        ignore_conflicts=True)
+
+    post_weights = power_law_weights(len(new_posts), skew)
+    hot_posts = new_posts[:]
+    rng.shuffle(hot_posts)
+    PostLike.objects.bulk_create([
+        PostLike(post=post, user=rng.choice(profiles))
+        for post in rng.choices(hot_posts, post_weights, k=likes)],
+        ignore_conflicts=True)
+    spread_timestamps(PostLike, list(PostLike.objects.filter(
+        post__in=new_posts)), rng, days)
+    Comment.objects.bulk_create([
+        Comment(post=post, user=rng.choice(profiles),
+                message=' '.join(rng.choices(WORDS, k=8)))
+        for post in rng.choices(hot_posts, post_weights,
+                                k=comments - comments // 2)])
+    parents = list(Comment.objects.filter(post__in=new_posts, parent=None))
+    Comment.objects.bulk_create([
+        Comment(post_id=parent.post_id, user=rng.choice(profiles),
+                message=' '.join(rng.choices(WORDS, k=8)), parent=parent)
+        for parent in rng.choices(parents, k=comments // 2)])
+    spread_timestamps(Comment, list(Comment.objects.filter(
+        post__in=new_posts)), rng, days)
+
+    counted = list(Post.objects.filter(author__in=profiles).annotate(
+        likes=Count('postlike', distinct=True),
+        replies=Count('comment', distinct=True)))
+    for post in counted:
+        post.total_likes = post.likes
+        post.total_comments = post.replies
+    Post.objects.bulk_update(counted, ['total_likes', 'total_comments'],
+                             batch_size=500)
+    return {
+        'profiles': len(profiles),
+        'follows': Following.objects.filter(
+            from_profile__in=profiles).count(),
+        'posts': len(new_posts),
+        'likes': PostLike.objects.filter(post__in=new_posts).count(),
+        'comments': Comment.objects.filter(post__in=new_posts).count(),
+        'locations': len(places),
+        'tags': len(categories),
+    }
+
+
+@transaction.atomic
+def clear():
+    """
+    Delete the benchmark users and everything they created.
+
+    :return: Number of benchmark users deleted
+    """
+    profiles = Profile.objects.filter(
+        user__username__startswith=USERNAME_PREFIX)
+    posts = Post.objects.filter(author__in=profiles)
+    PostLike.objects.filter(user__in=profiles).delete()
+    PostLike.objects.filter(post__in=posts).delete()
+    comments = Comment.objects.filter(user__in=profiles) | \
+        Comment.objects.filter(post__in=posts)
+    Comment.objects.filter(parent__in=comments).delete()
+    Comment.objects.filter(pk__in=comments.values('pk')).delete()
+    deleted, _ = User.objects.filter(
+        username__startswith=USERNAME_PREFIX).delete()
+    return deleted
+
+
+def percentile(values, fraction):
+    """
+    Value below which a fraction of the sorted values fall.
+
+    :param values: Measurements
+    :param fraction: Between 0 and 1
+    :return: Interpolated percentile
+    """
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower)
+
+
+def scenarios():
+    """
+    Requests the benchmark drives, against the hottest post and the most
+    followed profile of the benchmark data.
+
+    :return: Tuple of (User the logged-in requests are sent as, list of
+        (name, method, URL, data, logged in) tuples)
+    """
+    profiles = Profile.objects.filter(
+        user__username__startswith=USERNAME_PREFIX)
+    viewer = profiles.order_by('-followers_count', 'id').select_related(
+        'user').first()
+    post = Post.objects.filter(author__in=profiles, is_published=True) \
+        .order_by('-total_likes', 'id').first()
+    if viewer is None or post is None:
+        return None, []
+    username = viewer.user.username
+    return viewer.user, [
+        ('index_anonymous', 'get', reverse('blog:home'), None, False),
+        ('index', 'get', reverse('blog:home'), None, True),
+        ('view_post', 'get', reverse('blog:view_post', args=[post.id]),
+         None, True),
+        ('view_user', 'get', reverse('blog:view_user', args=[username]),
+         None, True),
+        ('explore', 'get', reverse('blog:explore'), None, True),
+        ('like_post', 'get', reverse('blog:like_post', args=[post.id]),
+         None, True),
+        ('comment_post', 'post', reverse('blog:comment_post',
+                                         args=[post.id]),
+         {'comment': 'Benchmark comment'}, True),
+    ]
+
+
+def run(iterations=20, warmup=3):
+    """
+    Time every scenario with the test client.
+
+    Each request runs in a transaction that is rolled back, so write
+    endpoints leave the data unchanged between iterations.
+
+    :param iterations: Measured requests per scenario
+    :param warmup: Unmeasured requests per scenario sent first
+    :return: Dictionary mapping scenario name to its statistics
+    """
+    user, requests = scenarios()
+    if user is None:
+        return dict()
+    anonymous, logged_in = Client(), Client()
+    logged_in.force_login(user)
+    results = dict()
+    for name, method, url, data, login in requests:
+        client = logged_in if login else anonymous
+        timings, queries, statuses = list(), list(), set()
+        for iteration in range(warmup + iterations):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(url, data)
+                    elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(context.captured_queries))
+                statuses.add(response.status_code)
+        results[name] = {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p90_ms': round(percentile(timings, 0.9), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': max(queries),
+            'mean_queries': round(statistics.mean(queries), 1),
+            'statuses': sorted(statuses),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Find the scenarios that got slower or run more queries than in a
+    baseline run.
+
+    :param results: Statistics returned by run()
+    :param baseline: Statistics of an earlier run
+    :param tolerance: Accepted relative p90 latency increase
+    :return: List of regression descriptions
+    """
+    regressions = list()
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(f'{name}: {current["queries"]} queries, '
+                               f'baseline {previous["queries"]}')
+        if current['p90_ms'] > previous['p90_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p90 {current["p90_ms"]}ms, '
+                               f'baseline {previous["p90_ms"]}ms')
+    return regressions
@@ -0,0 +1,97 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def version_key(namespace):
+    """
+    Cache key holding the version of a namespace.
+
+    :param namespace: Namespace name
+    :return: Cache key
+    """
+    return f'version:{namespace}'
+
+
+def get_versions(namespaces):
+    """
+    Current version of each cache namespace.
+
+    A namespace without a version, never bumped or evicted, gets a fresh
+    one, so keys built from an evicted version are never read again.
+
+    :param namespaces: List of namespace names
+    :return: List of versions in the same order
+    """
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*namespaces):
+    """
+    Invalidate every page and fragment cached under some namespaces.
+
+    :param namespaces: Namespace names
+    """
+    if namespaces:
+        version = time.time_ns()
+        cache.set_many({version_key(namespace): version
+                        for namespace in namespaces}, None)
+
+
+def caches_pages():
+    """
+    Whole pages are only cached in a cache every process shares, where
+    bumps from workers and commands reach them, or in DEBUG.
+
+    :return: True if anonymous pages may be cached
+    """
+    return settings.DEBUG or not isinstance(caches['default'], LocMemCache)
+
+
+def cache_anonymous_page(namespaces):
+    """
+    Cache the whole page a view renders for anonymous users.
+
+    The cache key combines the full path with the versions of the page's
+    namespaces, so bumping one of them drops the page. Responses that are
+    not 200 or that set cookies are not cached, and nothing is cached in a
+    per-process cache outside DEBUG.
+
+    Usage: @cache_anonymous_page(lambda pk: [f'post:{pk}'])
+
+    :param namespaces: Function of the view's keyword arguments returning
+        the namespaces the page depends on
+    :return: View decorator
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated \
+                    or not caches_pages():
+                return view(request, *args, **kwargs)
+            names = namespaces(**kwargs)
+            versions = '.'.join(str(version)
+                                for version in get_versions(names))
+            key = f'page:{request.get_full_path()}:{versions}'
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies \
+                        and not response.streaming:
+                    cache.set(key, response,
+                              getattr(settings, 'PAGE_CACHE_TIMEOUT', 300))
+            return response
+
+        return wrapper
+
+    return decorator
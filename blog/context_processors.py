@@ -0,0 +1,58 @@
+from django.utils.functional import cached_property, SimpleLazyObject
+
+from blog.models import Profile, PostLike
+
+
+class Viewer:
+    """
+    What the logged-in user follows and likes, loaded once per request.
+
+    Each set is fetched on first use with a single query on the relation's
+    table, so templates can check membership without loading whole
+    relations for every item they render.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def followed_profile_ids(self):
+        """
+        :return: Set of ids of the profiles the viewer follows
+        """
+        if not self.user.is_authenticated:
+            return set()
+        return set(Profile.users_following.through.objects.filter(
+            from_profile__user_id=self.user.id).values_list(
+            'to_profile_id', flat=True))
+
+    @cached_property
+    def followed_location_ids(self):
+        """
+        :return: Set of ids of the locations the viewer follows
+        """
+        if not self.user.is_authenticated:
+            return set()
+        return set(Profile.locations_following.through.objects.filter(
+            profile__user_id=self.user.id).values_list(
+            'location_id', flat=True))
+
+    @cached_property
+    def liked_post_ids(self):
+        """
+        :return: Set of ids of the posts the viewer liked
+        """
+        if not self.user.is_authenticated:
+            return set()
+        return set(PostLike.objects.filter(
+            user__user_id=self.user.id).values_list('post_id', flat=True))
+
+
+def viewer(request):
+    """
+    Add the Viewer for the current request to the template context.
+
+    :param request: Current HttpRequest
+    :return: Context dictionary with `viewer`
+    """
+    return {'viewer': SimpleLazyObject(lambda: Viewer(request.user))}
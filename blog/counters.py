@@ -0,0 +1,186 @@
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from blog.caching import bump
+from blog.models import Post, PostCounterShard, Profile, LocationReview
+from blog.ranking import hot_score, hot_score_change
+
+COUNTER_FIELDS = ('total_likes', 'total_comments', 'total_shares')
+PROFILE_COUNTER_FIELDS = ('followers_count', 'following_count',
+                          'published_posts_count')
+Following = Profile.users_following.through
+PostTag = Post.tags.through
+
+
+def counter_namespaces(post_ids):
+    """
+    Cache namespaces of the pages showing the counters of some posts: the
+    posts themselves and the locations and tags listing them.
+
+    :param post_ids: Primary keys of the posts
+    :return: List of namespace names
+    """
+    post_ids = list(post_ids)
+    location_ids = LocationReview.objects.filter(
+        post_id__in=post_ids).values_list('location_id', flat=True)
+    tag_ids = PostTag.objects.filter(post_id__in=post_ids).values_list(
+        'tag_id', flat=True)
+    return [*[f'post:{pk}' for pk in post_ids],
+            *[f'location:{pk}' for pk in set(location_ids)],
+            *[f'tag:{pk}' for pk in set(tag_ids)]]
+
+
+def increment(post_id, field, delta=1):
+    """
+    Atomically add to one of a post's engagement counters.
+
+    In the default 'direct' mode the post row is updated in place. In
+    'sharded' mode the delta goes to one of POST_COUNTER_SHARDS rows picked
+    at random, so concurrent updates to a hot post rarely wait on the same
+    row lock; flush_counters folds the shards back into the post. The
+    post's hot score and the cached pages listing it follow its counters.
+
+    :param post_id: Primary key of the post
+    :param field: One of COUNTER_FIELDS
+    :param delta: Amount to add, negative to subtract
+    """
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f'{field} is not a post counter')
+    if getattr(settings, 'POST_COUNTER_MODE', 'direct') != 'sharded':
+        Post.objects.filter(pk=post_id).update(
+            hot_score=hot_score_change(field, delta),
+            **{field: F(field) + delta})
+        bump(*counter_namespaces([post_id]))
+        return
+    shard = random.randrange(getattr(settings, 'POST_COUNTER_SHARDS', 8))
+    shards = PostCounterShard.objects.filter(post_id=post_id, shard=shard)
+    if not shards.update(**{field: F(field) + delta}):
+        PostCounterShard.objects.bulk_create(
+            [PostCounterShard(post_id=post_id, shard=shard)],
+            ignore_conflicts=True)
+        shards.update(**{field: F(field) + delta})
+
+
+def flush_counters(batch_size=500):
+    """
+    Move the deltas accumulated in counter shards onto their posts.
+
+    Shards are flushed in batches, each in its own short transaction. The
+    shard rows of a batch stay locked until it commits, so they are reset
+    to zero and increments that land meanwhile wait and count towards the
+    next flush. Each batch runs a fixed number of queries whatever its size.
+
+    :param batch_size: Number of shards flushed per transaction
+    :return: Number of posts updated
+    """
+    flushed = set()
+    while True:
+        with transaction.atomic():
+            shards = list(PostCounterShard.objects.select_for_update(
+                skip_locked=True).exclude(
+                total_likes=0, total_comments=0, total_shares=0).order_by(
+                'pk')[:batch_size])
+            if not shards:
+                return len(flushed)
+            totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+            for shard in shards:
+                for field in COUNTER_FIELDS:
+                    totals[shard.post_id][field] += getattr(shard, field)
+            PostCounterShard.objects.filter(
+                pk__in=[shard.pk for shard in shards]).update(
+                **dict.fromkeys(COUNTER_FIELDS, 0))
+            posts = list(Post.objects.select_for_update().filter(
+                pk__in=list(totals)).only('created_at', *COUNTER_FIELDS))
+            for post in posts:
+                for field, delta in totals[post.pk].items():
+                    setattr(post, field, getattr(post, field) + delta)
+                post.hot_score = hot_score(post.total_likes,
+                                           post.total_comments,
+                                           post.total_shares,
+                                           post.created_at)
+            Post.objects.bulk_update(posts, [*COUNTER_FIELDS, 'hot_score'])
+        flushed.update(totals)
+        bump('ranking', *counter_namespaces(totals))
+        if len(shards) < batch_size:
+            return len(flushed)
+
+
+def adjust_profiles(field, deltas):
+    """
+    Atomically add to one of the stored counts of some profiles, with one
+    UPDATE per distinct amount.
+
+    :param field: One of PROFILE_COUNTER_FIELDS
+    :param deltas: Dictionary mapping profile id to amount to add
+    """
+    if field not in PROFILE_COUNTER_FIELDS:
+        raise ValueError(f'{field} is not a profile counter')
+    profile_ids = defaultdict(list)
+    for profile_id, delta in deltas.items():
+        if delta:
+            profile_ids[delta].append(profile_id)
+    for delta, ids in profile_ids.items():
+        Profile.objects.filter(pk__in=ids).update(**{field: F(field) + delta})
+
+
+def adjust_follows(pairs, sign):
+    """
+    Count follows that were created or removed on both of their profiles.
+
+    :param pairs: Iterable of (follower id, followed id)
+    :param sign: 1 for new follows, -1 for removed ones
+    """
+    following, followers = Counter(), Counter()
+    for follower_id, followed_id in pairs:
+        following[follower_id] += sign
+        followers[followed_id] += sign
+    adjust_profiles('following_count', following)
+    adjust_profiles('followers_count', followers)
+
+
+def counted_profiles():
+    """
+    Profiles annotated with the counts their stored counters should hold,
+    as `actual_followers`, `actual_following` and `actual_posts`.
+
+    :return: Profile queryset
+    """
+    def count(queryset, column):
+        return Coalesce(Subquery(
+            queryset.values(column).annotate(total=Count('pk')).values(
+                'total'), output_field=IntegerField()), 0)
+
+    return Profile.objects.annotate(
+        actual_followers=count(Following.objects.filter(
+            to_profile_id=OuterRef('pk')), 'to_profile_id'),
+        actual_following=count(Following.objects.filter(
+            from_profile_id=OuterRef('pk')), 'from_profile_id'),
+        actual_posts=count(Post.objects.filter(
+            author_id=OuterRef('pk'), is_published=True).order_by(),
+            'author_id'))
+
+
+def reconcile_profile_counts(batch_size=500):
+    """
+    Recount the followers, followed profiles and published posts of every
+    profile and repair the stored counts that drifted.
+
+    :param batch_size: Number of profiles updated per query
+    :return: Number of profiles repaired
+    """
+    drifted = list(counted_profiles().filter(
+        ~Q(followers_count=F('actual_followers')) |
+        ~Q(following_count=F('actual_following')) |
+        ~Q(published_posts_count=F('actual_posts'))).only('pk'))
+    for profile in drifted:
+        profile.followers_count = profile.actual_followers
+        profile.following_count = profile.actual_following
+        profile.published_posts_count = profile.actual_posts
+    Profile.objects.bulk_update(drifted, PROFILE_COUNTER_FIELDS,
+                                batch_size=batch_size)
+    return len(drifted)
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from blog.models import FeedItem, Profile, Post, PostLike, Comment
+
+Follow = Profile.users_following.through
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(created_at, pk):
+    """
+    Build a pagination cursor pointing just after an item.
+
+    :param created_at: Creation time of the last item on the page
+    :param pk: Primary key of the last item on the page
+    :return: Cursor string
+    """
+    timestamp = (created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{timestamp}.{pk}'
+
+
+def decode_cursor(cursor):
+    """
+    Parse a cursor built by encode_cursor.
+
+    :param cursor: Cursor string, possibly empty or malformed
+    :return: Tuple of (created_at, pk), or None
+    """
+    try:
+        timestamp, pk = cursor.split('.')
+        created_at = EPOCH + timedelta(microseconds=int(timestamp))
+        return created_at, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def get_feed(profile, cursor=None, limit=None):
+    """
+    Read a page of a profile's newsfeed, newest first.
+
+    :param profile: Profile whose newsfeed is read
+    :param cursor: Cursor returned with the previous page, if any
+    :param limit: Page size, defaults to FEED_PAGE_SIZE
+    :return: Tuple of (list of PostLike, Comment and Post instances,
+        cursor for the next page or None)
+    """
+    if limit is None:
+        limit = getattr(settings, 'FEED_PAGE_SIZE', 20)
+    items = FeedItem.objects.filter(owner=profile).select_related(
+        'post__author__user', 'like__user__user', 'comment__user__user')
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        items = items.filter(Q(created_at__lt=created_at) |
+                             Q(created_at=created_at, id__lt=pk))
+    items = list(items.order_by('-created_at', '-id')[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    activities = list()
+    for item in items:
+        if item.like is not None:
+            item.like.post = item.post
+        if item.comment is not None:
+            item.comment.post = item.post
+        activities.append(item.activity)
+    return activities, next_cursor
+
+
+def follower_ids(profile_id):
+    """
+    Fetch the ids of the profiles following a profile.
+
+    :param profile_id: Primary key of the followed profile
+    :return: List of follower profile ids
+    """
+    return list(Follow.objects.filter(to_profile_id=profile_id).values_list(
+        'from_profile_id', flat=True))
+
+
+def fan_out(actor_id, post_id, created_at, like=None, comment=None,
+            owner_ids=None):
+    """
+    Add an activity to the newsfeeds of the actor's followers.
+
+    :param actor_id: Primary key of the profile that acted
+    :param post_id: Primary key of the post the activity is about
+    :param created_at: Time of the activity
+    :param like: PostLike for like activities
+    :param comment: Comment for comment activities
+    :param owner_ids: Feeds to add the activity to, defaults to the actor's
+        followers
+    """
+    if owner_ids is None:
+        owner_ids = follower_ids(actor_id)
+    FeedItem.objects.bulk_create(
+        [FeedItem(owner_id=owner_id, actor_id=actor_id, post_id=post_id,
+                  like=like, comment=comment, created_at=created_at)
+         for owner_id in owner_ids], batch_size=500)
+
+
+def fan_out_post(post):
+    """
+    Add a newly published post to its author's followers' newsfeeds once.
+    Called when a post becomes published, so a post published again after
+    being withdrawn is not added twice.
+
+    :param post: Published Post instance
+    """
+    if FeedItem.objects.filter(post=post, like=None, comment=None).exists():
+        return
+    fan_out(post.author_id, post.id, post.created_at)
+
+
+def backfill(actor, owner_ids, limit=None):
+    """
+    Copy an actor's past activities into some newsfeeds.
+
+    :param actor: Profile whose activities are copied
+    :param owner_ids: Primary keys of the profiles whose feeds are filled
+    :param limit: Only copy this many of the most recent activities of each
+        kind, all of them if None
+    """
+    if not owner_ids:
+        return
+    posts = Post.objects.filter(author=actor, is_published=True).only(
+        'id', 'created_at')
+    likes = PostLike.objects.filter(user=actor).only(
+        'id', 'post_id', 'created_at')
+    comments = Comment.objects.filter(user=actor).only(
+        'id', 'post_id', 'created_at')
+    if limit is not None:
+        posts, likes, comments = posts[:limit], likes[:limit], comments[:limit]
+    activities = [(post.id, post, None, None) for post in posts]
+    activities += [(like.post_id, like, like, None) for like in likes]
+    activities += [(comment.post_id, comment, None, comment)
+                   for comment in comments]
+    FeedItem.objects.bulk_create(
+        [FeedItem(owner_id=owner_id, actor_id=actor.id, post_id=post_id,
+                  like=like, comment=comment,
+                  created_at=activity.created_at)
+         for post_id, activity, like, comment in activities
+         for owner_id in owner_ids], batch_size=500)
+
+
+def unfollow(owner_id, actor_ids):
+    """
+    Remove the activities of unfollowed profiles from a newsfeed.
+
+    :param owner_id: Primary key of the profile that unfollowed
+    :param actor_ids: Primary keys of the unfollowed profiles
+    """
+    FeedItem.objects.filter(owner_id=owner_id, actor_id__in=actor_ids).delete()
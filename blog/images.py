@@ -0,0 +1,140 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# name: (width, height, crop to fill the box)
+RENDITIONS = {
+    'avatar': (96, 96, True),
+    'card': (320, 320, True),
+    'hero': (1280, 1280, False),
+}
+
+FORMATS = {
+    'WEBP': ('webp', 'image/webp'),
+    'JPEG': ('jpg', 'image/jpeg'),
+}
+
+# formats uploads are re-encoded in, anything else is converted to PNG
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+# what Pillow raises for files it cannot decode
+DECODE_ERRORS = (OSError, ValueError, SyntaxError, EOFError,
+                 Image.DecompressionBombError)
+
+
+def strip_metadata(upload):
+    """
+    Re-encode an uploaded image without its metadata, such as the EXIF
+    camera details and GPS position. The EXIF orientation is applied to
+    the pixels first.
+
+    :param upload: Uploaded file
+    :return: ContentFile named like the upload, or None if the upload is
+        not an image
+    """
+    try:
+        image = Image.open(upload)
+        image.load()
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+    except DECODE_ERRORS:
+        return None
+    if image_format not in UPLOAD_FORMATS:
+        image_format = 'PNG'
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    if image_format == 'JPEG':
+        image.save(output, image_format, quality=95)
+    else:
+        image.save(output, image_format)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(output.getvalue(),
+                       name=f'{name}.{UPLOAD_FORMATS[image_format]}')
+
+
+def render(image, width, height, crop):
+    """
+    Resize an image into a box of at most width x height pixels.
+
+    The EXIF orientation is applied to the pixels, and the EXIF data is not
+    written to the result.
+
+    :param image: Opened PIL image
+    :param width: Width of the box
+    :param height: Height of the box
+    :param crop: Crop the image to fill the box instead of fitting it
+    :return: Tuple of (encoded bytes, file extension)
+    """
+    image_format = getattr(settings, 'IMAGE_RENDITION_FORMAT', 'WEBP')
+    extension, _ = FORMATS[image_format]
+    image = ImageOps.exif_transpose(image)
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail((width, height), Image.LANCZOS)
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, image_format, optimize=True,
+               quality=getattr(settings, 'IMAGE_RENDITION_QUALITY', 80))
+    return output.getvalue(), extension
+
+
+def generate_renditions(profile):
+    """
+    Store every rendition of a profile's image next to the original and
+    remember their paths in `image_renditions`.
+
+    Rendition names contain a digest of their content, so their URLs change
+    whenever the image does. Renditions of the previous image are deleted.
+    Storage errors are raised, so the job generating them is retried.
+
+    :param profile: Profile with an uploaded image
+    :return: Dictionary mapping rendition name to storage path, empty if
+        the image is missing or cannot be decoded
+    """
+    if not profile.image:
+        return dict()
+    storage = profile.image.storage
+    with profile.image.open('rb') as file:
+        try:
+            original = Image.open(file)
+            original.load()
+        except DECODE_ERRORS:
+            return dict()
+    renditions = dict()
+    for name, (width, height, crop) in RENDITIONS.items():
+        content, extension = render(original, width, height, crop)
+        digest = hashlib.sha1(content).hexdigest()[:12]
+        path = f'image/renditions/user_{profile.user_id}_{name}_{digest}' \
+               f'.{extension}'
+        if not storage.exists(path):
+            path = storage.save(path, ContentFile(content))
+        renditions[name] = path
+    for path in set(profile.image_renditions.values()) - set(
+            renditions.values()):
+        storage.delete(path)
+    profile.image_renditions = renditions
+    profile.save(update_fields=['image_renditions'])
+    return renditions
+
+
+def rendition_url(profile, name):
+    """
+    URL of a rendition of a profile's image, falling back to the original
+    image while the rendition does not exist.
+
+    :param profile: Profile instance
+    :param name: Rendition name, a key of RENDITIONS
+    :return: URL, or an empty string if the profile has no image
+    """
+    path = profile.image_renditions.get(name)
+    if path:
+        return profile.image.storage.url(path)
+    return profile.image.url if profile.image else ''
@@ -0,0 +1,232 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils.timezone import now
+
+from blog.analysis import analyse_post
+from blog.images import generate_renditions
+from blog.metrics import measured_job
+from blog.models import AnalysisJob, Post, Profile
+from blog.recommendations import update_recommendations
+
+
+def post_analysis_key(post):
+    """
+    Build the deduplication key for a post's analysis job.
+
+    :param post: Instance of Post
+    :return: Job key shared by every analysis request for the post
+    """
+    return f'post-analysis:{post.pk}'
+
+
+def image_renditions_key(profile):
+    """
+    Build the deduplication key for the job resizing a profile's image.
+
+    :param profile: Instance of Profile
+    :return: Job key shared by every rendition request for the profile
+    """
+    return f'image-renditions:{profile.pk}'
+
+
+def recommendations_key(profile_id):
+    """
+    Build the deduplication key for the job scoring a profile's
+    recommendations.
+
+    :param profile_id: Primary key of the profile
+    :return: Job key shared by every update of the profile's follows
+    """
+    return f'recommendations:{profile_id}'
+
+
+def enqueue(key, **fields):
+    """
+    Queue a background job for the worker.
+
+    Repeated calls with the same key collapse into a single job. A job that
+    is already running only gets a new revision, so no other worker claims
+    it meanwhile; the worker running it requeues it when it finishes, since
+    the revision it claimed is then stale.
+
+    :param key: Job key, the job kind and a primary key separated by ':'
+    :param fields: Other fields of a new job, such as its post
+    """
+    queued = {'status': AnalysisJob.PENDING, 'attempts': 0,
+              'run_after': now(), 'last_error': ''}
+    if not requeue(AnalysisJob.objects.filter(key=key), queued):
+        try:
+            with transaction.atomic():
+                AnalysisJob.objects.create(key=key, **fields, **queued)
+        except IntegrityError:
+            requeue(AnalysisJob.objects.filter(key=key), queued)
+
+
+def enqueue_post_analysis(post):
+    """
+    Queue Natural Language analysis for a post.
+
+    :param post: Instance of Post to be analysed
+    """
+    enqueue(post_analysis_key(post), post=post)
+
+
+def enqueue_image_renditions(profile):
+    """
+    Queue the generation of a profile's image renditions.
+
+    :param profile: Instance of Profile with an uploaded image
+    """
+    enqueue(image_renditions_key(profile))
+
+
+def requeue(jobs, fields):
+    """
+    Bump the revision of jobs, and reset the ones that are not running.
+
+    :param jobs: AnalysisJob queryset
+    :param fields: Values of a freshly queued job
+    :return: Number of jobs updated
+    """
+    running = Q(status=AnalysisJob.RUNNING)
+    return jobs.update(revision=F('revision') + 1, **{
+        field: Case(When(running, then=F(field)), default=Value(value),
+                    output_field=AnalysisJob._meta.get_field(field))
+        for field, value in fields.items()})
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` due jobs as running and return them.
+
+    Jobs left running past the lease by a worker that died are picked up
+    again.
+
+    :param limit: Maximum number of jobs to claim
+    :return: List of claimed AnalysisJob instances
+    """
+    current_time = now()
+    lease_expired = current_time - timedelta(
+        seconds=getattr(settings, 'ANALYSIS_JOB_LEASE', 600))
+    with transaction.atomic():
+        jobs = list(AnalysisJob.objects.select_for_update(
+            skip_locked=True).filter(
+            Q(status=AnalysisJob.PENDING, run_after__lte=current_time) |
+            Q(status=AnalysisJob.RUNNING, updated_at__lt=lease_expired)
+        ).order_by('run_after')[:limit])
+        AnalysisJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=AnalysisJob.RUNNING, updated_at=current_time)
+    return jobs
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff delay before the next attempt of a failed job.
+
+    :param attempts: Number of attempts made so far
+    :return: timedelta to wait before retrying
+    """
+    base = getattr(settings, 'ANALYSIS_JOB_BACKOFF', 30)
+    ceiling = getattr(settings, 'ANALYSIS_JOB_BACKOFF_MAX', 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), ceiling))
+
+
+def enqueue_recommendations(profile_ids):
+    """
+    Queue the update of some profiles' recommendations after their follows
+    changed.
+
+    :param profile_ids: Primary keys of the profiles
+    """
+    for profile_id in profile_ids:
+        enqueue(recommendations_key(profile_id))
+
+
+def run_post_analysis(post_id, last_attempt):
+    """
+    Analyse a post, falling back to NL_ANALYZER_FALLBACK on the last
+    attempt only.
+
+    :param post_id: Primary key of the post
+    :param last_attempt: True if the job will not be retried
+    """
+    analyse_post(Post.objects.get(id=post_id), use_fallback=last_attempt)
+
+
+def run_image_renditions(profile_id, last_attempt):
+    """
+    Generate the renditions of a profile's image.
+
+    :param profile_id: Primary key of the profile
+    :param last_attempt: True if the job will not be retried
+    """
+    profile = Profile.objects.get(pk=profile_id)
+    if profile.image and not generate_renditions(profile):
+        raise ValueError(f'Cannot decode {profile.image.name}')
+
+
+def run_recommendations(profile_id, last_attempt):
+    """
+    Score a profile's recommendations again.
+
+    :param profile_id: Primary key of the profile
+    :param last_attempt: True if the job will not be retried
+    """
+    update_recommendations([profile_id])
+
+
+# job kind, the start of its key: function running it
+JOB_RUNNERS = {
+    'post-analysis': run_post_analysis,
+    'image-renditions': run_image_renditions,
+    'recommendations': run_recommendations,
+}
+
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome.
+
+    Any error fails the attempt, so the job is retried with backoff until
+    ANALYSIS_JOB_MAX_ATTEMPTS; an unreachable analysis backend only falls
+    back to NL_ANALYZER_FALLBACK on the last attempt.
+
+    Outcomes only apply to the revision that was claimed. A job whose
+    revision was bumped while it ran is queued again for another pass with
+    the latest content.
+
+    :param job: AnalysisJob instance returned by claim_jobs
+    :return: True if the job succeeded, False otherwise
+    """
+    claimed = AnalysisJob.objects.filter(pk=job.pk, revision=job.revision)
+    attempts = job.attempts + 1
+    max_attempts = getattr(settings, 'ANALYSIS_JOB_MAX_ATTEMPTS', 5)
+    kind, _, target = job.key.partition(':')
+    try:
+        with measured_job(job.key):
+            JOB_RUNNERS[kind](int(target), attempts >= max_attempts)
+    except Exception as error:
+        if attempts >= max_attempts:
+            recorded = claimed.update(
+                status=AnalysisJob.FAILED, attempts=attempts,
+                last_error=repr(error), updated_at=now())
+        else:
+            recorded = claimed.update(
+                status=AnalysisJob.PENDING, attempts=attempts,
+                run_after=now() + retry_delay(attempts),
+                last_error=repr(error), updated_at=now())
+        succeeded = False
+    else:
+        recorded = claimed.update(status=AnalysisJob.DONE,
+                                  attempts=attempts, last_error='',
+                                  updated_at=now())
+        succeeded = True
+    if not recorded:
+        AnalysisJob.objects.filter(pk=job.pk,
+                                   status=AnalysisJob.RUNNING).update(
+            status=AnalysisJob.PENDING, attempts=0, run_after=now(),
+            last_error='', updated_at=now())
+    return succeeded
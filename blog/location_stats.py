@@ -0,0 +1,149 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, Max, \
+    OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from blog.models import Location, LocationReview, LocationStats, opinion
+
+LocationFollowing = Location.followers.through
+
+
+def review_deltas(reviews, sign):
+    """
+    Amounts a set of reviews adds to, or removes from, the stats of their
+    locations.
+
+    :param reviews: Iterable of (location id, sentiment, magnitude)
+    :param sign: 1 for added reviews, -1 for removed ones
+    :return: Dictionary mapping location id to Counter of field deltas
+    """
+    deltas = defaultdict(Counter)
+    for location_id, sentiment, magnitude in reviews:
+        delta = deltas[location_id]
+        delta['review_count'] += sign
+        delta['sentiment_sum'] += sign * sentiment
+        delta['sentiment_squares'] += sign * sentiment ** 2
+        delta['magnitude_sum'] += sign * magnitude
+        delta['magnitude_squares'] += sign * magnitude ** 2
+        delta[f'{opinion(sentiment, magnitude)}_count'] += sign
+    return deltas
+
+
+def ensure_stats(location_ids):
+    LocationStats.objects.bulk_create(
+        [LocationStats(location_id=pk) for pk in location_ids],
+        ignore_conflicts=True)
+
+
+def last_review_subquery():
+    return Subquery(LocationReview.objects.filter(
+        location_id=OuterRef('location_id'),
+        post__is_published=True).order_by('-post__created_at').values(
+        'post__created_at')[:1])
+
+
+def update_stats(added=(), removed=(), reviewed_at=None):
+    """
+    Apply reviews of published posts that appeared or disappeared to the
+    stats of their locations.
+
+    The stats rows are read under a row lock and written back with one bulk
+    UPDATE, so the number of queries does not depend on the number of
+    locations. An edited review is passed as removed with its old scores
+    and added with its new ones.
+
+    :param added: Iterable of (location id, sentiment, magnitude)
+    :param removed: Iterable of (location id, sentiment, magnitude)
+    :param reviewed_at: Publication time of the added reviews
+    :return: Number of locations updated
+    """
+    added = review_deltas(added, 1)
+    deltas = review_deltas(removed, -1)
+    emptied = set(deltas) - set(added)
+    for location_id, delta in added.items():
+        deltas[location_id].update(delta)
+    if not deltas:
+        return 0
+    fields = set(field for delta in deltas.values() for field in delta)
+    if added and reviewed_at is not None:
+        fields.add('last_review_at')
+    with transaction.atomic():
+        ensure_stats(deltas)
+        stats = list(LocationStats.objects.select_for_update().filter(
+            location_id__in=deltas).order_by('location_id'))
+        for row in stats:
+            for field, value in deltas[row.location_id].items():
+                setattr(row, field, getattr(row, field) + value)
+            if row.location_id in added and reviewed_at is not None:
+                row.last_review_at = max(row.last_review_at or reviewed_at,
+                                         reviewed_at)
+        LocationStats.objects.bulk_update(stats, sorted(fields))
+        if emptied:
+            LocationStats.objects.filter(location_id__in=emptied).update(
+                last_review_at=last_review_subquery())
+    return len(deltas)
+
+
+def post_reviews(post):
+    """
+    The location scores of a post, in the form update_stats takes.
+
+    :param post: Post instance
+    :return: List of (location id, sentiment, magnitude)
+    """
+    return list(LocationReview.objects.filter(post=post).values_list(
+        'location_id', 'sentiment', 'magnitude'))
+
+
+def update_followers(location_ids):
+    """
+    Recount the followers of some locations.
+
+    :param location_ids: Locations whose followers changed
+    """
+    location_ids = list(location_ids)
+    ensure_stats(location_ids)
+    LocationStats.objects.filter(location_id__in=location_ids).update(
+        followers_count=Coalesce(Subquery(LocationFollowing.objects.filter(
+            location_id=OuterRef('location_id')).values(
+            'location_id').annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()), 0))
+
+
+def rebuild_location_stats():
+    """
+    Recompute the stats of every location from its reviews and followers.
+
+    :return: Number of locations with stats
+    """
+    def count(condition):
+        return Count('pk', filter=condition)
+
+    positive = Q(sentiment__gte=0.25)
+    negative = Q(sentiment__lte=-0.25)
+    mixed = ~positive & ~negative & Q(magnitude__gte=0.2)
+    neutral = ~positive & ~negative & ~Q(magnitude__gte=0.2)
+    reviews = LocationReview.objects.filter(
+        post__is_published=True).values('location_id').annotate(
+        review_count=Count('pk'),
+        sentiment_sum=Sum('sentiment'),
+        sentiment_squares=Sum(F('sentiment') * F('sentiment'),
+                              output_field=FloatField()),
+        magnitude_sum=Sum('magnitude'),
+        magnitude_squares=Sum(F('magnitude') * F('magnitude'),
+                              output_field=FloatField()),
+        positive_count=count(positive), negative_count=count(negative),
+        mixed_count=count(mixed), neutral_count=count(neutral),
+        last_review_at=Max('post__created_at')).order_by()
+    stats = {row['location_id']: LocationStats(**row) for row in reviews}
+    followers = LocationFollowing.objects.values('location_id').annotate(
+        total=Count('pk')).order_by().values_list('location_id', 'total')
+    for location_id, total in followers:
+        stats.setdefault(location_id, LocationStats(
+            location_id=location_id)).followers_count = total
+    with transaction.atomic():
+        LocationStats.objects.all().delete()
+        LocationStats.objects.bulk_create(stats.values(), batch_size=500)
+    return len(stats)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from blog.analysis import warm_analysis
+from blog.analysis_cache import evict, purge
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Warm, trim or purge the cache of Natural Language analysis ' \
+           'results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['warm', 'trim', 'purge'],
+                            help='warm caches the analysis of published '
+                                 'posts that are not cached yet without '
+                                 'changing their reviews, trim evicts entries '
+                                 'beyond the size limit and purge deletes '
+                                 'every entry.')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'purge':
+            self.stdout.write(f'Deleted {purge()} cached results')
+        elif options['action'] == 'trim':
+            self.stdout.write(f'Evicted {evict()} cached results')
+        else:
+            posts = Post.objects.filter(is_published=True).only(
+                'id', 'title', 'content')
+            warmed = sum(warm_analysis(post) for post in posts.iterator())
+            self.stdout.write(f'Cached results for {warmed} posts')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from blog.caching import bump
+from blog.models import Post
+from blog.search import update_search_vectors
+from blog.text import sanitize_html, summarize
+
+FIELDS = ['content', 'excerpt', 'word_count', 'reading_time']
+
+
+class Command(BaseCommand):
+    help = 'Sanitise post content and store its excerpt, word count and ' \
+           'reading time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of posts updated per query.')
+
+    def handle(self, *args, **options):
+        batch, updated = list(), 0
+        for post in Post.objects.only('id', *FIELDS).iterator(
+                chunk_size=options['batch_size']):
+            post.content = sanitize_html(post.content)
+            post.excerpt, post.word_count, post.reading_time = summarize(
+                post.content)
+            batch.append(post)
+            if len(batch) == options['batch_size']:
+                updated += self.save(batch)
+                batch = list()
+        updated += self.save(batch)
+        bump('posts')
+        self.stdout.write(f'Updated {updated} posts')
+
+    def save(self, posts):
+        # bulk_update sends no signals, so the vectors are refreshed here
+        Post.objects.bulk_update(posts, FIELDS)
+        update_search_vectors(Post, [post.pk for post in posts])
+        return len(posts)
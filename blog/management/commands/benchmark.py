@@ -0,0 +1,48 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from blog import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Time the main pages and write endpoints on the benchmark data ' \
+           'and compare the results with a baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--baseline',
+                            help='JSON file of an earlier run to compare '
+                                 'with.')
+        parser.add_argument('--save',
+                            help='Write the results to this JSON file.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Accepted relative p90 latency increase.')
+
+    def handle(self, *args, **options):
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = benchmark.run(options['iterations'], options['warmup'])
+        if not results:
+            raise CommandError('No benchmark data, run seed_benchmark first')
+        self.stdout.write(f'{"scenario":<16}{"p50 ms":>9}{"p90 ms":>9}'
+                          f'{"p99 ms":>9}{"queries":>9}  status')
+        for name, stats in results.items():
+            self.stdout.write(
+                f'{name:<16}{stats["p50_ms"]:>9}{stats["p90_ms"]:>9}'
+                f'{stats["p99_ms"]:>9}{stats["queries"]:>9}  '
+                f'{",".join(map(str, stats["statuses"]))}')
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(results, file, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                regressions = benchmark.compare(results, json.load(file),
+                                                options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' +
+                                   '\n'.join(regressions))
+            self.stdout.write('No regressions against the baseline')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import feed
+from blog.models import FeedItem, Profile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every newsfeed from the activities of followed profiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only copy this many of the most recent '
+                                 'posts, likes and comments of each '
+                                 'followed profile.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            FeedItem.objects.all().delete()
+            actors = Profile.objects.filter(followers__isnull=False).distinct()
+            for actor in actors.iterator():
+                feed.backfill(actor, feed.follower_ids(actor.id),
+                              options['limit'])
+        self.stdout.write(f'Built {FeedItem.objects.count()} feed items')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.counters import flush_counters
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded like, comment and share counters into their posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of shards flushed per '
+                                 'transaction.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep flushing every INTERVAL seconds '
+                                 'instead of flushing once.')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_counters(options['batch_size'])
+            self.stdout.write(f'Flushed counters for {flushed} posts')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
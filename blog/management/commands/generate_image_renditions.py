@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import generate_renditions
+from blog.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized renditions of profile images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate the renditions of every '
+                                 'profile, not only the ones without any.')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            profiles = profiles.filter(image_renditions={})
+        generated = 0
+        for profile in profiles.select_related('user').iterator():
+            try:
+                renditions = generate_renditions(profile)
+            except Exception as error:
+                self.stderr.write(f'Could not store the renditions of '
+                                  f'{profile}: {error!r}')
+                continue
+            if renditions:
+                generated += 1
+            else:
+                self.stderr.write(f'Could not read the image of {profile}')
+        self.stdout.write(f'Generated renditions for {generated} profiles')
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.jobs import claim_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs: post analysis, image renditions ' \
+           'and recommendations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the jobs that are due and exit.')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Number of jobs claimed per poll.')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = claim_jobs(options['batch_size'])
+            for job in jobs:
+                if run_job(job):
+                    self.stdout.write(f'Ran {job.key}')
+                else:
+                    self.stderr.write(f'Failed {job.key}')
+            if options['once'] and not jobs:
+                return
+            if not jobs:
+                time.sleep(options['sleep'])
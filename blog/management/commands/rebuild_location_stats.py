@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from blog.location_stats import rebuild_location_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the review and follower stats of every location.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{rebuild_location_stats()} location stats')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.recommendations import rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the profiles recommended to every profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of profiles whose recommendations '
+                                 'are replaced per transaction.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep rebuilding every INTERVAL seconds '
+                                 'instead of rebuilding once.')
+
+    def handle(self, *args, **options):
+        while True:
+            stored = rebuild_recommendations(options['batch_size'])
+            self.stdout.write(f'Stored {stored} recommendations')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from blog.models import Profile, Post, Location, Tag
+from blog.search import is_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored search vectors of profiles, posts, ' \
+           'locations and tags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of primary keys updated per query.')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only fill in rows without a vector.')
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write('Search vectors require PostgreSQL')
+            return
+        batch_size = options['batch_size']
+        for model in (Profile, Post, Location, Tag):
+            last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            updated = 0
+            for start in range(0, last_pk + 1, batch_size):
+                pks = model.objects.filter(
+                    pk__gte=start, pk__lt=start + batch_size).values('pk')
+                updated += update_search_vectors(
+                    model, pks, missing_only=options['missing_only'])
+            self.stdout.write(f'Updated {updated} {model._meta.verbose_name} '
+                              f'search vectors')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import reconcile_profile_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount the followers, followed profiles and published posts ' \
+           'of every profile and repair the stored counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of profiles updated per query.')
+
+    def handle(self, *args, **options):
+        repaired = reconcile_profile_counts(options['batch_size'])
+        self.stdout.write(f'Repaired {repaired} profiles')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.ranking import refresh_hot_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hot score posts are ranked by.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts read and written at once.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep refreshing every INTERVAL seconds '
+                                 'instead of refreshing once.')
+
+    def handle(self, *args, **options):
+        while True:
+            updated = refresh_hot_scores(options['batch_size'])
+            self.stdout.write(f'Updated {updated} hot scores')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
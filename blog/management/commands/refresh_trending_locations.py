@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = 'Count new likes into the trending locations shown on the home ' \
+           'page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recount every like instead of only the '
+                                 'recent ones and the ones created since '
+                                 'the last refresh.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep refreshing every INTERVAL seconds '
+                                 'instead of refreshing once.')
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            self.stdout.write(
+                f'{refresh_trending(rebuild)} trending locations')
+            if not options['interval']:
+                return
+            rebuild = False
+            time.sleep(options['interval'])
@@ -0,0 +1,46 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from blog import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Generate skewed benchmark data: power-law followers, hot posts ' \
+           'and their likes and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--follows', type=int, default=3000)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--likes', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=2000)
+        parser.add_argument('--locations', type=int, default=100)
+        parser.add_argument('--tags', type=int, default=30)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Power-law exponent of followers and post '
+                                 'popularity.')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Spread activity over this many days.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete earlier benchmark data first.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f'Deleted {benchmark.clear()} earlier rows')
+        created = benchmark.seed(
+            users=options['users'], follows=options['follows'],
+            posts=options['posts'], likes=options['likes'],
+            comments=options['comments'], locations=options['locations'],
+            tags=options['tags'], skew=options['skew'], days=options['days'],
+            random_seed=options['seed'])
+        for name, count in created.items():
+            self.stdout.write(f'{count} {name}')
+        call_command('build_feeds', stdout=self.stdout)
+        call_command('reconcile_profile_counts', stdout=self.stdout)
+        call_command('refresh_hot_scores', stdout=self.stdout)
+        call_command('rebuild_location_stats', stdout=self.stdout)
+        call_command('refresh_trending_locations', rebuild=True,
+                     stdout=self.stdout)
+        call_command('rebuild_search_vectors', stdout=self.stdout)
+        call_command('rebuild_recommendations', stdout=self.stdout)
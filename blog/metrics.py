@@ -0,0 +1,267 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('request_metrics', default=None)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class RequestMetrics:
+    """
+    Numbers collected while one request is handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    def record_query(self, sql, elapsed):
+        self.queries += 1
+        self.sql_time += elapsed
+        self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        """
+        Statements run at least `threshold` times, the signature of N+1
+        query patterns.
+
+        :param threshold: Lowest number of executions reported
+        :return: Dictionary mapping SQL to number of executions
+        """
+        return {sql: count for sql, count in self.statements.items()
+                if count >= threshold}
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus format.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def as_dict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': dict(zip(map(str, self.buckets), self.counts))}
+
+
+class Registry:
+    """
+    Histograms of every metric, per URL name, for this process.
+    """
+    METRICS = {
+        'request_seconds': SECONDS_BUCKETS,
+        'sql_seconds': SECONDS_BUCKETS,
+        'template_seconds': SECONDS_BUCKETS,
+        'sql_queries': QUERIES_BUCKETS,
+        'duplicate_queries': QUERIES_BUCKETS,
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = dict()
+
+    def observe(self, view, values):
+        with self.lock:
+            histograms = self.views.setdefault(view, {
+                name: Histogram(buckets)
+                for name, buckets in self.METRICS.items()})
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def as_dict(self):
+        with self.lock:
+            return {view: {name: histogram.as_dict()
+                           for name, histogram in histograms.items()}
+                    for view, histograms in self.views.items()}
+
+    def as_prometheus(self):
+        """
+        Render every histogram in the Prometheus text exposition format.
+
+        :return: String
+        """
+        lines = list()
+        views = self.as_dict()
+        for name in self.METRICS:
+            metric = f'travelcave_{name}'
+            lines.append(f'# TYPE {metric} histogram')
+            for view, histograms in sorted(views.items()):
+                histogram = histograms[name]
+                for bound, count in histogram['buckets'].items():
+                    lines.append(f'{metric}_bucket{{view="{view}",'
+                                 f'le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} '
+                             f'{histogram["count"]}')
+                lines.append(f'{metric}_sum{{view="{view}"}} '
+                             f'{histogram["sum"]}')
+                lines.append(f'{metric}_count{{view="{view}"}} '
+                             f'{histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@contextmanager
+def timed(field):
+    """
+    Add the time spent in a block to a field of the metrics of the current
+    request or job. Elsewhere the block is not measured.
+
+    Usage: with timed('nl_time'): ...
+
+    :param field: 'template_time' in requests, 'nl_time' in jobs
+    """
+    metrics = current.get()
+    if not hasattr(metrics, field):
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(metrics, field,
+                getattr(metrics, field) + time.perf_counter() - started)
+
+
+class JobMetrics:
+    """
+    Numbers collected while one background job runs.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.nl_time = 0.0
+
+
+@contextmanager
+def measured_job(key):
+    """
+    Measure a background job, including the time spent waiting for the
+    Natural Language API, and report it as a debug log line.
+
+    :param key: Key of the job
+    """
+    metrics = JobMetrics()
+    token = current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current.reset(token)
+        logger.debug(json.dumps({
+            'job': key,
+            'wall_ms': round((time.perf_counter() - metrics.started) * 1000,
+                             2),
+            'nl_ms': round(metrics.nl_time * 1000, 2),
+        }))
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure each request and report it in the histograms served by the
+    metrics view and as a debug log line.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            with connection.execute_wrapper(self.execute):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.report(request, response, metrics)
+        return response
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics = current.get()
+            if metrics is not None:
+                metrics.record_query(sql, time.perf_counter() - started)
+
+    @staticmethod
+    def report(request, response, metrics):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        duplicates = metrics.duplicates(
+            getattr(settings, 'METRICS_DUPLICATE_THRESHOLD', 3))
+        wall_time = time.perf_counter() - metrics.started
+        registry.observe(view, {
+            'request_seconds': wall_time,
+            'sql_seconds': metrics.sql_time,
+            'template_seconds': metrics.template_time,
+            'sql_queries': metrics.queries,
+            'duplicate_queries': sum(duplicates.values()),
+        })
+        logger.debug(json.dumps({
+            'view': view,
+            'method': request.method,
+            'status': response.status_code,
+            'wall_ms': round(wall_time * 1000, 2),
+            'sql_queries': metrics.queries,
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+        }))
+        for sql, count in duplicates.items():
+            logger.warning(json.dumps({'view': view, 'duplicate_sql': sql,
+                                       'executions': count}))
+
+
+class TimedTemplate:
+    """
+    Template wrapper that adds its render time to the request's metrics.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('template_time'):
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates backend whose templates measure their render time.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.20 on 2026-10-18 10:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_analysiscacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCounterShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('total_likes', models.IntegerField(default=0)),
+                ('total_comments', models.IntegerField(default=0)),
+                ('total_shares', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='blog.post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postcountershard',
+            constraint=models.UniqueConstraint(fields=('post', 'shard'), name='unique_post_counter_shard'),
+        ),
+    ]
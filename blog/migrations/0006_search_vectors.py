@@ -0,0 +1,55 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:04
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_TABLES = ['blog_location', 'blog_post', 'blog_profile', 'blog_tag']
+
+
+# SQLite has no GIN indexes, so they are only created on PostgreSQL
+def create_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_search_vector_gin '
+            f'ON {table} USING gin (search_vector)')
+
+
+def drop_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS {table}_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+    ]
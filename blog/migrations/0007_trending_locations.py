@@ -0,0 +1,58 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_search_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingLocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('likes_count', models.IntegerField(default=0)),
+                ('average_sentiment', models.FloatField(null=True)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='blog.location')),
+            ],
+            options={
+                'ordering': ['-likes_count', 'location'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationLikeBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('likes', models.IntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_buckets', to='blog.location')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trendinglocation',
+            index=models.Index(fields=['-likes_count'], name='trendinglocation_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationlikebucket',
+            index=models.Index(fields=['day'], name='locationlikebucket_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='locationlikebucket',
+            constraint=models.UniqueConstraint(fields=('location', 'day'), name='unique_location_like_bucket'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_trending_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """
+    Keep the first like of each user on a post and recount the likes of
+    the posts that had duplicates.
+    """
+    PostLike = apps.get_model('blog', 'PostLike')
+    Post = apps.get_model('blog', 'Post')
+    duplicates = PostLike.objects.values('post', 'user').annotate(
+        first=models.Min('id'), likes=models.Count('id')).filter(likes__gt=1)
+    post_ids = set()
+    for duplicate in duplicates:
+        PostLike.objects.filter(post=duplicate['post'],
+                                user=duplicate['user']).exclude(
+            id=duplicate['first']).delete()
+        post_ids.add(duplicate['post'])
+    for post_id in post_ids:
+        Post.objects.filter(id=post_id).update(
+            total_likes=PostLike.objects.filter(post=post_id).count())
+
+
+# Runs in its own migration, so the like deletions are committed and the
+# deferred foreign key checks of feed items have run before 0010 adds the
+# unique constraint; PostgreSQL refuses to alter a table with pending
+# trigger events.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes,
+                             migrations.RunPython.noop),
+    ]
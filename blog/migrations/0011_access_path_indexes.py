@@ -0,0 +1,41 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_remove_duplicate_likes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='comment_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationreview',
+            index=models.Index(fields=['location', 'post'], name='locationreview_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at'], name='post_recent_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['author', '-created_at', '-id'], name='post_author_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['created_at'], name='postlike_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='postlike_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='postlike',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='unique_post_like'),
+        ),
+    ]
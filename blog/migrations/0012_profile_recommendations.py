@@ -0,0 +1,36 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileRecommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='blog.profile')),
+            ],
+            options={
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='profilerecommendation',
+            index=models.Index(fields=['profile', '-score'], name='recommendation_profile_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='profilerecommendation',
+            constraint=models.UniqueConstraint(fields=('profile', 'candidate'), name='unique_profile_recommendation'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def compute_location_stats(apps, schema_editor):
+    """
+    Store the review aggregates and follower count of every location, as
+    rebuild_location_stats does.
+    """
+    Profile = apps.get_model('blog', 'Profile')
+    LocationReview = apps.get_model('blog', 'LocationReview')
+    LocationStats = apps.get_model('blog', 'LocationStats')
+    Following = Profile.locations_following.through
+
+    def count(condition):
+        return models.Count('pk', filter=condition)
+
+    positive = models.Q(sentiment__gte=0.25)
+    negative = models.Q(sentiment__lte=-0.25)
+    mixed = ~positive & ~negative & models.Q(magnitude__gte=0.2)
+    neutral = ~positive & ~negative & ~models.Q(magnitude__gte=0.2)
+    squares = {'output_field': models.FloatField()}
+    reviews = LocationReview.objects.filter(
+        post__is_published=True).values('location_id').annotate(
+        review_count=models.Count('pk'),
+        sentiment_sum=models.Sum('sentiment'),
+        sentiment_squares=models.Sum(
+            models.F('sentiment') * models.F('sentiment'), **squares),
+        magnitude_sum=models.Sum('magnitude'),
+        magnitude_squares=models.Sum(
+            models.F('magnitude') * models.F('magnitude'), **squares),
+        positive_count=count(positive), negative_count=count(negative),
+        mixed_count=count(mixed), neutral_count=count(neutral),
+        last_review_at=models.Max('post__created_at')).order_by()
+    stats = {row['location_id']: LocationStats(**row) for row in reviews}
+    followers = Following.objects.values('location_id').annotate(
+        total=models.Count('pk')).order_by().values_list('location_id',
+                                                         'total')
+    for location_id, total in followers:
+        stats.setdefault(location_id, LocationStats(
+            location_id=location_id)).followers_count = total
+    LocationStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_profile_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_count', models.IntegerField(default=0)),
+                ('sentiment_sum', models.FloatField(default=0)),
+                ('sentiment_squares', models.FloatField(default=0)),
+                ('magnitude_sum', models.FloatField(default=0)),
+                ('magnitude_squares', models.FloatField(default=0)),
+                ('positive_count', models.IntegerField(default=0)),
+                ('negative_count', models.IntegerField(default=0)),
+                ('mixed_count', models.IntegerField(default=0)),
+                ('neutral_count', models.IntegerField(default=0)),
+                ('followers_count', models.IntegerField(default=0)),
+                ('last_review_at', models.DateTimeField(blank=True, null=True)),
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='blog.location')),
+            ],
+            options={
+                'verbose_name_plural': 'location stats',
+            },
+        ),
+        migrations.RunPython(compute_location_stats,
+                             migrations.RunPython.noop),
+    ]
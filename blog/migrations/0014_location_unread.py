@@ -0,0 +1,59 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def track_followed_locations(apps, schema_editor):
+    """
+    Mark the existing reviews as announced and start the unread counters
+    of the existing location followers at zero.
+    """
+    LocationReview = apps.get_model('blog', 'LocationReview')
+    LocationUnread = apps.get_model('blog', 'LocationUnread')
+    Profile = apps.get_model('blog', 'Profile')
+    LocationReview.objects.update(announced=True)
+    LocationUnread.objects.bulk_create([
+        LocationUnread(profile_id=profile_id, location_id=location_id)
+        for profile_id, location_id in
+        Profile.locations_following.through.objects.values_list(
+            'profile_id', 'location_id')], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_location_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locationreview',
+            name='announced',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='LocationUnread',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.location')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_locations', to='blog.profile')),
+            ],
+            options={
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='locationunread',
+            index=models.Index(condition=models.Q(('count__gt', 0)), fields=['profile', '-updated_at'], name='locationunread_profile_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='locationunread',
+            constraint=models.UniqueConstraint(fields=('profile', 'location'), name='unique_location_unread'),
+        ),
+        migrations.RunPython(track_followed_locations,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+def count_profiles(apps, schema_editor):
+    """
+    Store the current follower, following and published post counts of
+    every profile.
+    """
+    Profile = apps.get_model('blog', 'Profile')
+    Post = apps.get_model('blog', 'Post')
+    Following = Profile.users_following.through
+
+    def count(queryset, column):
+        return models.functions.Coalesce(models.Subquery(
+            queryset.values(column).annotate(
+                total=models.Count('pk')).values('total'),
+            output_field=models.IntegerField()), 0)
+
+    Profile.objects.update(
+        followers_count=count(Following.objects.filter(
+            to_profile_id=models.OuterRef('pk')), 'to_profile_id'),
+        following_count=count(Following.objects.filter(
+            from_profile_id=models.OuterRef('pk')), 'from_profile_id'),
+        published_posts_count=count(Post.objects.filter(
+            author_id=models.OuterRef('pk'), is_published=True).order_by(),
+            'author_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_location_unread'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='published_posts_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-published_posts_count', 'id'], name='profile_posts_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-followers_count', 'id'], name='profile_followers_count_idx'),
+        ),
+        migrations.RunPython(count_profiles, migrations.RunPython.noop),
+    ]
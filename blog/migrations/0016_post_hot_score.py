@@ -0,0 +1,44 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:26
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def compute_hot_scores(apps, schema_editor):
+    """
+    Score the existing posts with the default weights and half-life.
+    'manage.py refresh_hot_scores' applies configured ones.
+    """
+    Post = apps.get_model('blog', 'Post')
+    posts = list(Post.objects.only('total_likes', 'total_comments',
+                                   'total_shares', 'created_at'))
+    for post in posts:
+        engagement = max(0, post.total_likes + 2 * post.total_comments +
+                         3 * post.total_shares)
+        post.hot_score = math.log2(1 + engagement) + \
+            (post.created_at - EPOCH).total_seconds() / (24 * 3600)
+    Post.objects.bulk_update(posts, ['hot_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_profile_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(compute_hot_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-hot_score', 'id'], name='post_hot_published_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# istartswith compiles to UPPER(column::text) LIKE UPPER(%s) on PostgreSQL,
+# which only an index on the same expression with text_pattern_ops serves
+PREFIX_COLUMNS = [('auth_user', 'username'), ('blog_location', 'name'),
+                  ('blog_tag', 'name')]
+
+
+# expression indexes with operator classes are PostgreSQL only
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in PREFIX_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_upper_prefix '
+            f'ON {table} (UPPER({column}::text) text_pattern_ops)')
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in PREFIX_COLUMNS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS {table}_{column}_upper_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0016_post_hot_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
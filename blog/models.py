@@ -1,10 +1,14 @@
 from autoslug import AutoSlugField
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils.timezone import now
 
 # Create your models here.
 from django.urls import reverse
 
+from blog.text import sanitize_html, summarize
+
 
 def profile_image(instance, filename):
     """
@@ -34,6 +38,23 @@ class Profile(models.Model):
                                          related_name='users_liked',
                                          blank=True)
     image = models.ImageField(null=True, blank=True, upload_to=profile_image)
+    image_renditions = models.JSONField(default=dict, blank=True,
+                                        editable=False)
+    followers_count = models.IntegerField(default=0, editable=False)
+    following_count = models.IntegerField(default=0, editable=False)
+    published_posts_count = models.IntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        """
+        Meta options for Profile model
+        """
+        indexes = [
+            models.Index(fields=['-published_posts_count', 'id'],
+                         name='profile_posts_count_idx'),
+            models.Index(fields=['-followers_count', 'id'],
+                         name='profile_followers_count_idx'),
+        ]
 
     def __str__(self):
         """
@@ -46,6 +67,7 @@ class Profile(models.Model):
 
 class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         """
@@ -58,6 +80,7 @@ class Tag(models.Model):
 
 class Location(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         """
@@ -83,9 +106,25 @@ class Post(models.Model):
     total_likes = models.IntegerField(default=0)
     total_comments = models.IntegerField(default=0)
     total_shares = models.IntegerField(default=0)
+    hot_score = models.FloatField(default=0, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(default=1, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'],
+                         condition=models.Q(is_published=True),
+                         name='post_recent_published_idx'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         condition=models.Q(is_published=True),
+                         name='post_author_published_idx'),
+            models.Index(fields=['-hot_score', 'id'],
+                         condition=models.Q(is_published=True),
+                         name='post_hot_published_idx'),
+        ]
 
     def __str__(self):
         """
@@ -95,6 +134,21 @@ class Post(models.Model):
         """
         return f'{self.title} by {str(self.author)}'
 
+    def save(self, *args, **kwargs):
+        """
+        Sanitise the content and store its excerpt, word count and reading
+        time before saving.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.content = sanitize_html(self.content)
+            self.excerpt, self.word_count, self.reading_time = summarize(
+                self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt',
+                                           'word_count', 'reading_time'}
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         """
         Post model url
@@ -113,6 +167,16 @@ class PostLike(models.Model):
         Meta options for PostLike model
         """
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'],
+                                    name='unique_post_like'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'],
+                         name='postlike_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='postlike_user_created_idx'),
+        ]
 
     def __str__(self):
         """
@@ -136,6 +200,10 @@ class Comment(models.Model):
         Meta options for Comment Model
         """
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='comment_user_created_idx'),
+        ]
 
     def __str__(self):
         """
@@ -146,11 +214,38 @@ class Comment(models.Model):
         return f'{str(self.user)} commented on {str(self.post)} on {self.created_at}'
 
 
+def opinion(sentiment, magnitude):
+    """
+    Opinion expressed by a review, with the thresholds the templates use.
+
+    :param sentiment: Sentiment score, from -1 to 1
+    :param magnitude: Strength of the emotion, from 0 upwards
+    :return: 'positive', 'negative', 'mixed' or 'neutral'
+    """
+    if sentiment >= 0.25:
+        return 'positive'
+    if sentiment <= -0.25:
+        return 'negative'
+    if magnitude >= 0.2:
+        return 'mixed'
+    return 'neutral'
+
+
 class LocationReview(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
     sentiment = models.FloatField()
     magnitude = models.FloatField()
+    announced = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        """
+        Meta options for LocationReview model
+        """
+        indexes = [
+            models.Index(fields=['location', 'post'],
+                         name='locationreview_location_idx'),
+        ]
 
     def __str__(self):
         """
@@ -159,3 +254,350 @@ class LocationReview(models.Model):
         :return: self.location in self.post
         """
         return f'{str(self.location)} in {str(self.post)}'
+
+
+class AnalysisJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    key = models.CharField(max_length=100, unique=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True,
+                             blank=True, related_name='analysis_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING, db_index=True)
+    revision = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        AnalysisJob model as String.
+
+        :return: self.key (self.status)
+        """
+        return f'{self.key} ({self.status})'
+
+
+class AnalysisCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    locations = models.JSONField(default=list)
+    categories = models.JSONField(default=list)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=now, db_index=True)
+
+    def __str__(self):
+        """
+        AnalysisCacheEntry model as String.
+
+        :return: self.key
+        """
+        return self.key
+
+
+class PostCounterShard(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    total_likes = models.IntegerField(default=0)
+    total_comments = models.IntegerField(default=0)
+    total_shares = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        Meta options for PostCounterShard model
+        """
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'shard'],
+                                    name='unique_post_counter_shard'),
+        ]
+
+    def __str__(self):
+        """
+        PostCounterShard model as String.
+
+        :return: shard self.shard of self.post
+        """
+        return f'shard {self.shard} of {str(self.post)}'
+
+
+class FeedItem(models.Model):
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                              related_name='feed_items')
+    actor = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                              related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    like = models.ForeignKey(PostLike, on_delete=models.CASCADE, null=True,
+                             blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE,
+                                null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        """
+        Meta options for FeedItem model
+        """
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'],
+                         name='feeditem_owner_created_idx'),
+        ]
+
+    def __str__(self):
+        """
+        FeedItem model as String.
+
+        :return: self.activity in the feed of self.owner
+        """
+        return f'{str(self.activity)} in the feed of {str(self.owner)}'
+
+    @property
+    def activity(self):
+        """
+        The like, comment or post this feed item announces.
+
+        :return: PostLike, Comment or Post instance
+        """
+        return self.like or self.comment or self.post
+
+
+class LocationLikeBucket(models.Model):
+    location = models.ForeignKey(Location, on_delete=models.CASCADE,
+                                 related_name='like_buckets')
+    day = models.DateField()
+    likes = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        Meta options for LocationLikeBucket model
+        """
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'day'],
+                                    name='unique_location_like_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='locationlikebucket_day_idx'),
+        ]
+
+    def __str__(self):
+        """
+        LocationLikeBucket model as String.
+
+        :return: self.likes likes for self.location on self.day
+        """
+        return f'{self.likes} likes for {str(self.location)} on {self.day}'
+
+
+class TrendingLocation(models.Model):
+    location = models.OneToOneField(Location, on_delete=models.CASCADE,
+                                    related_name='trending')
+    likes_count = models.IntegerField(default=0)
+    average_sentiment = models.FloatField(null=True)
+    refreshed_at = models.DateTimeField(default=now)
+
+    class Meta:
+        """
+        Meta options for TrendingLocation model
+        """
+        ordering = ['-likes_count', 'location']
+        indexes = [
+            models.Index(fields=['-likes_count'],
+                         name='trendinglocation_likes_idx'),
+        ]
+
+    def __str__(self):
+        """
+        TrendingLocation model as String.
+
+        :return: self.location with self.likes_count likes
+        """
+        return f'{str(self.location)} with {self.likes_count} likes'
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        RollupWatermark model as String.
+
+        :return: self.name at self.last_id
+        """
+        return f'{self.name} at {self.last_id}'
+
+
+class ProfileRecommendation(models.Model):
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                                related_name='recommendations')
+    candidate = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                                  related_name='+')
+    score = models.FloatField()
+    computed_at = models.DateTimeField(default=now)
+
+    class Meta:
+        """
+        Meta options for ProfileRecommendation model
+        """
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'candidate'],
+                                    name='unique_profile_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-score'],
+                         name='recommendation_profile_idx'),
+        ]
+
+    def __str__(self):
+        """
+        ProfileRecommendation model as String.
+
+        :return: self.candidate for self.profile
+        """
+        return f'{str(self.candidate)} for {str(self.profile)}'
+
+
+class LocationStats(models.Model):
+    location = models.OneToOneField(Location, on_delete=models.CASCADE,
+                                    related_name='stats')
+    review_count = models.IntegerField(default=0)
+    sentiment_sum = models.FloatField(default=0)
+    sentiment_squares = models.FloatField(default=0)
+    magnitude_sum = models.FloatField(default=0)
+    magnitude_squares = models.FloatField(default=0)
+    positive_count = models.IntegerField(default=0)
+    negative_count = models.IntegerField(default=0)
+    mixed_count = models.IntegerField(default=0)
+    neutral_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    last_review_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        """
+        Meta options for LocationStats model
+        """
+        verbose_name_plural = 'location stats'
+
+    def __str__(self):
+        """
+        LocationStats model as String.
+
+        :return: self.review_count reviews of self.location
+        """
+        return f'{self.review_count} reviews of {str(self.location)}'
+
+    def mean(self, total):
+        """
+        Average of a score over the location's reviews.
+
+        :param total: Sum of the score
+        :return: Mean, or None without reviews
+        """
+        return total / self.review_count if self.review_count > 0 else None
+
+    def variance(self, total, squares):
+        """
+        Population variance of a score over the location's reviews.
+
+        :param total: Sum of the score
+        :param squares: Sum of the squared score
+        :return: Variance, or None without reviews
+        """
+        if self.review_count <= 0:
+            return None
+        return max(0.0, squares / self.review_count -
+                   (total / self.review_count) ** 2)
+
+    @property
+    def sentiment_mean(self):
+        """
+        Average sentiment of the location's reviews.
+
+        :return: Mean sentiment, or None without reviews
+        """
+        return self.mean(self.sentiment_sum)
+
+    @property
+    def sentiment_variance(self):
+        """
+        Variance of the sentiment of the location's reviews.
+
+        :return: Sentiment variance, or None without reviews
+        """
+        return self.variance(self.sentiment_sum, self.sentiment_squares)
+
+    @property
+    def magnitude_mean(self):
+        """
+        Average magnitude of the location's reviews.
+
+        :return: Mean magnitude, or None without reviews
+        """
+        return self.mean(self.magnitude_sum)
+
+    @property
+    def magnitude_variance(self):
+        """
+        Variance of the magnitude of the location's reviews.
+
+        :return: Magnitude variance, or None without reviews
+        """
+        return self.variance(self.magnitude_sum, self.magnitude_squares)
+
+    @property
+    def opinion(self):
+        """
+        Opinion of the average review.
+
+        :return: 'positive', 'negative', 'mixed', 'neutral' or None without
+            reviews
+        """
+        if self.review_count <= 0:
+            return None
+        return opinion(self.sentiment_mean, self.magnitude_mean)
+
+
+class LocationUnread(models.Model):
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                                related_name='unread_locations')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE,
+                                 related_name='+')
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=now)
+
+    class Meta:
+        """
+        Meta options for LocationUnread model
+        """
+        ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'location'],
+                                    name='unique_location_unread'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-updated_at'],
+                         condition=models.Q(count__gt=0),
+                         name='locationunread_profile_idx'),
+        ]
+
+    def __str__(self):
+        """
+        LocationUnread model as String.
+
+        :return: self.count unread posts about self.location for self.profile
+        """
+        return f'{self.count} unread posts about {str(self.location)} for ' \
+               f'{str(self.profile)}'
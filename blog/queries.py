@@ -0,0 +1,183 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import OuterRef, Prefetch, Subquery, \
+    prefetch_related_objects
+
+from blog.models import Profile, Post, Location, LocationReview, Tag, \
+    Comment
+
+PostTag = Post.tags.through
+
+
+def published_posts():
+    """
+    Published posts with their author loaded for post cards. Cards show the
+    stored excerpt, so the full content is not loaded.
+
+    :return: Post queryset
+    """
+    return Post.objects.filter(is_published=True).select_related(
+        'author__user').defer('content', 'search_vector')
+
+
+def published_reviews():
+    """
+    Reviews from published posts with the post and its author loaded.
+
+    :return: LocationReview queryset
+    """
+    return LocationReview.objects.filter(
+        post__is_published=True).select_related('post__author__user').defer(
+        'post__content', 'post__search_vector')
+
+
+def explore_profiles():
+    """
+    Profiles for the explore page.
+
+    :return: Profile queryset
+    """
+    return Profile.objects.select_related('user')
+
+
+def explore_posts():
+    """
+    Published posts for the explore page.
+
+    :return: Post queryset
+    """
+    return published_posts()
+
+
+def preview_size():
+    """
+    Number of posts or reviews previewed per tag and location on the
+    explore page.
+
+    :return: EXPLORE_PREVIEW_SIZE
+    """
+    return getattr(settings, 'EXPLORE_PREVIEW_SIZE', 4)
+
+
+def explore_tags():
+    """
+    Tags for the explore page. Their latest published posts are loaded with
+    prefetch_tag_posts once the page of tags is known.
+
+    :return: Tag queryset
+    """
+    return Tag.objects.all()
+
+
+def prefetch_tag_posts(tags, limit=None):
+    """
+    Load the latest published posts of each tag into `published_posts`, in
+    one query that reads at most `limit` posts per tag.
+
+    :param tags: Tag instances
+    :param limit: Posts per tag, defaults to EXPLORE_PREVIEW_SIZE
+    """
+    if limit is None:
+        limit = preview_size()
+    tags = list(tags)
+    latest = PostTag.objects.filter(
+        tag_id=OuterRef('tag_id'), post__is_published=True).order_by(
+        '-post__created_at', '-post_id').values('pk')[:limit]
+    rows = PostTag.objects.filter(
+        tag__in=[tag.pk for tag in tags],
+        pk__in=Subquery(latest)).select_related(
+        'post__author__user').defer(
+        'post__content', 'post__search_vector').order_by(
+        '-post__created_at', '-post_id')
+    posts = defaultdict(list)
+    for row in rows:
+        posts[row.tag_id].append(row.post)
+    for tag in tags:
+        tag.published_posts = posts[tag.pk]
+
+
+def explore_locations(limit=None):
+    """
+    Locations for the explore page with their stats and their latest
+    published reviews, at most `limit` per location, prefetched into
+    `published_reviews`.
+
+    :param limit: Reviews per location, defaults to EXPLORE_PREVIEW_SIZE
+    :return: Location queryset
+    """
+    if limit is None:
+        limit = preview_size()
+    latest = LocationReview.objects.filter(
+        location_id=OuterRef('location_id'),
+        post__is_published=True).order_by(
+        '-post__created_at', '-pk').values('pk')[:limit]
+    reviews = published_reviews().filter(pk__in=Subquery(latest)).order_by(
+        '-post__created_at', '-pk')
+    return Location.objects.select_related('stats').prefetch_related(
+        Prefetch('locationreview_set', queryset=reviews,
+                 to_attr='published_reviews'))
+
+
+def post_detail(pk):
+    """
+    Fetch a post with everything view_post.html renders.
+
+    Top-level comments are prefetched into `top_level_comments`, each with
+    its replies and their authors.
+
+    :param pk: Primary key of the post
+    :return: Post instance
+    """
+    replies = Comment.objects.select_related('user__user')
+    comments = Comment.objects.filter(parent=None).select_related(
+        'user__user').prefetch_related(Prefetch('replies', queryset=replies))
+    return Post.objects.select_related('author__user').prefetch_related(
+        Prefetch('comment_set', queryset=comments,
+                 to_attr='top_level_comments'),
+        Prefetch('locationreview_set',
+                 queryset=LocationReview.objects.select_related('location')),
+        Prefetch('author__blog_posts',
+                 queryset=Post.objects.filter(is_published=True),
+                 to_attr='published_posts'),
+    ).get(id=pk)
+
+
+def profile_detail(username):
+    """
+    Fetch a profile with the published posts shown on user.html prefetched
+    into `published_posts`.
+
+    :param username: Username of the profile's user
+    :return: Profile instance
+    """
+    return Profile.objects.select_related('user').prefetch_related(
+        Prefetch('blog_posts', queryset=Post.objects.filter(
+            is_published=True), to_attr='published_posts'),
+    ).get(user__username=username)
+
+
+def profile_reviews(profile):
+    """
+    Reviews from a profile's published posts.
+
+    :param profile: Profile whose reviews are listed
+    :return: LocationReview queryset
+    """
+    return LocationReview.objects.filter(
+        post__author=profile, post__is_published=True).select_related(
+        'location', 'post')
+
+
+def prefetch_activities(activities):
+    """
+    Load the relations user.html renders for a list of activities.
+
+    :param activities: List of Post, PostLike and Comment instances
+    """
+    posts = [activity for activity in activities
+             if isinstance(activity, Post)]
+    comments = [activity for activity in activities
+                if isinstance(activity, Comment)]
+    prefetch_related_objects(posts, 'tags', 'locations')
+    prefetch_related_objects(comments, 'replies')
@@ -0,0 +1,110 @@
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Log
+
+from blog.caching import bump
+from blog.models import Post
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+ENGAGEMENT_FIELDS = ('total_likes', 'total_comments', 'total_shares')
+SCORE_FIELDS = (*ENGAGEMENT_FIELDS, 'created_at')
+
+
+def weights():
+    """
+    Weights of likes, comments and shares in a post's engagement.
+
+    :return: Tuple of (like weight, comment weight, share weight)
+    """
+    return (getattr(settings, 'HOT_LIKE_WEIGHT', 1.0),
+            getattr(settings, 'HOT_COMMENT_WEIGHT', 2.0),
+            getattr(settings, 'HOT_SHARE_WEIGHT', 3.0))
+
+
+def hot_score(likes, comments, shares, created_at):
+    """
+    Time-decayed engagement score of a post.
+
+    The score is log2 of the weighted engagement plus the post's age in
+    half-lives, so a post published HOT_HALF_LIFE_HOURS later needs half
+    the engagement to rank the same. The score of a post only changes with
+    its engagement, which lets it be stored and indexed.
+
+    :param likes: Number of likes
+    :param comments: Number of comments
+    :param shares: Number of shares
+    :param created_at: Publication time of the post
+    :return: Score, higher ranks first
+    """
+    like_weight, comment_weight, share_weight = weights()
+    engagement = max(0, like_weight * likes + comment_weight * comments +
+                     share_weight * shares)
+    half_life = getattr(settings, 'HOT_HALF_LIFE_HOURS', 24) * 3600
+    return math.log2(1 + engagement) + \
+        (created_at - EPOCH).total_seconds() / half_life
+
+
+def engagement(likes, comments, shares):
+    """
+    SQL expression of the weighted engagement of a post.
+
+    :param likes: Expression of the number of likes
+    :param comments: Expression of the number of comments
+    :param shares: Expression of the number of shares
+    :return: Expression, never negative
+    """
+    like_weight, comment_weight, share_weight = weights()
+    return Greatest(Value(0.0), like_weight * likes +
+                    comment_weight * comments + share_weight * shares,
+                    output_field=FloatField())
+
+
+def hot_score_change(field, delta):
+    """
+    SQL expression of a post's score after one of its counters changed.
+
+    The age term of the score does not depend on engagement, so the new
+    score is the stored one with the log of the old engagement swapped for
+    the new. Used in the same UPDATE as the counter, whose columns still
+    hold their old values there.
+
+    :param field: Counter being changed
+    :param delta: Amount added to the counter
+    :return: Expression to assign to hot_score
+    """
+    before = {name: F(name) for name in ENGAGEMENT_FIELDS}
+    after = {**before, field: F(field) + delta}
+    return F('hot_score') + \
+        Log(Value(2.0), 1 + engagement(*after.values())) - \
+        Log(Value(2.0), 1 + engagement(*before.values()))
+
+
+def refresh_hot_scores(batch_size=1000):
+    """
+    Recompute the score of every post and store the ones that changed, for
+    instance after sharded counters were flushed or the weights changed.
+
+    :param batch_size: Number of posts read and written at once
+    :return: Number of posts updated
+    """
+    changed = list()
+    updated = 0
+    for post in Post.objects.only('hot_score', *SCORE_FIELDS).order_by(
+            'pk').iterator(chunk_size=batch_size):
+        score = hot_score(post.total_likes, post.total_comments,
+                          post.total_shares, post.created_at)
+        if not math.isclose(score, post.hot_score, abs_tol=1e-9):
+            post.hot_score = score
+            changed.append(post)
+        if len(changed) >= batch_size:
+            Post.objects.bulk_update(changed, ['hot_score'])
+            updated += len(changed)
+            changed = list()
+    Post.objects.bulk_update(changed, ['hot_score'])
+    updated += len(changed)
+    if updated:
+        bump('ranking')
+    return updated
@@ -0,0 +1,190 @@
+import heapq
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from blog.models import Profile, ProfileRecommendation
+
+Following = Profile.users_following.through
+LocationFollowing = Profile.locations_following.through
+
+
+class Interests:
+    """
+    Sparse profile x item incidence for one kind of interest, stored as
+    the set of items of each profile and its transpose, the set of profiles
+    of each item.
+    """
+
+    def __init__(self, pairs):
+        """
+        :param pairs: Iterable of (profile id, item id)
+        """
+        self.items = defaultdict(set)
+        self.profiles = defaultdict(set)
+        for profile_id, item_id in pairs:
+            self.items[profile_id].add(item_id)
+            self.profiles[item_id].add(profile_id)
+
+    def overlaps(self, profile_id):
+        """
+        Number of items a profile shares with every other profile, the
+        profile's row of the co-occurrence product A * A^T.
+
+        :param profile_id: Profile to compare the others with
+        :return: Counter mapping profile id to number of shared items
+        """
+        shared = Counter()
+        for item_id in self.items.get(profile_id, ()):
+            shared.update(self.profiles[item_id])
+        return shared
+
+    def jaccard(self, profile_id):
+        """
+        Jaccard similarity of a profile's items with every profile sharing
+        at least one of them.
+
+        :param profile_id: Profile to compare the others with
+        :return: Dictionary mapping profile id to similarity
+        """
+        size = len(self.items.get(profile_id, ()))
+        return {other: shared / (size + len(self.items[other]) - shared)
+                for other, shared in self.overlaps(profile_id).items()}
+
+
+def weights():
+    """
+    Weights of shared follows and shared locations in the similarity of two
+    profiles.
+
+    :return: Tuple of (follow weight, location weight)
+    """
+    return (getattr(settings, 'RECOMMENDATION_FOLLOW_WEIGHT', 0.7),
+            getattr(settings, 'RECOMMENDATION_LOCATION_WEIGHT', 0.3))
+
+
+def top_candidates(profile_id, follows, locations, limit):
+    """
+    Profiles most similar to a profile by the users and locations they
+    follow, excluding the profile and the profiles it already follows.
+
+    :param profile_id: Profile to recommend for
+    :param follows: Interests over followed profiles
+    :param locations: Interests over followed locations
+    :param limit: Number of candidates kept
+    :return: List of (score, candidate id), best first
+    """
+    follow_weight, location_weight = weights()
+    scores = Counter()
+    for other, similarity in follows.jaccard(profile_id).items():
+        scores[other] += follow_weight * similarity
+    for other, similarity in locations.jaccard(profile_id).items():
+        scores[other] += location_weight * similarity
+    excluded = follows.items.get(profile_id, set()) | {profile_id}
+    return heapq.nlargest(limit, ((score, other) for other, score in
+                                  scores.items() if other not in excluded))
+
+
+def store(candidates):
+    """
+    Replace the stored recommendations of some profiles.
+
+    :param candidates: Dictionary mapping profile id to list of
+        (score, candidate id)
+    :return: Number of recommendations stored
+    """
+    computed_at = now()
+    rows = [ProfileRecommendation(profile_id=profile_id,
+                                  candidate_id=candidate_id, score=score,
+                                  computed_at=computed_at)
+            for profile_id, ranked in candidates.items()
+            for score, candidate_id in ranked]
+    with transaction.atomic():
+        ProfileRecommendation.objects.filter(
+            profile_id__in=list(candidates)).delete()
+        ProfileRecommendation.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_recommendations(batch_size=500):
+    """
+    Recompute the recommendations of every profile from the whole follow
+    graph, held in memory as inverted indexes.
+
+    :param batch_size: Number of profiles whose rows are replaced at once
+    :return: Number of recommendations stored
+    """
+    limit = getattr(settings, 'RECOMMENDATION_CANDIDATES', 20)
+    follows = Interests(Following.objects.values_list('from_profile_id',
+                                                      'to_profile_id'))
+    locations = Interests(LocationFollowing.objects.values_list(
+        'profile_id', 'location_id'))
+    profile_ids = list(Profile.objects.order_by('id').values_list(
+        'id', flat=True))
+    stored = 0
+    for start in range(0, len(profile_ids), batch_size):
+        stored += store({
+            profile_id: top_candidates(profile_id, follows, locations, limit)
+            for profile_id in profile_ids[start:start + batch_size]})
+    return stored
+
+
+def related_interests(through, profile_field, item_field, profile_ids):
+    """
+    Load the part of an incidence matrix needed to score some profiles:
+    their items, the profiles sharing those items and the items of those
+    profiles.
+
+    :param through: Through model of the followed items
+    :param profile_field: Column of the follower
+    :param item_field: Column of the followed item
+    :param profile_ids: Profiles to score
+    :return: Interests
+    """
+    pairs = through.objects.values_list(profile_field, item_field)
+    items = pairs.filter(**{f'{profile_field}__in': profile_ids}).values(
+        item_field)
+    others = pairs.filter(**{f'{item_field}__in': items}).values(
+        profile_field)
+    return Interests(pairs.filter(**{f'{profile_field}__in': others}))
+
+
+def update_recommendations(profile_ids):
+    """
+    Recompute the recommendations of some profiles after their follows
+    changed. Other profiles pick up the change on the next rebuild.
+
+    :param profile_ids: Profiles whose follows changed
+    :return: Number of recommendations stored
+    """
+    profile_ids = list(profile_ids)
+    limit = getattr(settings, 'RECOMMENDATION_CANDIDATES', 20)
+    follows = related_interests(Following, 'from_profile_id',
+                                'to_profile_id', profile_ids)
+    locations = related_interests(LocationFollowing, 'profile_id',
+                                  'location_id', profile_ids)
+    return store({profile_id: top_candidates(profile_id, follows, locations,
+                                             limit)
+                  for profile_id in profile_ids})
+
+
+def recommended_profiles(profile, count, exclude_user_ids=()):
+    """
+    A random sample of a profile's stored top candidates.
+
+    :param profile: Profile to recommend for
+    :param count: Number of profiles returned
+    :param exclude_user_ids: Ids of users whose profiles are never
+        returned, such as the viewer
+    :return: List of Profile instances
+    """
+    recommendations = ProfileRecommendation.objects.filter(
+        profile=profile).exclude(
+        candidate__user_id__in=exclude_user_ids).select_related(
+        'candidate__user')
+    candidates = [recommendation.candidate
+                  for recommendation in recommendations]
+    return random.sample(candidates, min(count, len(candidates)))
@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    SearchVector
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat
+
+from blog.models import Profile, Post, Location, Tag
+
+
+def full_name(**lookup):
+    """
+    Subquery for the names of the user an outer row points to.
+
+    :param lookup: Filter on User referencing the outer row with OuterRef
+    :return: Subquery returning "first_name last_name username"
+    """
+    return Subquery(User.objects.filter(**lookup).annotate(
+        full_name=Concat('first_name', Value(' '), 'last_name', Value(' '),
+                         'username')).values('full_name')[:1])
+
+
+def search_vectors():
+    """
+    Weighted search vector expression for each searchable model.
+
+    :return: Dictionary mapping model to SearchVector expression
+    """
+    return {
+        Post: SearchVector('title', weight='A') +
+              SearchVector('content', weight='B') +
+              SearchVector(full_name(profile=OuterRef('author_id')),
+                           weight='C'),
+        Profile: SearchVector(full_name(pk=OuterRef('user_id')), weight='A'),
+        Location: SearchVector('name', weight='A'),
+        Tag: SearchVector('name', weight='A'),
+    }
+
+
+def is_supported():
+    """
+    Search vectors are only computed on PostgreSQL.
+
+    :return: True if the default database is PostgreSQL
+    """
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(model, pks=None, missing_only=False):
+    """
+    Recompute the stored search vector of some rows.
+
+    :param model: Post, Profile, Location or Tag
+    :param pks: Primary keys to update, all rows if None
+    :param missing_only: Only update rows that have no vector yet
+    :return: Number of rows updated
+    """
+    if not is_supported():
+        return 0
+    rows = model.objects.all()
+    if pks is not None:
+        rows = rows.filter(pk__in=pks)
+    if missing_only:
+        rows = rows.filter(search_vector=None)
+    return rows.update(search_vector=search_vectors()[model])
+
+
+def search(queryset, query, *fields):
+    """
+    Rows of a queryset matching a search query, best match first.
+
+    On PostgreSQL rows are matched and ranked by their stored search
+    vector. Elsewhere, where vectors are not computed, rows containing the
+    query in one of `fields` are returned oldest first.
+
+    :param queryset: Queryset of Post, Profile, Location or Tag
+    :param query: Text typed in the search box
+    :param fields: Lookups matched case-insensitively without vectors
+    :return: Ordered queryset
+    """
+    if not is_supported():
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition).order_by('id')
+    search_query = SearchQuery(query)
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)).order_by(
+        '-rank', 'id')
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """
+    Run a block in a transaction whose statements are cancelled after a
+    number of milliseconds. The timeout is only applied on PostgreSQL,
+    where a cancelled statement raises OperationalError.
+
+    :param milliseconds: Statement timeout
+    """
+    with transaction.atomic():
+        if is_supported():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s',
+                               [int(milliseconds)])
+        yield
+
+
+def suggest(prefix, limit):
+    """
+    Usernames, locations and tags starting with a prefix, for typeahead.
+    On PostgreSQL each case-insensitive prefix match is served by an index
+    on the upper-cased column with text_pattern_ops.
+
+    :param prefix: Text typed in the search box
+    :param limit: Maximum number of suggestions per section
+    :return: Dictionary mapping section to a list of (id or username, name)
+    """
+    users = User.objects.filter(profile__isnull=False,
+                                username__istartswith=prefix).order_by(
+        'username').values_list('username', 'first_name', 'last_name')
+    return {
+        'users': [(username, f'{first_name} {last_name}'.strip() or username)
+                  for username, first_name, last_name in users[:limit]],
+        'locations': list(Location.objects.filter(
+            name__istartswith=prefix).order_by('name').values_list(
+            'id', 'name')[:limit]),
+        'tags': list(Tag.objects.filter(name__istartswith=prefix).order_by(
+            'name').values_list('id', 'name')[:limit]),
+    }
@@ -0,0 +1,239 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete, \
+    m2m_changed
+from django.dispatch import receiver
+
+from blog import feed
+from blog.counters import adjust_profiles, adjust_follows
+from blog.jobs import enqueue_recommendations
+from blog.caching import bump
+from blog.location_stats import update_stats, post_reviews, \
+    update_followers
+from blog.models import Post, PostLike, Comment, Profile, Location, Tag, \
+    LocationReview
+from blog.ranking import hot_score
+from blog.search import update_search_vectors
+from blog.unread import announce, track, untrack
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    update_search_vectors(Post, [instance.pk])
+    if created:
+        Post.objects.filter(pk=instance.pk).update(hot_score=hot_score(
+            instance.total_likes, instance.total_comments,
+            instance.total_shares, instance.created_at))
+    was_published, _ = getattr(instance, '_stored', None) or (False, None)
+    if instance.is_published and not was_published:
+        feed.fan_out_post(instance)
+
+
+@receiver(post_save, sender=PostLike)
+def post_liked(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance.user_id, instance.post_id, instance.created_at,
+                     like=instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance.user_id, instance.post_id, instance.created_at,
+                     comment=instance)
+
+
+@receiver(m2m_changed, sender=Profile.users_following.through)
+def following_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    limit = getattr(settings, 'FEED_BACKFILL_LIMIT', 50)
+    if action == 'post_add' and reverse:
+        feed.backfill(instance, list(pk_set), limit)
+    elif action == 'post_add':
+        for actor in Profile.objects.filter(pk__in=pk_set):
+            feed.backfill(actor, [instance.pk], limit)
+    elif action == 'post_remove' and reverse:
+        for owner_id in pk_set:
+            feed.unfollow(owner_id, [instance.pk])
+    elif action == 'post_remove':
+        feed.unfollow(instance.pk, pk_set)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Tag)
+def searchable_saved(sender, instance, **kwargs):
+    update_search_vectors(sender, [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    update_search_vectors(Profile, Profile.objects.filter(
+        user=instance).values('pk'))
+    update_search_vectors(Post, Post.objects.filter(
+        author__user=instance).values('pk'))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    locations = LocationReview.objects.filter(post=instance).values_list(
+        'location_id', flat=True)
+    bump('posts', f'post:{instance.pk}',
+         *[f'location:{pk}' for pk in locations])
+
+
+@receiver(post_save, sender=PostLike)
+@receiver(post_delete, sender=PostLike)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def engagement_changed(sender, instance, **kwargs):
+    bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=LocationReview)
+@receiver(post_delete, sender=LocationReview)
+def review_changed(sender, instance, **kwargs):
+    bump(f'post:{instance.post_id}', f'location:{instance.location_id}')
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        bump('posts')
+    elif action in ('post_add', 'post_remove') and reverse:
+        bump(f'tag:{instance.pk}', *[f'post:{pk}' for pk in pk_set])
+    elif action in ('post_add', 'post_remove'):
+        bump(f'post:{instance.pk}', *[f'tag:{pk}' for pk in pk_set])
+
+
+@receiver(m2m_changed, sender=Profile.users_following.through)
+@receiver(m2m_changed, sender=Profile.locations_following.through)
+def interests_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not getattr(settings, 'RECOMMENDATION_INCREMENTAL', True) or \
+            action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        profile_ids = [instance.pk]
+    elif pk_set:
+        profile_ids = list(pk_set)
+    else:
+        return
+    enqueue_recommendations(profile_ids)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    # the stored state, compared with the saved one in post_save receivers
+    instance._stored = Post.objects.filter(pk=instance.pk).values_list(
+        'is_published', 'author_id').first() \
+        if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Post)
+def post_publication_changed(sender, instance, created, **kwargs):
+    was_published, _ = getattr(instance, '_stored', None) or (False, None)
+    if created or was_published == instance.is_published:
+        return
+    if instance.is_published:
+        update_stats(added=post_reviews(instance),
+                     reviewed_at=instance.created_at)
+        announce(instance)
+    else:
+        update_stats(removed=post_reviews(instance))
+
+
+@receiver(pre_save, sender=LocationReview)
+def review_saving(sender, instance, **kwargs):
+    # the stored scores, replaced by the saved ones in review_saved
+    instance._stored = LocationReview.objects.filter(
+        pk=instance.pk).values_list('location_id', 'sentiment',
+                                    'magnitude').first() \
+        if instance.pk is not None else None
+
+
+@receiver(post_save, sender=LocationReview)
+def review_saved(sender, instance, created, **kwargs):
+    if not instance.post.is_published:
+        return
+    scores = (instance.location_id, instance.sentiment, instance.magnitude)
+    stored = getattr(instance, '_stored', None)
+    if stored is None:
+        update_stats(added=[scores], reviewed_at=instance.post.created_at)
+        announce(instance.post)
+    elif stored != scores:
+        update_stats(added=[scores], removed=[stored],
+                     reviewed_at=instance.post.created_at)
+
+
+@receiver(post_delete, sender=LocationReview)
+def review_deleted(sender, instance, **kwargs):
+    # a post deleted with its reviews is still in its table at this point
+    if Post.objects.filter(pk=instance.post_id, is_published=True).exists():
+        update_stats(removed=[(instance.location_id, instance.sentiment,
+                               instance.magnitude)])
+
+
+@receiver(m2m_changed, sender=Profile.locations_following.through)
+def location_followers_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if action == 'pre_clear':
+        # the cleared side is only known before its rows are deleted
+        instance._cleared_ids = list(sender.objects.filter(**{
+            'location_id' if reverse else 'profile_id': instance.pk
+        }).values_list('profile_id' if reverse else 'location_id',
+                       flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    profile_ids, location_ids = ((pk_set, [instance.pk]) if reverse
+                                 else ([instance.pk], pk_set))
+    if action == 'post_add':
+        track(profile_ids, location_ids)
+    else:
+        untrack(profile_ids, location_ids)
+    update_followers(location_ids)
+
+
+@receiver(post_save, sender=Post)
+def published_posts_changed(sender, instance, **kwargs):
+    was_published, author_id = getattr(instance, '_stored', None) or \
+        (False, None)
+    deltas = Counter()
+    if was_published:
+        deltas[author_id] -= 1
+    if instance.is_published:
+        deltas[instance.author_id] += 1
+    adjust_profiles('published_posts_count', deltas)
+
+
+@receiver(post_delete, sender=Post)
+def published_post_deleted(sender, instance, **kwargs):
+    if instance.is_published:
+        adjust_profiles('published_posts_count', {instance.author_id: -1})
+
+
+@receiver(m2m_changed, sender=Profile.users_following.through)
+def follow_counts_changed(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    if reverse:
+        pairs = [(pk, instance.pk) for pk in pk_set or ()]
+        existing = sender.objects.filter(to_profile_id=instance.pk)
+    else:
+        pairs = [(instance.pk, pk) for pk in pk_set or ()]
+        existing = sender.objects.filter(from_profile_id=instance.pk)
+    if action == 'post_add':
+        adjust_follows(pairs, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # only the follows that exist are removed, counted before they go
+        if action == 'pre_remove':
+            existing = existing.filter(**{
+                'from_profile_id__in' if reverse else 'to_profile_id__in':
+                    pk_set})
+        instance._removed_follows = list(existing.values_list(
+            'from_profile_id', 'to_profile_id'))
+    elif action in ('post_remove', 'post_clear'):
+        adjust_follows(instance.__dict__.pop('_removed_follows', []), -1)
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from storages.backends.s3boto3 import S3Boto3Storage
+
+
+class CachedURLMixin:
+    """
+    Storage mixin that makes url() cheap enough to call for every image of
+    a page.
+
+    When URLs are not signed, they are built from the storage's media URL
+    without going through the storage backend. Signed URLs are remembered for
+    MEDIA_URL_CACHE_TTL seconds, at most half of their lifetime, so a URL
+    handed out is always valid for a while longer.
+    """
+    max_cached_urls = 10000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.signed_urls = OrderedDict()
+        self.signed_urls_lock = threading.Lock()
+
+    def signs_urls(self):
+        """
+        :return: True if the URLs of the storage carry a signature
+        """
+        return False
+
+    def url_lifetime(self):
+        """
+        :return: Seconds a signed URL stays valid
+        """
+        return 0
+
+    def media_url(self):
+        """
+        :return: Base URL of the stored files, MEDIA_URL by default
+        """
+        return settings.MEDIA_URL
+
+    def object_path(self, name):
+        """
+        Path of a stored file relative to the media URL.
+
+        :param name: Name of the file in the storage
+        :return: Path
+        """
+        return name
+
+    def url(self, name, *args, **kwargs):
+        if args or kwargs:
+            return super().url(name, *args, **kwargs)
+        if not self.signs_urls():
+            return urljoin(self.media_url(),
+                           filepath_to_uri(self.object_path(name)))
+        now = time.monotonic()
+        with self.signed_urls_lock:
+            cached = self.signed_urls.get(name)
+            if cached is not None and cached[1] > now:
+                self.signed_urls.move_to_end(name)
+                return cached[0]
+        url = super().url(name)
+        ttl = min(getattr(settings, 'MEDIA_URL_CACHE_TTL', 600),
+                  self.url_lifetime() / 2)
+        with self.signed_urls_lock:
+            self.signed_urls[name] = (url, now + ttl)
+            self.signed_urls.move_to_end(name)
+            while len(self.signed_urls) > self.max_cached_urls:
+                self.signed_urls.popitem(last=False)
+        return url
+
+
+class MediaStorage(CachedURLMixin, S3Boto3Storage):
+    """
+    S3 storage for uploaded media.
+    """
+
+    def signs_urls(self):
+        return bool(self.querystring_auth)
+
+    def url_lifetime(self):
+        return self.querystring_expire
+
+    def object_path(self, name):
+        return self._normalize_name(self._clean_name(name))
+
+
+class LocalMediaStorage(CachedURLMixin, FileSystemStorage):
+    """
+    File system storage for uploaded media, for development and tests.
+    Files are stored in LOCAL_MEDIA_ROOT and served from LOCAL_MEDIA_URL,
+    since MEDIA_URL points to the S3 bucket.
+    """
+
+    def __init__(self, location=None, base_url=None, **kwargs):
+        super().__init__(location or settings.LOCAL_MEDIA_ROOT,
+                         base_url or settings.LOCAL_MEDIA_URL, **kwargs)
+
+    def media_url(self):
+        return self.base_url
@@ -0,0 +1,19 @@
+from django import template
+
+from blog.caching import get_versions
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(*parts):
+    """
+    Version of a cache namespace, to vary fragment caches on.
+
+    Usage: {% cache_version 'post' post.id as version %}
+           {% cache 900 post_body post.id version %}...{% endcache %}
+
+    :param parts: Parts of the namespace name, joined with ':'
+    :return: Current version of the namespace
+    """
+    return get_versions([':'.join(str(part) for part in parts)])[0]
@@ -0,0 +1,19 @@
+from django import template
+
+from blog.images import rendition_url
+
+register = template.Library()
+
+
+@register.filter
+def rendition(profile, name):
+    """
+    URL of a resized rendition of a profile's image.
+
+    Usage: <img src="{{ profile|rendition:'avatar' }}">
+
+    :param profile: Profile instance
+    :param name: 'avatar', 'card' or 'hero'
+    :return: URL of the rendition
+    """
+    return rendition_url(profile, name)
@@ -0,0 +1,49 @@
+from django import template
+
+register = template.Library()
+
+
+def object_id(value):
+    return getattr(value, 'id', value)
+
+
+@register.filter
+def follows(viewer, profile):
+    """
+    Check whether the viewer follows a profile.
+
+    Usage: {% if viewer|follows:profile %}
+
+    :param viewer: Viewer from the template context
+    :param profile: Profile instance or id
+    :return: True if the viewer follows the profile
+    """
+    return object_id(profile) in viewer.followed_profile_ids
+
+
+@register.filter
+def follows_location(viewer, location):
+    """
+    Check whether the viewer follows a location.
+
+    Usage: {% if viewer|follows_location:location %}
+
+    :param viewer: Viewer from the template context
+    :param location: Location instance or id
+    :return: True if the viewer follows the location
+    """
+    return object_id(location) in viewer.followed_location_ids
+
+
+@register.filter
+def liked(viewer, post):
+    """
+    Check whether the viewer liked a post.
+
+    Usage: {% if viewer|liked:post %}
+
+    :param viewer: Viewer from the template context
+    :param post: Post instance or id
+    :return: True if the viewer liked the post
+    """
+    return object_id(post) in viewer.liked_post_ids
@@ -1 +1,1750 @@
-# Create your tests here.
+import json
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from PIL import Image
+from google.api_core.exceptions import InvalidArgument, PermissionDenied, \
+    ServiceUnavailable
+from google.cloud.language_v1beta2 import AnnotateTextResponse, \
+    ClassificationCategory, Entity, EntityMention, Sentiment
+
+from blog import benchmark
+from blog.feed import get_feed
+from blog.analysis import apply_analysis, build_text, warm_analysis
+from blog.caching import bump, get_versions
+from blog.context_processors import Viewer
+from blog.analysis_cache import document_key, get_cached_analysis, \
+    store_analysis, evict
+from blog.counters import increment, flush_counters, \
+    reconcile_profile_counts
+from blog.analyzers import Analyzer, GoogleAnalyzer, LocalAnalyzer, \
+    AnalysisResult, LocationSentiment
+from blog.images import strip_metadata
+from blog.location_stats import rebuild_location_stats, update_stats
+from blog.jobs import enqueue_post_analysis, claim_jobs, run_job, \
+    retry_delay
+from blog.metrics import registry
+from blog.models import Profile, Post, Location, LocationReview, Tag, \
+    PostLike, Comment, AnalysisJob, AnalysisCacheEntry, PostCounterShard, \
+    FeedItem, RollupWatermark, ProfileRecommendation, LocationStats, \
+    LocationUnread
+from blog.ranking import hot_score, refresh_hot_scores
+from blog.queries import published_posts, published_reviews, \
+    explore_locations, prefetch_tag_posts
+from blog.recommendations import Interests, rebuild_recommendations, \
+    recommended_profiles
+from blog.search import search, suggest
+from blog.storage import LocalMediaStorage, MediaStorage
+from blog.templatetags.viewer import follows, follows_location, liked
+from blog.text import sanitize_html, summarize
+from blog.timeline import activity_sources, get_activities
+from blog.trending import refresh_trending, trending_locations
+from blog.unread import unread_locations
+
+
+class QueryBudgetMixin:
+    """
+    Assertions on the number of SQL queries a block of code runs.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """
+        Fail if the block runs more than `limit` queries.
+
+        :param limit: Highest acceptable number of queries
+        """
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > limit:
+            queries = '\n'.join(query['sql']
+                                for query in context.captured_queries)
+            self.fail(f'{executed} queries executed, at most {limit} '
+                      f'expected:\n{queries}')
+
+
+def create_profile(username):
+    """
+    Create a user with a profile.
+
+    :param username: Username of the new user
+    :return: Profile instance
+    """
+    user = User.objects.create_user(username=username, password='password',
+                                    first_name=username.title())
+    return Profile.objects.create(user=user, about='About me',
+                                  image=f'image/{username}.jpg')
+
+
+@override_settings(NL_ANALYZER='blog.analyzers.LocalAnalyzer',
+                   NL_ANALYZER_FALLBACK='', ANALYSIS_JOB_MAX_ATTEMPTS=3,
+                   ANALYSIS_JOB_BACKOFF=30, ANALYSIS_JOB_LEASE=600)
+class AnalysisJobTests(TestCase):
+    """
+    Analysis jobs are deduplicated per post, retried with backoff and never
+    run by two workers at once.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(
+            title='Trip', content='<p>We loved our week in Lisbon.</p>',
+            author=create_profile('writer'), is_published=True)
+
+    def test_enqueue_deduplicates(self):
+        enqueue_post_analysis(self.post)
+        enqueue_post_analysis(self.post)
+        job = AnalysisJob.objects.get()
+        self.assertEqual(job.status, AnalysisJob.PENDING)
+        self.assertEqual(job.revision, 1)
+
+    def test_run_analyses_post(self):
+        enqueue_post_analysis(self.post)
+        [job] = claim_jobs(10)
+        self.assertTrue(run_job(job))
+        self.assertEqual(AnalysisJob.objects.get().status, AnalysisJob.DONE)
+        self.assertTrue(LocationReview.objects.filter(
+            post=self.post, location__name='lisbon').exists())
+
+    def test_enqueue_while_running_requeues_after_run(self):
+        enqueue_post_analysis(self.post)
+        [job] = claim_jobs(10)
+        enqueue_post_analysis(self.post)
+        running = AnalysisJob.objects.get()
+        self.assertEqual(running.status, AnalysisJob.RUNNING)
+        self.assertEqual(running.revision, job.revision + 1)
+        self.assertEqual(claim_jobs(10), [])
+        self.assertTrue(run_job(job))
+        requeued = AnalysisJob.objects.get()
+        self.assertEqual(requeued.status, AnalysisJob.PENDING)
+        [again] = claim_jobs(10)
+        self.assertEqual(again.revision, running.revision)
+
+    def test_failure_backs_off_then_fails(self):
+        enqueue_post_analysis(self.post)
+        with mock.patch('blog.jobs.analyse_post',
+                        side_effect=RuntimeError('boom')):
+            for attempt in range(1, 4):
+                AnalysisJob.objects.update(run_after=now())
+                [job] = claim_jobs(10)
+                started = now()
+                self.assertFalse(run_job(job))
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                if attempt < 3:
+                    self.assertEqual(job.status, AnalysisJob.PENDING)
+                    self.assertGreaterEqual(job.run_after,
+                                            started + retry_delay(attempt))
+                    self.assertEqual(claim_jobs(10), [])
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertIn('boom', job.last_error)
+
+    def test_retry_delay(self):
+        self.assertEqual(retry_delay(1), timedelta(seconds=30))
+        self.assertEqual(retry_delay(3), timedelta(seconds=120))
+        self.assertEqual(retry_delay(20), timedelta(seconds=3600))
+
+    def test_expired_lease_is_claimed_again(self):
+        enqueue_post_analysis(self.post)
+        claim_jobs(10)
+        self.assertEqual(claim_jobs(10), [])
+        AnalysisJob.objects.update(updated_at=now() - timedelta(seconds=601))
+        self.assertEqual(len(claim_jobs(10)), 1)
+
+    @override_settings(NL_ANALYZER='blog.tests.UnreachableAnalyzer',
+                       NL_ANALYZER_FALLBACK='blog.analyzers.LocalAnalyzer')
+    def test_fallback_only_on_last_attempt(self):
+        enqueue_post_analysis(self.post)
+        for attempt in range(1, 3):
+            AnalysisJob.objects.update(run_after=now())
+            [job] = claim_jobs(10)
+            self.assertFalse(run_job(job))
+            self.assertFalse(LocationReview.objects.exists())
+        AnalysisJob.objects.update(run_after=now())
+        [job] = claim_jobs(10)
+        self.assertTrue(run_job(job))
+        self.assertEqual(AnalysisJob.objects.get().status, AnalysisJob.DONE)
+        self.assertTrue(LocationReview.objects.filter(
+            location__name='lisbon').exists())
+
+    @override_settings(NL_ANALYZER='blog.tests.ForbiddenAnalyzer',
+                       NL_ANALYZER_FALLBACK='blog.analyzers.LocalAnalyzer')
+    def test_api_errors_never_fall_back(self):
+        enqueue_post_analysis(self.post)
+        for attempt in range(1, 4):
+            AnalysisJob.objects.update(run_after=now())
+            [job] = claim_jobs(10)
+            self.assertFalse(run_job(job))
+        self.assertEqual(AnalysisJob.objects.get().status,
+                         AnalysisJob.FAILED)
+        self.assertFalse(LocationReview.objects.exists())
+
+
+class GoogleAnalyzerTests(SimpleTestCase):
+    """
+    The Google backend asks for entity sentiment and categories in one
+    annotate_text call on a shared client, and keeps proper-noun locations.
+    """
+
+    def setUp(self):
+        patcher = mock.patch(
+            'blog.analyzers.language.LanguageServiceClient')
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.client_class.return_value
+        self.analyzer = GoogleAnalyzer()
+
+    def response(self, categories=('/Travel/Tourist Destinations',)):
+        def entity(name, kind, mention):
+            return Entity(name=name, type=kind,
+                          sentiment=Sentiment(score=0.5, magnitude=1.25),
+                          mentions=[EntityMention(type=mention)])
+
+        return AnnotateTextResponse(entities=[
+            entity('Lisbon', Entity.Type.LOCATION, EntityMention.Type.PROPER),
+            entity('beach', Entity.Type.LOCATION, EntityMention.Type.COMMON),
+            entity('Ana', Entity.Type.PERSON, EntityMention.Type.PROPER),
+        ], categories=[ClassificationCategory(name=name)
+                       for name in categories])
+
+    def test_one_annotate_call(self):
+        self.client.annotate_text.return_value = self.response()
+        result = self.analyzer.analyse('<p>Lisbon</p>')
+        self.client.annotate_text.assert_called_once()
+        features = self.client.annotate_text.call_args.kwargs['features']
+        self.assertTrue(features.extract_entity_sentiment)
+        self.assertTrue(features.classify_text)
+        self.assertEqual(result, AnalysisResult(
+            [LocationSentiment('lisbon', 0.5, 1.25)],
+            ['Tourist Destinations']))
+
+    def test_short_document_retried_without_classify(self):
+        self.client.annotate_text.side_effect = [
+            InvalidArgument('too few tokens'), self.response(categories=())]
+        result = self.analyzer.analyse('<p>Lisbon</p>')
+        self.assertEqual(self.client.annotate_text.call_count, 2)
+        features = self.client.annotate_text.call_args.kwargs['features']
+        self.assertTrue(features.extract_entity_sentiment)
+        self.assertFalse(features.classify_text)
+        self.assertEqual(result.locations,
+                         [LocationSentiment('lisbon', 0.5, 1.25)])
+        self.assertEqual(result.categories, [])
+
+    def test_client_shared(self):
+        self.client.annotate_text.return_value = self.response()
+        self.analyzer.analyse('<p>Lisbon</p>')
+        self.analyzer.analyse('<p>Porto</p>')
+        self.client_class.assert_called_once()
+
+
+class UnreachableAnalyzer(Analyzer):
+    """
+    Backend whose service is down.
+    """
+    unavailable_errors = GoogleAnalyzer.unavailable_errors
+
+    def analyse(self, text):
+        raise ServiceUnavailable('down')
+
+
+class ForbiddenAnalyzer(UnreachableAnalyzer):
+    """
+    Backend that rejects the credentials.
+    """
+
+    def analyse(self, text):
+        raise PermissionDenied('forbidden')
+
+
+class StaticAnalyzer(Analyzer):
+    """
+    Backend returning the same result for every document.
+    """
+    result = AnalysisResult([LocationSentiment('rome', 0.5, 1.0)],
+                            ['Museums & Galleries'])
+
+    def analyse(self, text):
+        return self.result
+
+
+class AnalysisCacheTests(TestCase):
+    """
+    Analysis results are cached per normalised document and evicted least
+    recently used first.
+    """
+
+    def test_document_key_normalises(self):
+        self.assertEqual(document_key('<p>Hello  World</p>\n'),
+                         document_key('<P>hello world</P>'))
+
+    def test_round_trip_counts_hits(self):
+        store_analysis('text', StaticAnalyzer.result)
+        locations, categories = get_cached_analysis('text')
+        self.assertEqual(locations, [['rome', 0.5, 1.0]])
+        self.assertEqual(categories, ['Museums & Galleries'])
+        self.assertEqual(AnalysisCacheEntry.objects.get().hits, 1)
+        self.assertIsNone(get_cached_analysis('other'))
+
+    def test_evict_least_recently_used(self):
+        for index in range(3):
+            store_analysis(f'text {index}', StaticAnalyzer.result)
+        get_cached_analysis('text 0')
+        self.assertEqual(evict(2), 1)
+        self.assertIsNone(get_cached_analysis('text 1'))
+        self.assertIsNotNone(get_cached_analysis('text 0'))
+
+    @override_settings(ANALYSIS_CACHE_MAX_ENTRIES=1)
+    def test_store_evicts_probabilistically(self):
+        with override_settings(ANALYSIS_CACHE_EVICT_PROBABILITY=0):
+            store_analysis('first', StaticAnalyzer.result)
+            store_analysis('second', StaticAnalyzer.result)
+        self.assertEqual(AnalysisCacheEntry.objects.count(), 2)
+        with override_settings(ANALYSIS_CACHE_EVICT_PROBABILITY=1):
+            store_analysis('third', StaticAnalyzer.result)
+        self.assertEqual(AnalysisCacheEntry.objects.count(), 1)
+
+    @override_settings(NL_ANALYZER='blog.tests.StaticAnalyzer')
+    def test_warm_only_fills_cache(self):
+        post = Post.objects.create(title='Trip', content='<p>Rome</p>',
+                                   author=create_profile('warmer'),
+                                   is_published=True)
+        self.assertTrue(warm_analysis(post))
+        self.assertFalse(warm_analysis(post))
+        self.assertIsNotNone(get_cached_analysis(build_text(post)))
+        self.assertFalse(LocationReview.objects.exists())
+        self.assertFalse(post.tags.exists())
+
+
+class LocalAnalyzerTests(SimpleTestCase):
+    """
+    The offline backend finds places after prepositions and scores them
+    with its lexicon.
+    """
+
+    def setUp(self):
+        self.analyzer = LocalAnalyzer()
+
+    def test_locations(self):
+        result = self.analyzer.analyse(
+            '<h1>Week</h1><p>We flew to Rio de Janeiro.</p>'
+            '<p>Then we went to New York. I hiked in The Alps.</p>')
+        self.assertEqual([location.name for location in result.locations],
+                         ['rio de janeiro', 'new york'])
+
+    def test_sentiment(self):
+        result = self.analyzer.analyse(
+            '<p>Dinner in Paris &amp; lunch in Paris were great.</p>'
+            '<p>Our stay in Oslo was not nice and crowded.</p>'
+            '<p>We slept in Lima.</p>')
+        scores = {location.name: location[1:]
+                  for location in result.locations}
+        self.assertEqual(scores, {'paris': (1.0, 1.0),
+                                  'oslo': (-1.0, 1.0),
+                                  'lima': (0.0, 0.0)})
+
+    def test_categories(self):
+        result = self.analyzer.analyse(
+            '<p>The beach and the sea. Food, food and more food.</p>'
+            '<p>One museum.</p>')
+        self.assertEqual(result.categories,
+                         ['Restaurants', 'Beaches & Islands'])
+
+    def test_not_cacheable(self):
+        self.assertFalse(self.analyzer.cacheable)
+
+
+class ApplyAnalysisTests(TestCase):
+    """
+    Analysis results are written with a fixed number of queries, one review
+    per location however often it is mentioned.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_profile('writer')
+
+    def post(self):
+        return Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                   author=self.author, is_published=True)
+
+    def test_query_count_is_independent_of_result_size(self):
+        counts = list()
+        for size in (2, 40):
+            post = self.post()
+            names = [f'place {size}-{index}' for index in range(size)]
+            result = AnalysisResult(
+                [LocationSentiment(name, 0.5, 1.0) for name in names] * 2,
+                [f'category {size}-{index}' for index in range(size)])
+            with CaptureQueriesContext(connection) as context:
+                apply_analysis(post, result)
+            counts.append(len(context.captured_queries))
+            self.assertEqual(LocationReview.objects.filter(
+                post=post).count(), size)
+            self.assertEqual(post.tags.count(), size)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_repeated_mentions_make_one_review(self):
+        post = self.post()
+        apply_analysis(post, AnalysisResult(
+            [LocationSentiment('porto', 0.5, 1.0),
+             LocationSentiment('porto', -0.5, 2.0)], ['Travel', 'Travel']))
+        review = LocationReview.objects.get(post=post)
+        self.assertEqual((review.location.name, review.sentiment,
+                          review.magnitude), ('porto', -0.5, 2.0))
+        self.assertEqual([tag.name for tag in post.tags.all()], ['Travel'])
+        apply_analysis(post, AnalysisResult(
+            [LocationSentiment('porto', 0.25, 1.0)], []))
+        review = LocationReview.objects.get(post=post)
+        self.assertEqual(review.sentiment, 0.25)
+        self.assertFalse(post.tags.exists())
+
+
+class CounterTests(TestCase):
+    """
+    Engagement counters are updated in place or through shards that flush
+    back into the post, keeping the hot score in step.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                       author=create_profile('writer'))
+
+    def assertCounts(self, likes, comments, shares):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.total_likes, post.total_comments,
+                          post.total_shares), (likes, comments, shares))
+        self.assertAlmostEqual(post.hot_score, hot_score(
+            likes, comments, shares, post.created_at))
+
+    def test_direct_increment(self):
+        increment(self.post.pk, 'total_likes')
+        increment(self.post.pk, 'total_likes')
+        increment(self.post.pk, 'total_shares', 3)
+        increment(self.post.pk, 'total_likes', -1)
+        self.assertCounts(1, 0, 3)
+        self.assertFalse(PostCounterShard.objects.exists())
+
+    def test_unknown_counter(self):
+        with self.assertRaises(ValueError):
+            increment(self.post.pk, 'hot_score')
+
+    @override_settings(POST_COUNTER_MODE='sharded', POST_COUNTER_SHARDS=4)
+    def test_sharded_increment_and_flush(self):
+        for _ in range(10):
+            increment(self.post.pk, 'total_likes')
+        increment(self.post.pk, 'total_comments', 2)
+        increment(self.post.pk, 'total_likes', -3)
+        self.assertCounts(0, 0, 0)
+        self.assertLessEqual(PostCounterShard.objects.count(), 4)
+        self.assertEqual(flush_counters(batch_size=2), 1)
+        self.assertCounts(7, 2, 0)
+        self.assertFalse(PostCounterShard.objects.exclude(
+            total_likes=0, total_comments=0, total_shares=0).exists())
+        self.assertEqual(flush_counters(), 0)
+        increment(self.post.pk, 'total_shares')
+        self.assertEqual(flush_counters(), 1)
+        self.assertCounts(7, 2, 1)
+
+    @override_settings(POST_COUNTER_MODE='sharded', POST_COUNTER_SHARDS=4)
+    def test_flush_query_count_is_independent_of_posts(self):
+        posts = [self.post] + [
+            Post.objects.create(title=f'Trip {i}', content='<p>Porto</p>',
+                                author=self.post.author) for i in range(5)]
+        for post in posts:
+            increment(post.pk, 'total_likes')
+        # Select and reset shards, select and bulk update posts, plus the
+        # savepoint of the atomic block, then find the locations and tags
+        # whose cached pages list the posts.
+        with self.assertNumQueries(8):
+            self.assertEqual(flush_counters(), len(posts))
+
+
+class FeedTests(TestCase):
+    """
+    Newsfeeds are filled on write and read back a page at a time.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_profile('reader')
+        cls.writer = create_profile('writer')
+        cls.reader.users_following.add(cls.writer)
+
+    def publish(self, title):
+        return Post.objects.create(title=title, content='<p>Porto</p>',
+                                   author=self.writer, is_published=True)
+
+    def test_activities_fan_out_to_followers(self):
+        post = self.publish('Trip')
+        like = PostLike.objects.create(user=self.writer, post=post)
+        comment = Comment.objects.create(user=self.writer, post=post,
+                                         message='Lovely')
+        activities, cursor = get_feed(self.reader)
+        self.assertEqual(activities, [comment, like, post])
+        self.assertIsNone(cursor)
+        self.assertEqual(get_feed(self.writer), ([], None))
+
+    def test_resaving_published_post_skips_fan_out(self):
+        post = self.publish('Trip')
+        with CaptureQueriesContext(connection) as queries:
+            post.title = 'Trip to Porto'
+            post.save()
+        self.assertFalse(any('blog_feeditem' in query['sql']
+                             for query in queries))
+        self.assertEqual(FeedItem.objects.count(), 1)
+
+    def test_publishing_draft_fans_out_once(self):
+        post = Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                   author=self.writer)
+        self.assertFalse(FeedItem.objects.exists())
+        post.is_published = True
+        post.save()
+        post.is_published = False
+        post.save()
+        post.is_published = True
+        post.save()
+        self.assertEqual(get_feed(self.reader)[0], [post])
+
+    def test_cursor_pagination(self):
+        posts = [self.publish(f'Trip {i}') for i in range(5)]
+        seen, cursor = list(), None
+        while True:
+            page, cursor = get_feed(self.reader, cursor, limit=2)
+            seen += page
+            if cursor is None:
+                break
+        self.assertEqual(seen, posts[::-1])
+        self.assertEqual(get_feed(self.reader, 'not-a-cursor', limit=10)[0],
+                         posts[::-1])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        post = self.publish('Trip')
+        other = create_profile('other')
+        other.users_following.add(self.writer)
+        self.assertEqual(get_feed(other)[0], [post])
+        other.users_following.remove(self.writer)
+        self.assertEqual(get_feed(other)[0], [])
+
+    def test_build_feeds(self):
+        post = self.publish('Trip')
+        like = PostLike.objects.create(user=self.writer, post=post)
+        FeedItem.objects.all().delete()
+        call_command('build_feeds', stdout=StringIO())
+        self.assertEqual(get_feed(self.reader)[0], [like, post])
+        call_command('build_feeds', limit=1, stdout=StringIO())
+        self.assertEqual(get_feed(self.reader)[0], [like, post])
+
+
+class TimelineTests(TestCase):
+    """
+    The activity timeline pages through posts, likes and comments newest
+    first with a keyset cursor, also when activities share a timestamp.
+    """
+
+    KINDS = {Post: 'post', PostLike: 'like', Comment: 'comment'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = create_profile('traveller')
+        author = create_profile('writer')
+        others = [Post.objects.create(title=f'Other {index}',
+                                      content='<p>Porto</p>', author=author,
+                                      is_published=True)
+                  for index in range(3)]
+        for index in range(3):
+            Post.objects.create(title=f'Mine {index}', content='<p>Faro</p>',
+                                author=cls.profile, is_published=True)
+        cls.draft = Post.objects.create(title='Draft', content='<p>Faro</p>',
+                                        author=cls.profile)
+        for post in others:
+            PostLike.objects.create(post=post, user=cls.profile)
+            Comment.objects.create(post=post, user=cls.profile,
+                                   message='Lovely')
+        # every kind has two activities at one time and one at another
+        tied = now() - timedelta(hours=1)
+        for activities in (Post.objects.filter(author=cls.profile),
+                           PostLike.objects.filter(user=cls.profile),
+                           Comment.objects.filter(user=cls.profile)):
+            pks = list(activities.order_by('pk').values_list('pk',
+                                                             flat=True))
+            activities.filter(pk__in=pks[:2]).update(created_at=tied)
+            activities.filter(pk=pks[2]).update(
+                created_at=tied - timedelta(minutes=1))
+
+    def key(self, activity):
+        return activity.created_at, self.KINDS[type(activity)], activity.pk
+
+    def walk(self, limit):
+        keys = list()
+        activities, cursor = get_activities(self.profile, limit=limit)
+        while True:
+            self.assertLessEqual(len(activities), limit)
+            keys.extend(self.key(activity) for activity in activities)
+            if cursor is None:
+                return keys
+            activities, cursor = get_activities(self.profile, cursor,
+                                                limit=limit)
+
+    def test_pages_have_no_gaps_or_duplicates(self):
+        expected = sorted(
+            [self.key(post) for post in Post.objects.filter(
+                author=self.profile, is_published=True)] +
+            [self.key(like) for like in PostLike.objects.filter(
+                user=self.profile)] +
+            [self.key(comment) for comment in Comment.objects.filter(
+                user=self.profile)], reverse=True)
+        self.assertEqual(len(expected), 9)
+        self.assertEqual(len({key[0] for key in expected}), 2)
+        for limit in (1, 2, 4, 9, 20):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), expected)
+
+    def test_unpublished_posts_excluded(self):
+        activities, _ = get_activities(self.profile, limit=20)
+        posts = [activity for activity in activities
+                 if isinstance(activity, Post)]
+        self.assertEqual(len(posts), 3)
+        self.assertNotIn(self.draft, posts)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PageQueryCountTests(QueryBudgetMixin, TestCase):
+    """
+    The number of queries a page runs must not grow with the data on it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_profile('viewer')
+        authors = [create_profile(f'author{index}') for index in range(4)]
+        cls.viewer.users_following.add(*authors)
+        locations = [Location.objects.create(name=f'place {index}')
+                     for index in range(4)]
+        tags = [Tag.objects.create(name=f'tag {index}') for index in range(4)]
+        for index, author in enumerate(authors * 2):
+            post = Post.objects.create(title=f'Post {index}',
+                                       content='<p>Content</p>',
+                                       author=author, is_published=True)
+            post.tags.set(tags)
+            for location in locations:
+                LocationReview.objects.create(post=post, location=location,
+                                              sentiment=0.5, magnitude=1)
+            for liker in authors:
+                PostLike.objects.create(post=post, user=liker)
+                comment = Comment.objects.create(post=post, user=liker,
+                                                 message='Nice')
+                Comment.objects.create(post=post, user=author,
+                                       message='Thanks', parent=comment)
+        cls.post = post
+        cls.author = author
+        cls.location = locations[0]
+        cls.tag = tags[0]
+
+    def setUp(self):
+        self.client.force_login(self.viewer.user)
+
+    def test_index(self):
+        with self.assertMaxQueries(6):
+            self.client.get(reverse('blog:home'))
+
+    def test_view_post(self):
+        with self.assertMaxQueries(14):
+            self.client.get(reverse('blog:view_post', args=[self.post.id]))
+
+    def test_view_user(self):
+        with self.assertMaxQueries(21):
+            self.client.get(reverse('blog:view_user',
+                                    args=[self.viewer.user.username]))
+
+    def test_view_author(self):
+        with self.assertMaxQueries(21):
+            self.client.get(reverse('blog:view_user',
+                                    args=[self.author.user.username]))
+
+    def test_explore(self):
+        with self.assertMaxQueries(14):
+            self.client.get(reverse('blog:explore'), {'query': ''})
+
+    def test_view_location(self):
+        with self.assertMaxQueries(7):
+            self.client.get(reverse('blog:view_location',
+                                    args=[self.location.id]))
+
+    def test_view_tag(self):
+        with self.assertMaxQueries(6):
+            self.client.get(reverse('blog:view_tag', args=[self.tag.id]))
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BenchmarkTests(TestCase):
+    """
+    The benchmark harness runs every scenario on seeded data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(users=8, follows=20, posts=12, likes=30, comments=10,
+                       locations=4, tags=3)
+
+    def test_run(self):
+        results = benchmark.run(iterations=2, warmup=0)
+        self.assertEqual(set(results), {
+            'index_anonymous', 'index', 'view_post', 'view_user', 'explore',
+            'like_post', 'comment_post'})
+        for name, stats in results.items():
+            with self.subTest(name=name):
+                self.assertTrue(set(stats['statuses']) <= {200, 302})
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(benchmark.compare(results, results), [])
+
+    def test_compare(self):
+        baseline = {'index': {'p90_ms': 10, 'queries': 4}}
+        self.assertEqual(benchmark.compare(
+            {'index': {'p90_ms': 11, 'queries': 4}}, baseline), [])
+        self.assertEqual(len(benchmark.compare(
+            {'index': {'p90_ms': 20, 'queries': 5}}, baseline)), 2)
+
+    def test_clear(self):
+        benchmark.clear()
+        self.assertFalse(User.objects.filter(
+            username__startswith=benchmark.USERNAME_PREFIX).exists())
+
+
+class QueryPlanTests(TestCase):
+    """
+    The queries behind the key views must be answered from the index meant
+    for them, on SQLite as on PostgreSQL.
+
+    Sequential scans are disabled for each test on PostgreSQL, so the
+    planner only falls back to one when no index matches the query.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = create_profile('planner')
+        cls.location = Location.objects.create(name='plan location')
+        cls.post = Post.objects.create(title='Plan', content='<p>Plan</p>',
+                                       author=cls.profile, is_published=True)
+        LocationReview.objects.create(post=cls.post, location=cls.location,
+                                      sentiment=0, magnitude=0)
+        PostLike.objects.create(post=cls.post, user=cls.profile)
+        Comment.objects.create(post=cls.post, user=cls.profile,
+                               message='Plan')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, *indexes):
+        """
+        Assert that the plan of a query reads one of some indexes.
+
+        :param queryset: Queryset to explain
+        :param indexes: Names, or name prefixes, of the indexes serving it
+        """
+        plan = queryset.explain()
+        self.assertTrue(any(index in plan for index in indexes),
+                        f'None of {indexes} used by\n{queryset.query}\n{plan}')
+
+    def test_recent_posts(self):
+        self.assertUsesIndex(published_posts()[:12],
+                             'post_recent_published_idx')
+
+    def test_location_reviews(self):
+        # the foreign key index is a prefix of locationreview_location_idx
+        self.assertUsesIndex(published_reviews().filter(
+            location=self.location), 'locationreview_location_idx',
+            'blog_locationreview_location_id_')
+
+    def test_post_like_lookup(self):
+        self.assertUsesIndex(PostLike.objects.filter(post=self.post,
+                                                     user=self.profile),
+                             'unique_post_like',
+                             'sqlite_autoindex_blog_postlike_')
+
+    def test_timeline_sources(self):
+        indexes = {'comment': 'comment_user_created_idx',
+                   'like': 'postlike_user_created_idx',
+                   'post': 'post_author_published_idx'}
+        for kind, queryset in activity_sources(self.profile).items():
+            with self.subTest(kind=kind):
+                self.assertUsesIndex(queryset.order_by('-created_at',
+                                                       '-id')[:21],
+                                     indexes[kind])
+
+    def test_hot_posts(self):
+        queryset = published_posts().order_by('-hot_score', 'id')[:12]
+        self.assertUsesIndex(queryset, 'post_hot_published_idx')
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'Expression indexes are only created on PostgreSQL')
+    def test_suggest_prefix_lookups(self):
+        lookups = {
+            'auth_user_username_upper_prefix': User.objects.filter(
+                username__istartswith='pla'),
+            'blog_location_name_upper_prefix': Location.objects.filter(
+                name__istartswith='pla'),
+            'blog_tag_name_upper_prefix': Tag.objects.filter(
+                name__istartswith='pla'),
+        }
+        for index, queryset in lookups.items():
+            with self.subTest(index=index):
+                self.assertIn(index, queryset.explain())
+
+
+class HotScoreTests(TestCase):
+    """
+    Posts rank by engagement decayed with age, and the stored score is the
+    one refresh_hot_scores computes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_profile('writer')
+        cls.old, cls.new = [
+            Post.objects.create(title=title, content='<p>Porto</p>',
+                                author=author, is_published=True)
+            for title in ('Old', 'New')]
+        Post.objects.filter(pk=cls.old.pk).update(
+            created_at=cls.new.created_at - timedelta(hours=24))
+        refresh_hot_scores()
+
+    def ranked(self):
+        return list(published_posts().order_by(
+            '-hot_score', 'id').values_list('title', flat=True))
+
+    def test_newer_post_needs_less_engagement(self):
+        self.assertEqual(self.ranked(), ['New', 'Old'])
+        increment(self.old.pk, 'total_likes', 2)
+        self.assertEqual(self.ranked(), ['Old', 'New'])
+        increment(self.new.pk, 'total_comments')
+        self.assertEqual(self.ranked(), ['New', 'Old'])
+
+    def test_increment_matches_refresh(self):
+        for field, delta in (('total_likes', 5), ('total_comments', 2),
+                             ('total_shares', 1), ('total_likes', -7)):
+            increment(self.new.pk, field, delta)
+        self.assertEqual(refresh_hot_scores(), 0)
+
+
+class ExplorePreviewTests(TestCase):
+    """
+    Tags and locations on the explore page preview only their latest
+    published posts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_profile('writer')
+        cls.tags = [Tag.objects.create(name=f'tag {index}')
+                    for index in range(2)]
+        cls.location = Location.objects.create(name='porto')
+        cls.posts = list()
+        for index in range(6):
+            post = Post.objects.create(title=f'Post {index}',
+                                       content='<p>Porto</p>', author=author,
+                                       is_published=index != 5)
+            post.tags.set(cls.tags)
+            LocationReview.objects.create(post=post, location=cls.location,
+                                          sentiment=0.5, magnitude=1)
+            cls.posts.append(post)
+        cls.latest = cls.posts[4:0:-1]
+
+    def test_tag_posts(self):
+        tags = list(Tag.objects.order_by('pk'))
+        with self.assertNumQueries(1):
+            prefetch_tag_posts(tags, limit=4)
+        for tag in tags:
+            self.assertEqual(tag.published_posts, self.latest)
+
+    def test_location_reviews(self):
+        with self.assertNumQueries(2):
+            [location] = explore_locations(limit=4)
+        self.assertEqual([review.post for review in
+                          location.published_reviews], self.latest)
+
+
+class ViewerTests(TestCase):
+    """
+    Follow and like checks read the viewer's id sets, each loaded with one
+    query, and make no queries for anonymous users.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_profile('reader')
+        cls.followed = create_profile('followed')
+        cls.other = create_profile('other')
+        cls.reader.users_following.add(cls.followed)
+        cls.location = Location.objects.create(name='porto')
+        cls.reader.locations_following.add(cls.location)
+        cls.liked_post, cls.other_post = [
+            Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                author=cls.followed, is_published=True)
+            for _ in range(2)]
+        PostLike.objects.create(post=cls.liked_post, user=cls.reader)
+
+    def render(self, viewer, source, **context):
+        return Template('{% load viewer %}' + source).render(
+            Context({'viewer': viewer, **context}))
+
+    def test_follows(self):
+        viewer = Viewer(self.reader.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(follows(viewer, self.followed))
+            self.assertTrue(follows(viewer, self.followed.pk))
+            self.assertFalse(follows(viewer, self.other))
+            self.assertFalse(follows(viewer, self.reader))
+        self.assertEqual(self.render(
+            viewer, '{{ viewer|follows:a }} {{ viewer|follows:b }}',
+            a=self.followed, b=self.other), 'True False')
+
+    def test_follows_location(self):
+        viewer = Viewer(self.reader.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(follows_location(viewer, self.location))
+            self.assertFalse(follows_location(viewer, self.location.pk + 1))
+
+    def test_liked(self):
+        viewer = Viewer(self.reader.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(liked(viewer, self.liked_post))
+            self.assertFalse(liked(viewer, self.other_post))
+            self.assertTrue(liked(viewer, self.liked_post.pk))
+        self.assertEqual(self.render(
+            viewer, '{{ viewer|liked:a }} {{ viewer|liked:b }}',
+            a=self.liked_post, b=self.other_post), 'True False')
+
+    def test_anonymous_viewer(self):
+        viewer = Viewer(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertFalse(follows(viewer, self.followed))
+            self.assertFalse(follows_location(viewer, self.location))
+            self.assertFalse(liked(viewer, self.liked_post))
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SearchTests(TestCase):
+    """
+    Explore search finds posts, profiles, locations and tags by their
+    stored search vectors, or by their names without PostgreSQL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_profile('writer')
+        cls.post = Post.objects.create(title='Weekend in Porto',
+                                       content='<p>Wine cellars</p>',
+                                       author=cls.author, is_published=True)
+        Post.objects.create(title='Porto draft', content='<p>Porto</p>',
+                            author=cls.author)
+        cls.location = Location.objects.create(name='Porto')
+        Location.objects.create(name='Lisbon')
+
+    def explore(self, query):
+        response = self.client.get(reverse('blog:explore'), {'query': query})
+        self.assertEqual(response.status_code, 200)
+        return {name: list(response.context[name]) for name in
+                ('profiles', 'locations', 'tags', 'posts')}
+
+    def test_explore_search(self):
+        results = self.explore('porto')
+        self.assertEqual(results['locations'], [self.location])
+        self.assertEqual(results['posts'], [self.post])
+        self.assertEqual(self.explore('writer')['profiles'], [self.author])
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'Search vectors are only computed on PostgreSQL')
+    def test_saved_rows_are_searchable(self):
+        self.post.title = 'Weekend in Braga'
+        self.post.save()
+        tag = Tag.objects.create(name='Vineyards')
+        self.author.user.last_name = 'Travelling'
+        self.author.user.save()
+        self.assertEqual(search(Post.objects.all(), 'braga').get(),
+                         self.post)
+        self.assertEqual(search(Tag.objects.all(), 'vineyards').get(), tag)
+        self.assertEqual(search(Location.objects.all(), 'porto').get(),
+                         self.location)
+        self.assertEqual(search(Profile.objects.all(), 'travelling').get(),
+                         self.author)
+        self.assertEqual(list(search(Post.objects.all(), 'travelling')),
+                         list(Post.objects.order_by('id')))
+
+    @skipUnless(connection.vendor == 'sqlite',
+                'Search falls back to substring matches without vectors')
+    def test_fallback_matches_fields(self):
+        self.assertEqual(list(search(Post.objects.all(), 'CELLAR', 'title',
+                                     'content')), [self.post])
+        self.assertEqual(list(search(Location.objects.all(), 'isb',
+                                     'name')), [Location.objects.get(
+            name='Lisbon')])
+        self.assertFalse(search(Tag.objects.all(), 'porto', 'name').exists())
+
+
+class SuggestTests(TestCase):
+    """
+    Typeahead suggestions match the start of names regardless of case.
+    """
+
+    def test_prefix_matches(self):
+        create_profile('porter')
+        create_profile('lisboner')
+        location = Location.objects.create(name='Porto')
+        Location.objects.create(name='Oporto')
+        tag = Tag.objects.create(name='port wine')
+        self.assertEqual(suggest('POR', 5), {
+            'users': [('porter', 'Porter')],
+            'locations': [(location.pk, 'Porto')],
+            'tags': [(tag.pk, 'port wine')],
+        })
+
+
+class TrendingTests(TestCase):
+    """
+    Trending locations count each like of the window once, however late
+    it was committed or its post was analysed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_profile('writer')
+        cls.likers = [create_profile(f'liker{index}') for index in range(3)]
+        cls.location = Location.objects.create(name='porto')
+        cls.post = Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                       author=cls.author, is_published=True)
+
+    def review(self):
+        LocationReview.objects.create(post=self.post, location=self.location,
+                                      sentiment=0.5, magnitude=1)
+
+    def assertTrending(self, likes):
+        refresh_trending()
+        self.assertEqual([(trending.location, trending.likes_count)
+                          for trending in trending_locations()],
+                         [(self.location, likes)] if likes else [])
+
+    def test_counts_likes_made_before_the_review(self):
+        PostLike.objects.create(post=self.post, user=self.likers[0])
+        self.assertTrending(0)
+        self.review()
+        self.assertTrending(1)
+        self.assertTrending(1)
+
+    def test_counts_likes_committed_behind_the_watermark(self):
+        self.review()
+        PostLike.objects.create(post=self.post, user=self.likers[0])
+        self.assertTrending(1)
+        RollupWatermark.objects.update(last_id=10 ** 6)
+        PostLike.objects.create(post=self.post, user=self.likers[1])
+        self.assertTrending(2)
+
+    def test_removed_recent_likes(self):
+        self.review()
+        like = PostLike.objects.create(post=self.post, user=self.likers[0])
+        PostLike.objects.create(post=self.post, user=self.likers[1])
+        self.assertTrending(2)
+        like.delete()
+        self.assertTrending(1)
+
+    def test_older_likes_counted_once(self):
+        self.review()
+        for liker in self.likers:
+            PostLike.objects.create(post=self.post, user=liker)
+        PostLike.objects.filter(user=self.likers[0]).update(
+            created_at=now() - timedelta(days=5))
+        PostLike.objects.filter(user=self.likers[1]).update(
+            created_at=now() - timedelta(days=10))
+        self.assertTrending(2)
+        self.assertTrending(2)
+        refresh_trending(rebuild=True)
+        self.assertTrending(2)
+
+
+@override_settings(
+    DEBUG=True, ALLOWED_HOSTS=['testserver'],
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CachingTests(TestCase):
+    """
+    Cached pages and fragments are versioned by namespace and dropped when
+    what they show changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_profile('writer')
+        cls.post = Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                       author=cls.author, is_published=True)
+        cls.url = reverse('blog:view_post', args=[cls.post.id])
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCached(self, cached=True, url=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries) == 0, cached)
+        return response
+
+    def test_bump_changes_only_its_namespaces(self):
+        versions = get_versions(['post:1', 'post:2'])
+        self.assertEqual(get_versions(['post:1', 'post:2']), versions)
+        bump('post:1')
+        bumped = get_versions(['post:1', 'post:2'])
+        self.assertNotEqual(bumped[0], versions[0])
+        self.assertEqual(bumped[1], versions[1])
+
+    def test_anonymous_page_cached_until_bumped(self):
+        self.assertCached(False)
+        self.assertCached()
+        Comment.objects.create(post=self.post, user=self.author,
+                               message='Lovely')
+        self.assertContains(self.assertCached(False), 'Lovely')
+        self.assertCached()
+
+    def test_share_invalidates_page(self):
+        self.assertCached(False)
+        increment(self.post.pk, 'total_shares')
+        self.assertCached(False)
+
+    def test_like_invalidates_location_and_tag_pages(self):
+        location = Location.objects.create(name='porto')
+        tag = Tag.objects.create(name='Travel')
+        LocationReview.objects.create(post=self.post, location=location,
+                                      sentiment=0.5, magnitude=1)
+        self.post.tags.add(tag)
+        urls = [reverse('blog:view_location', args=[location.pk]),
+                reverse('blog:view_tag', args=[tag.pk])]
+        for url in urls:
+            self.assertCached(False, url)
+            self.assertCached(True, url)
+        increment(self.post.pk, 'total_likes')
+        for url in urls:
+            self.assertCached(False, url)
+
+    @override_settings(POST_COUNTER_MODE='sharded')
+    def test_flush_invalidates_page(self):
+        self.assertCached(False)
+        increment(self.post.pk, 'total_shares')
+        self.assertCached()
+        flush_counters()
+        self.assertCached(False)
+
+    def test_authenticated_pages_not_cached(self):
+        self.client.force_login(self.author.user)
+        self.assertCached(False)
+        self.assertCached(False)
+
+    @override_settings(DEBUG=False)
+    def test_no_page_cache_in_process_memory_outside_debug(self):
+        self.assertCached(False)
+        self.assertCached(False)
+
+    def test_comment_time_outside_fragment(self):
+        Comment.objects.create(post=self.post, user=self.author,
+                               message='Lovely')
+        self.client.force_login(self.author.user)
+        self.client.get(self.url)
+        Comment.objects.update(created_at=now() - timedelta(days=3))
+        self.assertContains(self.client.get(self.url), '3\xa0days ago')
+
+
+def jpeg_with_exif(width=40, height=20):
+    """
+    Encode a JPEG carrying a camera model, a GPS position and an EXIF
+    orientation rotating it by 90 degrees.
+
+    :param width: Width of the stored pixels
+    :param height: Height of the stored pixels
+    :return: Encoded bytes
+    """
+    exif = Image.Exif()
+    exif[0x0110] = 'Camera'
+    exif[0x0112] = 6
+    exif.get_ifd(0x8825)[2] = (41.0, 9.0, 0.0)
+    output = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, 'JPEG',
+                                                  exif=exif.tobytes())
+    return output.getvalue()
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'], MEDIA_URL='/media/',
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+class ImageTests(TestCase):
+    """
+    Uploaded profile images lose their metadata and are resized by the
+    worker.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def register(self, content, name='me.jpg'):
+        return self.client.post(reverse('blog:register'), {
+            'first_name': 'Ana', 'last_name': 'Sousa', 'email': 'a@b.pt',
+            'password': 'password', 'username': 'ana',
+            'image': SimpleUploadedFile(name, content)})
+
+    def test_strip_metadata(self):
+        upload = SimpleUploadedFile('photo.jpeg', jpeg_with_exif())
+        with Image.open(strip_metadata(upload)) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertIsNone(strip_metadata(
+            SimpleUploadedFile('photo.jpg', b'not an image')))
+
+    def test_register_queues_renditions(self):
+        self.assertEqual(self.register(jpeg_with_exif()).status_code, 302)
+        profile = Profile.objects.get(user__username='ana')
+        self.assertEqual(profile.image_renditions, {})
+        with profile.image.open('rb') as file, Image.open(file) as image:
+            self.assertEqual(dict(image.getexif()), {})
+        [job] = claim_jobs(10)
+        self.assertEqual(job.key, f'image-renditions:{profile.pk}')
+        self.assertTrue(run_job(job))
+        profile.refresh_from_db()
+        self.assertEqual(set(profile.image_renditions),
+                         {'avatar', 'card', 'hero'})
+        for path in profile.image_renditions.values():
+            self.assertTrue(profile.image.storage.exists(path))
+
+    def test_register_with_undecodable_image(self):
+        self.assertEqual(self.register(b'not an image').status_code, 302)
+        self.assertFalse(Profile.objects.get(user__username='ana').image)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_rendition_errors_are_retried(self):
+        self.register(jpeg_with_exif())
+        [job] = claim_jobs(10)
+        with mock.patch('blog.jobs.generate_renditions',
+                        side_effect=RuntimeError('storage down')):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.PENDING)
+        self.assertIn('storage down', job.last_error)
+
+
+@override_settings(MEDIA_URL='https://bucket.s3.amazonaws.com/',
+                   LOCAL_MEDIA_URL='/media/')
+class StorageTests(SimpleTestCase):
+    """
+    Media URLs are built without calling the storage backend whenever they
+    are not signed, and signed ones are reused while they stay valid.
+    """
+
+    def test_local_storage(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = LocalMediaStorage(location=root)
+            name = storage.save('image/my photo.jpg', ContentFile(b'jpeg'))
+            self.assertTrue(storage.exists(name))
+            with storage.open(name) as file:
+                self.assertEqual(file.read(), b'jpeg')
+            self.assertEqual(storage.url(name), '/media/image/my%20photo.jpg')
+
+    @override_settings(AWS_QUERYSTRING_AUTH=False, AWS_LOCATION='media')
+    def test_unsigned_urls_skip_the_backend(self):
+        storage = MediaStorage()
+        with mock.patch('storages.backends.s3boto3.S3Boto3Storage.url',
+                        side_effect=AssertionError('called boto')):
+            self.assertEqual(storage.url('image/my photo.jpg'),
+                             'https://bucket.s3.amazonaws.com/media/image/'
+                             'my%20photo.jpg')
+
+    @override_settings(AWS_QUERYSTRING_AUTH=True, AWS_QUERYSTRING_EXPIRE=60,
+                       MEDIA_URL_CACHE_TTL=600)
+    def test_signed_urls_reused_for_half_their_lifetime(self):
+        storage = MediaStorage()
+        signed = mock.Mock(side_effect=lambda name: f'{name}?signature=1')
+        with mock.patch('storages.backends.s3boto3.S3Boto3Storage.url',
+                        signed), \
+                mock.patch('blog.storage.time.monotonic') as monotonic:
+            monotonic.return_value = 1000
+            self.assertEqual(storage.url('a.jpg'), 'a.jpg?signature=1')
+            monotonic.return_value = 1029
+            storage.url('a.jpg')
+            self.assertEqual(signed.call_count, 1)
+            monotonic.return_value = 1031
+            storage.url('a.jpg')
+            self.assertEqual(signed.call_count, 2)
+
+
+class TextTests(SimpleTestCase):
+    """
+    Post HTML is cleaned of scripts but keeps the formatting and embeds the
+    editor produces, and is summarised for listings.
+    """
+
+    def test_scripts_removed(self):
+        html = sanitize_html(
+            '<p onclick="steal()">Hi<script>steal()</script></p>'
+            '<img src="a.jpg" onerror="steal()">'
+            '<a href="javascript:steal()">link</a>'
+            '<a href=" JavaScript:steal()">link</a>'
+            '<p style="background-image: url(javascript:steal())">Bye</p>'
+            '<iframe src="https://example.com/embed/x"></iframe>')
+        self.assertNotIn('<script', html)
+        self.assertNotIn('onclick', html)
+        self.assertNotIn('onerror', html)
+        self.assertNotIn('javascript', html.lower())
+        self.assertNotIn('example.com', html)
+        self.assertIn('<img src="a.jpg">', html)
+
+    def test_safe_markup_kept(self):
+        html = ('<p style="text-align: center;"><b>Porto</b> '
+                '<span style="color: rgb(255, 0, 0);">red</span> '
+                '<a href="https://example.com" target="_blank">link</a></p>'
+                '<img src="data:image/png;base64,AAAA" style="width: 50%;">'
+                '<iframe src="https://www.youtube.com/embed/x" width="640" '
+                'frameborder="0"></iframe>')
+        self.assertEqual(sanitize_html(html), html)
+
+    def test_position_styles_removed(self):
+        self.assertEqual(sanitize_html(
+            '<p style="position: fixed; text-align: right;">Hi</p>'),
+            '<p style="text-align: right;">Hi</p>')
+
+    def test_summarize(self):
+        excerpt, word_count, reading_time = summarize(
+            '<p>' + 'word ' * 30 + '</p><p>end</p>')
+        self.assertEqual(excerpt, '<p>' + ' '.join(['word'] * 25) + '…</p>')
+        self.assertEqual((word_count, reading_time), (31, 1))
+
+    def test_block_elements_separate_words(self):
+        _, word_count, _ = summarize('<h1>Porto</h1><p>Lisbon<br>Faro</p>')
+        self.assertEqual(word_count, 3)
+
+    def test_reading_time(self):
+        content = '<p>' + 'word ' * 401 + '</p>'
+        self.assertEqual(summarize(content)[1:], (401, 3))
+        self.assertEqual(summarize('')[1:], (0, 1))
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'], METRICS_TOKEN='secret',
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class MetricsTests(TestCase):
+    """
+    Requests and jobs are measured, and the histograms are only served to
+    staff and scrapers holding the token.
+    """
+
+    def requests_count(self, view):
+        histograms = registry.as_dict().get(view)
+        return histograms['request_seconds']['count'] if histograms else 0
+
+    def test_middleware_records_requests(self):
+        before = self.requests_count('blog:home')
+        with self.assertLogs('blog.metrics', 'DEBUG') as logs:
+            self.client.get(reverse('blog:home'))
+        self.assertEqual(self.requests_count('blog:home'), before + 1)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'blog:home')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['sql_queries'], 0)
+        self.assertEqual(logs.records[0].levelname, 'DEBUG')
+
+    @override_settings(NL_ANALYZER='blog.analyzers.LocalAnalyzer')
+    def test_jobs_measure_analysis_time(self):
+        post = Post.objects.create(
+            title='Trip', content='<p>We loved Lisbon.</p>',
+            author=create_profile('writer'), is_published=True)
+        enqueue_post_analysis(post)
+        [job] = claim_jobs(10)
+        with self.assertLogs('blog.metrics', 'DEBUG') as logs:
+            self.assertTrue(run_job(job))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['job'], job.key)
+        self.assertGreaterEqual(line['wall_ms'], line['nl_ms'])
+
+    def test_metrics_access(self):
+        self.client.get(reverse('blog:home'))
+        url = reverse('blog:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'travelcave_request_seconds_bucket'
+                                       '{view="blog:home",le="+Inf"}')
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url, {'format': 'json'})
+        self.assertIn('blog:home', response.json())
+
+
+class RecommendationTests(TestCase):
+    """
+    Profiles are recommended by the Jaccard similarity of what they follow,
+    in a batch rebuild and by the worker after follows change.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana, cls.bea, cls.carl, cls.dora, cls.eva = [
+            create_profile(name) for name in
+            ('ana', 'bea', 'carl', 'dora', 'eva')]
+        cls.porto = Location.objects.create(name='porto')
+
+    def recommendations(self, profile):
+        return dict(ProfileRecommendation.objects.filter(
+            profile=profile).values_list('candidate__user__username',
+                                         'score'))
+
+    def run_jobs(self):
+        jobs = claim_jobs(100)
+        for job in jobs:
+            self.assertTrue(run_job(job))
+        return [job.key for job in jobs]
+
+    def test_jaccard(self):
+        interests = Interests([(1, 'a'), (1, 'b'), (2, 'b'), (2, 'c'),
+                               (3, 'd')])
+        self.assertEqual(interests.jaccard(1), {1: 1.0, 2: 1 / 3})
+        self.assertEqual(interests.jaccard(4), {})
+
+    @override_settings(RECOMMENDATION_FOLLOW_WEIGHT=0.7,
+                       RECOMMENDATION_LOCATION_WEIGHT=0.3)
+    def test_rebuild(self):
+        self.ana.users_following.add(self.carl, self.dora)
+        self.bea.users_following.add(self.carl, self.dora, self.eva)
+        self.ana.locations_following.add(self.porto)
+        self.eva.locations_following.add(self.porto)
+        AnalysisJob.objects.all().delete()
+        rebuild_recommendations(batch_size=2)
+        recommendations = self.recommendations(self.ana)
+        self.assertEqual(set(recommendations), {'bea', 'eva'})
+        self.assertAlmostEqual(recommendations['bea'], 0.7 * 2 / 3)
+        self.assertAlmostEqual(recommendations['eva'], 0.3)
+        self.assertEqual(recommended_profiles(self.ana, 5,
+                                              [self.bea.user_id]),
+                         [self.eva])
+
+    def test_follow_changes_are_queued(self):
+        self.ana.users_following.add(self.carl)
+        self.bea.users_following.add(self.carl)
+        self.assertFalse(ProfileRecommendation.objects.exists())
+        self.assertEqual(sorted(self.run_jobs()), [
+            f'recommendations:{self.ana.pk}',
+            f'recommendations:{self.bea.pk}'])
+        self.assertEqual(set(self.recommendations(self.bea)), {'ana'})
+        self.bea.users_following.remove(self.carl)
+        self.assertEqual(self.run_jobs(), [f'recommendations:{self.bea.pk}'])
+        self.assertEqual(self.recommendations(self.bea), {})
+
+    @override_settings(RECOMMENDATION_INCREMENTAL=False)
+    def test_incremental_updates_can_be_disabled(self):
+        self.ana.users_following.add(self.carl)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+
+class LocationStatsTests(TestCase):
+    """
+    Location stats follow the reviews of published posts and the followers
+    of the location, and match a full rebuild.
+    """
+
+    STAT_FIELDS = ('review_count', 'sentiment_sum', 'sentiment_squares',
+                   'magnitude_sum', 'magnitude_squares', 'positive_count',
+                   'negative_count', 'mixed_count', 'neutral_count',
+                   'followers_count', 'last_review_at')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_profile('writer')
+        cls.porto = Location.objects.create(name='porto')
+        cls.lisbon = Location.objects.create(name='lisbon')
+
+    def post(self, is_published=True):
+        return Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                   author=self.author,
+                                   is_published=is_published)
+
+    def stats(self, location):
+        return LocationStats.objects.filter(location=location).values(
+            *self.STAT_FIELDS).first()
+
+    def assertMatchesRebuild(self):
+        stored = {stats['location']: stats for stats in
+                  LocationStats.objects.values('location',
+                                               *self.STAT_FIELDS)}
+        rebuild_location_stats()
+        rebuilt = {stats['location']: stats for stats in
+                   LocationStats.objects.values('location',
+                                                *self.STAT_FIELDS)}
+        empty = {field: getattr(LocationStats(), field)
+                 for field in self.STAT_FIELDS}
+        for location in set(stored) | set(rebuilt):
+            for field in self.STAT_FIELDS:
+                self.assertAlmostEqual(
+                    stored.get(location, empty)[field],
+                    rebuilt.get(location, empty)[field], msg=field)
+
+    def test_reviews_increment_and_decrement(self):
+        post = self.post()
+        positive = LocationReview.objects.create(
+            post=post, location=self.porto, sentiment=0.5, magnitude=1)
+        LocationReview.objects.create(post=self.post(), location=self.porto,
+                                      sentiment=-0.5, magnitude=2)
+        stats = LocationStats.objects.get(location=self.porto)
+        self.assertEqual((stats.review_count, stats.positive_count,
+                          stats.negative_count), (2, 1, 1))
+        self.assertAlmostEqual(stats.sentiment_mean, 0)
+        self.assertAlmostEqual(stats.magnitude_variance, 0.25)
+        self.assertMatchesRebuild()
+        positive.delete()
+        stats = LocationStats.objects.get(location=self.porto)
+        self.assertEqual((stats.review_count, stats.positive_count,
+                          stats.negative_count), (1, 0, 1))
+        self.assertAlmostEqual(stats.sentiment_mean, -0.5)
+        self.assertMatchesRebuild()
+
+    def test_edited_review_replaces_its_scores(self):
+        review = LocationReview.objects.create(
+            post=self.post(), location=self.porto, sentiment=0.5,
+            magnitude=1)
+        review.sentiment = -0.5
+        review.save()
+        stats = LocationStats.objects.get(location=self.porto)
+        self.assertEqual((stats.review_count, stats.positive_count,
+                          stats.negative_count), (1, 0, 1))
+        self.assertAlmostEqual(stats.sentiment_sum, -0.5)
+        self.assertMatchesRebuild()
+        review.location = self.lisbon
+        review.save()
+        self.assertEqual(self.stats(self.porto)['review_count'], 0)
+        self.assertIsNone(self.stats(self.porto)['last_review_at'])
+        self.assertEqual(self.stats(self.lisbon)['negative_count'], 1)
+        self.assertMatchesRebuild()
+
+    def test_publication_changes(self):
+        post = self.post(is_published=False)
+        LocationReview.objects.create(post=post, location=self.porto,
+                                      sentiment=0.5, magnitude=1)
+        self.assertIsNone(self.stats(self.porto))
+        post.is_published = True
+        post.save()
+        self.assertEqual(self.stats(self.porto)['review_count'], 1)
+        post.is_published = False
+        post.save()
+        self.assertEqual(self.stats(self.porto)['review_count'], 0)
+        self.assertMatchesRebuild()
+
+    def test_followers(self):
+        reader = create_profile('reader')
+        reader.locations_following.add(self.porto, self.lisbon)
+        self.author.locations_following.add(self.porto)
+        self.assertEqual(self.stats(self.porto)['followers_count'], 2)
+        reader.locations_following.remove(self.porto)
+        self.assertEqual(self.stats(self.porto)['followers_count'], 1)
+        self.assertEqual(self.stats(self.lisbon)['followers_count'], 1)
+        self.assertMatchesRebuild()
+
+    def test_cleared_followers(self):
+        reader = create_profile('reader')
+        reader.locations_following.add(self.porto, self.lisbon)
+        self.author.locations_following.add(self.porto)
+        reader.locations_following.clear()
+        self.assertEqual(self.stats(self.porto)['followers_count'], 1)
+        self.assertEqual(self.stats(self.lisbon)['followers_count'], 0)
+        self.porto.followers.clear()
+        self.assertEqual(self.stats(self.porto)['followers_count'], 0)
+        self.assertFalse(LocationUnread.objects.exists())
+        self.assertMatchesRebuild()
+
+    def test_update_query_count_is_independent_of_locations(self):
+        reviewed_at = now()
+        counts = list()
+        for total in (2, 40):
+            Location.objects.bulk_create(
+                [Location(name=f'{total}-{i}') for i in range(total)])
+            locations = list(Location.objects.filter(
+                name__startswith=f'{total}-').order_by('pk'))
+            with CaptureQueriesContext(connection) as context:
+                update_stats(
+                    added=[(location.pk, 0.5, 1) for location in locations],
+                    removed=[(locations[0].pk, -0.5, 2)],
+                    reviewed_at=reviewed_at)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        stats = LocationStats.objects.get(location=locations[0])
+        self.assertEqual((stats.review_count, stats.positive_count,
+                          stats.negative_count), (0, 1, -1))
+        self.assertEqual(stats.last_review_at, reviewed_at)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class UnreadTests(TestCase):
+    """
+    Followers of a location count the published posts reviewing it until
+    they view the location.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_profile('writer')
+        cls.reader = create_profile('reader')
+        cls.porto = Location.objects.create(name='porto')
+        cls.author.locations_following.add(cls.porto)
+        cls.reader.locations_following.add(cls.porto)
+
+    def counts(self):
+        return dict(LocationUnread.objects.filter(
+            location=self.porto).values_list('profile__user__username',
+                                             'count'))
+
+    def publish(self, is_published=True):
+        post = Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                   author=self.author,
+                                   is_published=is_published)
+        apply_analysis(post, AnalysisResult(
+            [LocationSentiment('porto', 0.5, 1.0)], []))
+        return post
+
+    def test_follow_and_unfollow(self):
+        self.assertEqual(self.counts(), {'writer': 0, 'reader': 0})
+        self.reader.locations_following.remove(self.porto)
+        self.assertEqual(self.counts(), {'writer': 0})
+        self.porto.followers.add(self.reader)
+        self.assertEqual(self.counts(), {'writer': 0, 'reader': 0})
+
+    def test_publishing_counts_for_followers_but_not_the_author(self):
+        self.publish()
+        self.publish()
+        self.assertEqual(self.counts(), {'writer': 0, 'reader': 2})
+        self.assertEqual([unread.location for unread in
+                          unread_locations(self.reader)], [self.porto])
+        self.assertFalse(unread_locations(self.author).exists())
+
+    def test_counted_once(self):
+        post = self.publish()
+        apply_analysis(post, AnalysisResult(
+            [LocationSentiment('porto', -0.5, 2.0)], []))
+        post.is_published = False
+        post.save()
+        post.is_published = True
+        post.save()
+        self.assertEqual(self.counts()['reader'], 1)
+
+    def test_draft_counted_when_published(self):
+        post = self.publish(is_published=False)
+        self.assertEqual(self.counts()['reader'], 0)
+        post.is_published = True
+        post.save()
+        self.assertEqual(self.counts()['reader'], 1)
+
+    def test_viewing_location_resets(self):
+        self.publish()
+        self.client.force_login(self.reader.user)
+        response = self.client.get(
+            reverse('blog:view_location', args=[self.porto.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts()['reader'], 0)
+
+
+class ProfileCountTests(TestCase):
+    """
+    The follower, following and published post counts stored on profiles
+    follow every change and never need repairing.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana, cls.bea, cls.carl = [create_profile(name)
+                                      for name in ('ana', 'bea', 'carl')]
+
+    def assertCounts(self, *expected):
+        profiles = Profile.objects.filter(
+            pk__in=[self.ana.pk, self.bea.pk, self.carl.pk]).order_by(
+            'user__username')
+        self.assertEqual([(profile.followers_count, profile.following_count)
+                          for profile in profiles], list(expected))
+        self.assertEqual(reconcile_profile_counts(), 0)
+
+    def test_add_and_readd(self):
+        self.ana.users_following.add(self.bea, self.carl)
+        self.assertCounts((0, 2), (1, 0), (1, 0))
+        self.ana.users_following.add(self.bea)
+        self.assertCounts((0, 2), (1, 0), (1, 0))
+
+    def test_remove(self):
+        self.ana.users_following.add(self.bea)
+        self.ana.users_following.remove(self.bea, self.carl)
+        self.assertCounts((0, 0), (0, 0), (0, 0))
+        self.ana.users_following.remove(self.bea)
+        self.assertCounts((0, 0), (0, 0), (0, 0))
+
+    def test_clear(self):
+        self.ana.users_following.add(self.bea, self.carl)
+        self.bea.users_following.add(self.carl)
+        self.ana.users_following.clear()
+        self.assertCounts((0, 0), (0, 1), (1, 0))
+
+    def test_reverse_side(self):
+        self.carl.followers.add(self.ana, self.bea)
+        self.assertCounts((0, 1), (0, 1), (2, 0))
+        self.carl.followers.remove(self.ana)
+        self.assertCounts((0, 0), (0, 1), (1, 0))
+        self.carl.followers.add(self.bea)
+        self.carl.followers.clear()
+        self.assertCounts((0, 0), (0, 0), (0, 0))
+
+    def test_published_posts(self):
+        post = Post.objects.create(title='Trip', content='<p>Porto</p>',
+                                   author=self.ana)
+        draft = Post.objects.create(title='Draft', content='<p>Porto</p>',
+                                    author=self.ana)
+        self.assertEqual(Profile.objects.get(
+            pk=self.ana.pk).published_posts_count, 0)
+        post.is_published = True
+        post.save()
+        draft.delete()
+        self.assertEqual(Profile.objects.get(
+            pk=self.ana.pk).published_posts_count, 1)
+        post.author = self.bea
+        post.save()
+        self.assertEqual(list(Profile.objects.filter(
+            pk__in=[self.ana.pk, self.bea.pk]).order_by(
+            'user__username').values_list('published_posts_count',
+                                          flat=True)), [0, 1])
+        post.delete()
+        self.assertEqual(Profile.objects.get(
+            pk=self.bea.pk).published_posts_count, 0)
+        self.assertEqual(reconcile_profile_counts(), 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.ana.users_following.add(self.bea)
+        Profile.objects.filter(pk=self.bea.pk).update(followers_count=5)
+        self.assertEqual(reconcile_profile_counts(), 1)
+        self.assertCounts((0, 1), (1, 0), (0, 0))
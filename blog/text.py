@@ -0,0 +1,97 @@
+import html
+import math
+import re
+from urllib.parse import urlsplit
+
+import bleach
+from bleach.css_sanitizer import CSSSanitizer
+from django.utils.text import Truncator
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'font', 'h1', 'h2',
+    'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'iframe', 'img', 'li', 'ol', 'p',
+    'pre', 's',
+    'span', 'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'th',
+    'thead', 'tr', 'u', 'ul',
+}
+
+
+def link_attribute(tag, name, value):
+    # data: URIs are kept for the images Summernote inlines, not for links
+    if name == 'href':
+        return not value.strip().lower().startswith('data:')
+    return name in ('title', 'target')
+
+
+def embed_attribute(tag, name, value):
+    # Only the video players Summernote embeds may be framed
+    if name == 'src':
+        url = urlsplit(value.strip())
+        return url.scheme in ('', 'https') and url.netloc in EMBED_HOSTS
+    return name in ('width', 'height', 'frameborder', 'allowfullscreen')
+
+
+EMBED_HOSTS = {
+    'www.youtube.com', 'youtube.com', 'www.youtube-nocookie.com',
+    'player.vimeo.com',
+}
+ALLOWED_ATTRIBUTES = {
+    '*': ['style'],
+    'a': link_attribute,
+    'iframe': embed_attribute,
+    'img': ['src', 'alt', 'title', 'width', 'height'],
+    'font': ['color', 'face'],
+    'td': ['colspan', 'rowspan'],
+    'th': ['colspan', 'rowspan'],
+}
+ALLOWED_PROTOCOLS = {'http', 'https', 'mailto', 'data'}
+# Inline styles the Summernote toolbar applies
+CSS_SANITIZER = CSSSanitizer(allowed_css_properties={
+    'background-color', 'color', 'float', 'font-family', 'font-size',
+    'font-style', 'font-weight', 'height', 'line-height', 'margin-left',
+    'text-align', 'text-decoration', 'width',
+})
+BLOCK_TAGS = re.compile(
+    r'</?(p|br|div|li|h[1-6]|blockquote|pre|tr|td|th)\b[^>]*>',
+    flags=re.IGNORECASE)
+
+EXCERPT_WORDS = 25
+WORDS_PER_MINUTE = 200
+
+
+def sanitize_html(content):
+    """
+    Remove the tags, attributes, styles and URL schemes Summernote does not
+    need from a post's HTML. Iframes are kept only for EMBED_HOSTS.
+
+    :param content: HTML from the post editor
+    :return: Sanitised HTML
+    """
+    return bleach.clean(content, tags=ALLOWED_TAGS,
+                        attributes=ALLOWED_ATTRIBUTES,
+                        protocols=ALLOWED_PROTOCOLS,
+                        css_sanitizer=CSS_SANITIZER, strip=True)
+
+
+def plain_text(content):
+    """
+    Text of an HTML document, with block elements separated by spaces.
+
+    :param content: HTML
+    :return: Text with collapsed whitespace
+    """
+    text = re.sub(r'<[^>]+>', '', BLOCK_TAGS.sub(' ', content))
+    return ' '.join(html.unescape(text).split())
+
+
+def summarize(content):
+    """
+    Excerpt, word count and reading time of a post's HTML.
+
+    :param content: Sanitised HTML of the post
+    :return: Tuple of (HTML excerpt, word count, reading time in minutes)
+    """
+    word_count = len(plain_text(content).split())
+    excerpt = Truncator(content).words(EXCERPT_WORDS, html=True)
+    reading_time = max(1, math.ceil(word_count / WORDS_PER_MINUTE))
+    return excerpt, word_count, reading_time
@@ -0,0 +1,102 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from blog.feed import encode_cursor, decode_cursor
+from blog.models import Post, PostLike, Comment
+
+
+def activity_sources(profile):
+    """
+    Querysets of a profile's activities, keyed by activity kind.
+
+    :param profile: Profile whose activities are listed
+    :return: Dictionary mapping kind to queryset
+    """
+    return {
+        'comment': Comment.objects.filter(user=profile).select_related(
+            'user__user', 'post__author__user'),
+        'like': PostLike.objects.filter(user=profile).select_related(
+            'user__user', 'post__author__user'),
+        'post': Post.objects.filter(author=profile,
+                                    is_published=True).select_related(
+            'author__user'),
+    }
+
+
+def after_position(queryset, kind, position):
+    """
+    Restrict a source to the activities that sort after a cursor position.
+
+    Activities are ordered by (created_at, kind, id), newest first, so ties
+    on created_at across sources are broken by kind.
+
+    :param queryset: Activities of one kind
+    :param kind: Kind of the activities in the queryset
+    :param position: Tuple of (created_at, kind, id) of the last activity
+        shown
+    :return: Filtered queryset
+    """
+    created_at, last_kind, pk = position
+    if kind < last_kind:
+        return queryset.filter(created_at__lte=created_at)
+    if kind > last_kind:
+        return queryset.filter(created_at__lt=created_at)
+    return queryset.filter(Q(created_at__lt=created_at) |
+                           Q(created_at=created_at, id__lt=pk))
+
+
+def iterate_source(queryset, kind, position, chunk_size):
+    """
+    Lazily yield a source's activities, newest first, in limited chunks.
+
+    :param queryset: Activities of one kind
+    :param kind: Kind of the activities in the queryset
+    :param position: Cursor position to start after, or None
+    :param chunk_size: Number of rows fetched per query
+    :return: Generator of ((created_at, kind, id), activity) tuples
+    """
+    while True:
+        chunk = queryset if position is None else after_position(
+            queryset, kind, position)
+        chunk = list(chunk.order_by('-created_at', '-id')[:chunk_size])
+        for activity in chunk:
+            yield (activity.created_at, kind, activity.id), activity
+        if len(chunk) < chunk_size:
+            return
+        position = (chunk[-1].created_at, kind, chunk[-1].id)
+
+
+def get_activities(profile, cursor=None, limit=None):
+    """
+    Read a page of a profile's posts, likes and comments, newest first.
+
+    Each source is read in chunks of at most one page and the sources are
+    merged with a heap, so a page touches O(limit) rows.
+
+    :param profile: Profile whose activities are listed
+    :param cursor: Cursor returned with the previous page, if any
+    :param limit: Page size, defaults to ACTIVITY_PAGE_SIZE
+    :return: Tuple of (list of PostLike, Comment and Post instances,
+        cursor for the next page or None)
+    """
+    if limit is None:
+        limit = getattr(settings, 'ACTIVITY_PAGE_SIZE', 20)
+    position = None
+    if cursor:
+        kind, _, rest = cursor.partition('.')
+        decoded = decode_cursor(rest)
+        if decoded is not None:
+            position = (decoded[0], kind, decoded[1])
+    sources = [iterate_source(queryset, kind, position, limit + 1)
+               for kind, queryset in activity_sources(profile).items()]
+    merged = list(islice(heapq.merge(*sources, key=lambda entry: entry[0],
+                                     reverse=True), limit + 1))
+    next_cursor = None
+    if len(merged) > limit:
+        merged = merged[:limit]
+        created_at, kind, pk = merged[-1][0]
+        next_cursor = f'{kind}.{encode_cursor(created_at, pk)}'
+    return [activity for key, activity in merged], next_cursor
@@ -0,0 +1,151 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localdate, make_aware, now
+
+from blog.caching import bump
+from blog.models import LocationReview, PostLike, LocationLikeBucket, \
+    TrendingLocation, RollupWatermark, LocationStats
+
+WATERMARK = 'trending_locations'
+
+
+def window_start():
+    """
+    First day counted towards trending locations.
+
+    :return: Date TRENDING_WINDOW_DAYS before today
+    """
+    days = getattr(settings, 'TRENDING_WINDOW_DAYS', 7)
+    return (now() - timedelta(days=days)).date()
+
+
+def recount_start():
+    """
+    Start of the first day whose likes are recounted on every refresh.
+
+    :return: Midnight TRENDING_RECOUNT_DAYS days before today
+    """
+    days = getattr(settings, 'TRENDING_RECOUNT_DAYS', 2)
+    return make_aware(datetime.combine(localdate() - timedelta(days=days),
+                                       time.min))
+
+
+def count_likes(**lookup):
+    """
+    Count likes per reviewed location and day.
+
+    :param lookup: Filter on PostLike fields selecting the likes counted
+    :return: Dictionary mapping (location id, day) to a number of likes
+    """
+    rows = LocationReview.objects.filter(**{
+        f'post__postlike__{field}': value
+        for field, value in lookup.items()}).annotate(
+        day=TruncDate('post__postlike__created_at')).values(
+        'location_id', 'day').annotate(
+        likes=Count('post__postlike', distinct=True))
+    return {(row['location_id'], row['day']): row['likes'] for row in rows}
+
+
+def add_likes(counts):
+    """
+    Add like counts to the daily buckets of their locations.
+
+    :param counts: Dictionary mapping (location id, day) to a number of
+        likes, as returned by count_likes
+    :return: Number of buckets touched
+    """
+    if not counts:
+        return 0
+    existing = {(bucket.location_id, bucket.day): bucket
+                for bucket in LocationLikeBucket.objects.select_for_update()
+                .filter(day__in={day for _, day in counts},
+                        location_id__in={pk for pk, _ in counts})}
+    created, updated = list(), list()
+    for (location_id, day), likes in counts.items():
+        bucket = existing.get((location_id, day))
+        if bucket is None:
+            created.append(LocationLikeBucket(location_id=location_id,
+                                              day=day, likes=likes))
+        else:
+            bucket.likes += likes
+            updated.append(bucket)
+    LocationLikeBucket.objects.bulk_create(created)
+    LocationLikeBucket.objects.bulk_update(updated, ['likes'])
+    return len(counts)
+
+
+def rank_locations(limit):
+    """
+    Replace the trending locations with the most liked locations of the
+    window, read from the daily buckets, and their average sentiment, read
+    from their stats.
+
+    :param limit: Number of locations kept
+    :return: Number of trending locations
+    """
+    top = list(LocationLikeBucket.objects.filter(
+        day__gte=window_start()).values('location_id').annotate(
+        total=Sum('likes')).order_by('-total', 'location_id')[:limit])
+    sentiments = {stats.location_id: stats.sentiment_mean
+                  for stats in LocationStats.objects.filter(
+                      location_id__in=[row['location_id'] for row in top])}
+    refreshed_at = now()
+    TrendingLocation.objects.all().delete()
+    TrendingLocation.objects.bulk_create([
+        TrendingLocation(location_id=row['location_id'],
+                         likes_count=row['total'],
+                         average_sentiment=sentiments.get(row['location_id']),
+                         refreshed_at=refreshed_at)
+        for row in top])
+    return len(top)
+
+
+def refresh_trending(rebuild=False):
+    """
+    Fold new likes into the daily buckets and rank the locations of the
+    window again.
+
+    The buckets of the last TRENDING_RECOUNT_DAYS days are recounted on
+    every refresh, so likes committed after a later id was read, likes
+    removed since, and likes of posts whose reviews were created after the
+    like are all accounted for. Older likes are only read past a stored id
+    watermark, which covers refreshes that did not run for a while. Buckets
+    that left the window are dropped.
+
+    :param rebuild: Recount every like from scratch
+    :return: Number of trending locations
+    """
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update() \
+            .get_or_create(name=WATERMARK)
+        if rebuild:
+            LocationLikeBucket.objects.all().delete()
+            watermark.last_id = 0
+        start = recount_start()
+        last_id = PostLike.objects.aggregate(last=Max('id'))['last'] or 0
+        if last_id > watermark.last_id:
+            add_likes(count_likes(id__gt=watermark.last_id, id__lte=last_id,
+                                  created_at__lt=start))
+            watermark.last_id = last_id
+            watermark.save()
+        LocationLikeBucket.objects.filter(day__gte=start.date()).delete()
+        add_likes(count_likes(created_at__gte=start))
+        LocationLikeBucket.objects.filter(day__lt=window_start()).delete()
+        ranked = rank_locations(
+            getattr(settings, 'TRENDING_LOCATIONS_SIZE', 12))
+    bump('trending')
+    return ranked
+
+
+def trending_locations(limit=12):
+    """
+    The most liked locations of the window, as last refreshed.
+
+    :param limit: Number of locations
+    :return: List of TrendingLocation instances with their location
+    """
+    return list(TrendingLocation.objects.select_related('location')[:limit])
@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from blog.models import LocationReview, LocationUnread
+
+
+def track(profile_ids, location_ids):
+    """
+    Start unread counters for profiles that followed locations.
+
+    :param profile_ids: Following profiles
+    :param location_ids: Followed locations
+    """
+    LocationUnread.objects.bulk_create([
+        LocationUnread(profile_id=profile_id, location_id=location_id)
+        for profile_id in profile_ids for location_id in location_ids],
+        ignore_conflicts=True)
+
+
+def untrack(profile_ids, location_ids):
+    """
+    Drop the unread counters of profiles that unfollowed locations.
+
+    :param profile_ids: Profiles that stopped following
+    :param location_ids: Unfollowed locations
+    """
+    LocationUnread.objects.filter(profile_id__in=profile_ids,
+                                  location_id__in=location_ids).delete()
+
+
+def announce(post):
+    """
+    Count a published post as unread for the followers of the locations
+    it reviews.
+
+    Each review is announced once, so a post analysed again, or published
+    after it was analysed, is not counted twice. The author's own counters
+    are left alone.
+
+    :param post: Published Post instance
+    :return: Number of counters incremented
+    """
+    with transaction.atomic():
+        location_ids = list(LocationReview.objects.select_for_update()
+                            .filter(post=post, announced=False)
+                            .values_list('location_id', flat=True))
+        if not location_ids:
+            return 0
+        LocationReview.objects.filter(
+            post=post, location_id__in=location_ids).update(announced=True)
+        return LocationUnread.objects.filter(
+            location_id__in=location_ids).exclude(
+            profile_id=post.author_id).update(count=F('count') + 1,
+                                              updated_at=now())
+
+
+def mark_read(user, location_id):
+    """
+    Reset a user's unread counter of a location.
+
+    :param user: User viewing the location
+    :param location_id: Primary key of the location
+    """
+    LocationUnread.objects.filter(profile__user=user,
+                                  location_id=location_id,
+                                  count__gt=0).update(count=0)
+
+
+def unread_locations(profile):
+    """
+    Followed locations with posts the profile has not seen, most recently
+    updated first.
+
+    :param profile: Profile whose counters are read
+    :return: LocationUnread queryset with the locations loaded
+    """
+    return LocationUnread.objects.filter(
+        profile=profile, count__gt=0).select_related('location')
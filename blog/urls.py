@@ -50,4 +50,6 @@ urlpatterns = [
          name='unfollow_location'),
     path('tags/<int:pk>/', views.view_tag, name='view_tag'),
     path('explore/', views.explore, name='explore'),
+    path('explore/suggest/', views.explore_suggest, name='explore_suggest'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
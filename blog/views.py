@@ -1,22 +1,33 @@
-from datetime import timedelta, datetime
-from itertools import chain
-from operator import attrgetter
-
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.contrib.postgres.search import SearchVector, SearchRank
-from django.db.models import Count, Avg
-from django.http import HttpResponse
+from django.core.paginator import Paginator
+from django.db import OperationalError
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
-from django.utils.dateparse import parse_datetime
-from django.utils.timezone import now
-from google.cloud import language_v1beta2 as language
-from google.cloud.language_v1beta2 import Entity, EntityMention, Document
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
 
+from blog.caching import cache_anonymous_page
+from blog.counters import increment
+from blog.feed import get_feed
 from blog.forms import PostForm
-from blog.models import Profile, Post, Location, LocationReview, Tag, \
-    PostLike, Comment
+from blog.images import strip_metadata
+from blog.jobs import enqueue_post_analysis, enqueue_image_renditions, \
+    post_analysis_key
+from blog.metrics import registry
+from blog.models import Profile, Post, Location, Tag, \
+    PostLike, Comment, AnalysisJob
+from blog.queries import published_posts, published_reviews, \
+    explore_profiles, explore_posts, explore_tags, explore_locations, \
+    prefetch_tag_posts, post_detail, profile_detail, profile_reviews, \
+    prefetch_activities
+from blog.recommendations import recommended_profiles
+from blog.search import search, statement_timeout, suggest
+from blog.timeline import get_activities
+from blog.trending import trending_locations
+from blog.unread import mark_read, unread_locations
 
 
 def login_view(request):
@@ -25,10 +36,7 @@ def login_view(request):
         password = request.POST['password']
         user = authenticate(request, username=username, password=password)
         if user is not None:
-            last_login = user.last_login
             login(request, user)
-            if last_login is not None:
-                request.session['previous_login'] = last_login.isoformat()
             return redirect('blog:home')
         else:
             # Return an 'invalid login' error message.
@@ -37,24 +45,23 @@ def login_view(request):
         return render(request, 'login.html')
 
 
+@cache_anonymous_page(lambda: ['posts', 'trending', 'ranking'])
 def index(request):
-    recent_posts = Post.objects.filter(is_published=True)[:12]
-    today = datetime.now()
-    week_ago = today - timedelta(days=7)
-    trending_locations = Location.objects.filter(
-        reviews__postlike__created_at__gte=week_ago).annotate(
-        likes_count=Count('reviews__postlike', distinct=True),
-        average_sentiment=Avg('locationreview__sentiment',
-                              distinct=True)).order_by('-likes_count')[:12]
-    return render(request, 'index.html', {'recent_posts': recent_posts,
-                                          'trending_locations': trending_locations})
+    hot_posts = published_posts().order_by('-hot_score', 'id')[:12]
+    return render(request, 'index.html',
+                  {'hot_posts': hot_posts,
+                   'trending_locations': trending_locations(12)})
 
 
+@cache_anonymous_page(lambda pk: ['posts', f'post:{pk}'])
 def view_post(request, pk):
-    post = Post.objects.get(id=pk)
+    post = post_detail(pk)
     profile = post.author
+    analysis_job = AnalysisJob.objects.filter(
+        key=post_analysis_key(post)).first()
     return render(request, 'view_post.html',
-                  {'post': post, 'profile': profile})
+                  {'post': post, 'profile': profile,
+                   'analysis_job': analysis_job})
 
 
 @login_required
@@ -66,10 +73,8 @@ def publish_new_post(request):
             instance.author = request.user.profile
             instance.is_published = True
             instance.save()
-            post = Post.objects.get(id=instance.id)
-            analyse_entity_sentiment(form, post)
-            classify_post(form, post)
-            return redirect('blog:view_post', post.id)
+            enqueue_post_analysis(instance)
+            return redirect('blog:view_post', instance.id)
         else:
             return HttpResponse(status=400)
 
@@ -82,10 +87,8 @@ def create_post(request):
             instance = form.save(commit=False)
             instance.author = request.user.profile
             instance.save()
-            post = Post.objects.get(id=instance.id)
-            analyse_entity_sentiment(form, post)
-            classify_post(form, post)
-            return redirect('blog:view_post', post.id)
+            enqueue_post_analysis(instance)
+            return redirect('blog:view_post', instance.id)
         else:
             return HttpResponse(status=400)
     elif request.method == 'GET':
@@ -102,7 +105,7 @@ def register(request):
         email = request.POST['email']
         password = request.POST['password']
         username = request.POST['username']
-        image = request.FILES['image']
+        image = strip_metadata(request.FILES['image'])
 
         user = User.objects.create_user(username=username, email=email,
                                         password=password,
@@ -111,7 +114,8 @@ def register(request):
         user.save()
 
         user_profile = Profile.objects.create(user=user, image=image)
-        user_profile.save()
+        if user_profile.image:
+            enqueue_image_renditions(user_profile)
 
         return redirect('blog:home')
 
@@ -141,11 +145,10 @@ def edit_post(request, pk):
         post = Post.objects.get(id=pk)
         form = PostForm(request.POST, instance=post)
         if form.is_valid():
-            analyse_entity_sentiment(form, post)
-            classify_post(form, post)
             instance = form.save(commit=False)
             instance.author = request.user.profile
             instance.save()
+            enqueue_post_analysis(instance)
             return redirect('blog:home')
         else:
             return HttpResponse(status=400)
@@ -155,56 +158,6 @@ def edit_post(request, pk):
     return render(request, 'edit_post.html', {'form': form})
 
 
-def analyse_entity_sentiment(form, post):
-    client, document = extract_document(form)
-    response = client.analyze_entity_sentiment(document=document)
-    for entity in response.entities:
-        if Entity.Type(entity.type).name == 'LOCATION':
-            for mention in entity.mentions:
-                if EntityMention.Type(
-                        mention.type).name == 'PROPER':
-                    print(f'\nDetected Location: {entity.name}')
-                    print(f'Salience score: {entity.salience}')
-                    sentiment = entity.sentiment
-                    print(f'Entity sentiment score: {sentiment.score}')
-                    print(
-                        f'Entity sentiment magnitude: {sentiment.magnitude}')
-                    location, created = Location.objects.get_or_create(
-                        name=entity.name.lower())
-                    location.save()
-                    review, created = LocationReview.objects.update_or_create(
-                        post=post, location=location,
-                        defaults={'sentiment': sentiment.score,
-                                  'magnitude': sentiment.magnitude})
-                    review.save()
-
-
-def classify_post(form, post):
-    client, document = extract_document(form)
-    tags = list()
-    try:
-        response = client.classify_text(document=document)
-        categories = response.categories
-
-        for category in categories:
-            tag = category.name.split('/')[-1]
-            tag, created = Tag.objects.get_or_create(name=tag)
-            tag.save()
-            tags.append(tag)
-    finally:
-        post.tags.set(tags)
-
-
-def extract_document(form):
-    client = language.LanguageServiceClient()
-    title = form.cleaned_data.get('title')
-    content = form.cleaned_data.get('content')
-    text = f"<p>{title}</p>{content}"
-    print(text)
-    document = Document(content=text, type=Document.Type.HTML)
-    return client, document
-
-
 @login_required
 def delete_post(request, pk):
     post = Post.objects.get(id=pk)
@@ -213,52 +166,28 @@ def delete_post(request, pk):
 
 
 def view_user(request, username):
-    profile = Profile.objects.get(user__username=username)
-    activities = get_user_activities_sorted(username)
-    newsfeed = get_newsfeed_sorted(
-        profile.users_following.all()) if request.user.username == username else []
-    blog_posts = Post.objects.filter(author=profile)
-    reviews = LocationReview.objects.filter(post__in=blog_posts)
-    highlight = Post.objects.filter(is_published=True).order_by('-created_at',
-                                                                '-total_likes',
-                                                                '-total_comments',
-                                                                '-total_shares').first()
+    profile = profile_detail(username)
+    activities, activities_cursor = get_activities(
+        profile, request.GET.get('activities_before'))
+    newsfeed, feed_cursor = get_feed(
+        profile, request.GET.get('feed_before')) \
+        if request.user.username == username else ([], None)
+    prefetch_activities(activities + newsfeed)
+    reviews = profile_reviews(profile)
+    highlight = published_posts().order_by('-hot_score', 'id').first()
     # recommend users who follow the same content
-    recommended_users = (Profile.objects.filter(
-        users_following__in=profile.users_following.all()) | Profile.objects.filter(
-        locations_following__in=profile.locations_following.all())).exclude(
-        user=request.user).distinct().order_by('?')[:5]
-    previous_login = parse_datetime(
-        request.session.get('previous_login', now().isoformat()))
-    updates = LocationReview.objects.filter(
-        location__in=profile.locations_following.all(),
-        post__is_published=True,
-        post__created_at__gt=previous_login).values('location').annotate(
-        total=Count('location')).order_by('total')
+    recommended_users = recommended_profiles(
+        profile, 5, [request.user.id] if request.user.is_authenticated
+        else [])
+    updates = unread_locations(profile) \
+        if request.user.username == username else []
     return render(request, 'user.html',
                   {'profile': profile, 'activities': activities,
                    'reviews': reviews, 'highlight': highlight,
                    'recommended_users': recommended_users, 'updates':
-                       updates, 'newsfeed': newsfeed})
-
-
-def get_user_activities_sorted(username):
-    user = Profile.objects.get(user__username=username)
-    likes = PostLike.objects.filter(user=user)
-    comments = Comment.objects.filter(user=user)
-    posts = Post.objects.filter(author=user)
-    result_list = sorted(chain(likes, comments, posts),
-                         key=attrgetter('created_at'), reverse=True)
-    return result_list
-
-
-def get_newsfeed_sorted(users_following):
-    likes = PostLike.objects.filter(user__in=users_following)
-    comments = Comment.objects.filter(user__in=users_following)
-    posts = Post.objects.filter(author__in=users_following)
-    result_list = sorted(chain(likes, comments, posts),
-                         key=attrgetter('created_at'), reverse=True)
-    return result_list
+                       updates, 'newsfeed': newsfeed,
+                   'feed_cursor': feed_cursor,
+                   'activities_cursor': activities_cursor})
 
 
 @login_required
@@ -297,17 +226,24 @@ def users(request):
     return None
 
 
+@cache_anonymous_page(lambda pk: ['posts', f'location:{pk}'])
 def view_location(request, pk):
-    location = Location.objects.get(id=pk)
-    reviews = LocationReview.objects.filter(location=location,
-                                            post__is_published=True)
+    location = Location.objects.select_related('stats').get(id=pk)
+    if request.user.is_authenticated:
+        mark_read(request.user, pk)
+    per_page = page_size(request)
+    reviews = Paginator(published_reviews().filter(location=location)
+                        .order_by('-post__created_at', '-id'),
+                        per_page).get_page(request.GET.get('page'))
     return render(request, 'location.html',
-                  {'location': location, 'reviews': reviews})
+                  {'location': location, 'reviews': reviews,
+                   'per_page': per_page})
 
 
+@cache_anonymous_page(lambda pk: ['posts', f'tag:{pk}'])
 def view_tag(request, pk):
     tag = Tag.objects.get(id=pk)
-    posts = tag.blog_posts.filter(is_published=True)
+    posts = published_posts().filter(tags=tag)
     return render(request, 'tag.html',
                   {'tag': tag, 'posts': posts})
 
@@ -315,20 +251,21 @@ def view_tag(request, pk):
 @login_required
 def like_post(request, pk):
     post = Post.objects.get(id=pk)
-    post_like = PostLike.objects.create(post=post, user=request.user.profile)
-    post_like.save()
-    post.total_likes += 1
-    post.save()
+    _, created = PostLike.objects.get_or_create(post=post,
+                                                user=request.user.profile)
+    if created:
+        increment(post.id, 'total_likes')
     return redirect('blog:view_post', pk)
 
 
 @login_required
 def unlike_post(request, pk):
     post = Post.objects.get(id=pk)
-    post_like = PostLike.objects.get(post=post, user=request.user.profile)
-    post_like.delete()
-    post.total_likes -= 1
-    post.save()
+    _, deleted = PostLike.objects.filter(
+        post=post, user=request.user.profile).delete()
+    unliked = deleted.get(PostLike._meta.label, 0)
+    if unliked:
+        increment(post.id, 'total_likes', -unliked)
     return redirect('blog:view_post', pk)
 
 
@@ -336,11 +273,9 @@ def unlike_post(request, pk):
 def comment_post(request, pk):
     message = request.POST['comment']
     post = Post.objects.get(id=pk)
-    comment = Comment.objects.create(user=request.user.profile, post=post,
-                                     message=message)
-    comment.save()
-    post.total_comments += 1
-    post.save()
+    Comment.objects.create(user=request.user.profile, post=post,
+                           message=message)
+    increment(post.id, 'total_comments')
     return redirect('blog:view_post', pk)
 
 
@@ -349,19 +284,16 @@ def reply_comment(request, pk):
     message = request.POST['comment']
     comment = Comment.objects.get(id=pk)
     post = comment.post
-    reply = Comment.objects.create(user=request.user.profile, post=post,
-                                   message=message, parent=comment)
-    reply.save()
-    post.total_comments += 1
-    post.save()
+    Comment.objects.create(user=request.user.profile, post=post,
+                           message=message, parent=comment)
+    increment(post.id, 'total_comments')
     return redirect('blog:view_post', post.id)
 
 
 @login_required
 def share_post(request, pk):
     post = Post.objects.get(id=pk)
-    post.total_shares += 1
-    post.save()
+    increment(post.id, 'total_shares')
     return redirect('blog:view_post', pk)
 
 
@@ -373,29 +305,100 @@ def publish_post(request, pk):
     return redirect('blog:view_post', pk)
 
 
+def page_size(request):
+    """
+    Read the requested page size, capped at EXPLORE_MAX_PAGE_SIZE.
+
+    :param request: Request object
+    :return: Number of items per page
+    """
+    size = getattr(settings, 'EXPLORE_PAGE_SIZE', 12)
+    try:
+        size = int(request.GET.get('per_page', size))
+    except ValueError:
+        pass
+    return max(1, min(size, getattr(settings, 'EXPLORE_MAX_PAGE_SIZE', 48)))
+
+
+PROFILE_ORDERINGS = {
+    'posts': ('-published_posts_count', 'id'),
+    'followers': ('-followers_count', 'id'),
+}
+
+
 def explore(request):
-    query = request.GET['query']
+    query = request.GET.get('query', '').strip()
+    sort = request.GET.get('sort')
+    if sort not in PROFILE_ORDERINGS:
+        sort = 'posts'
     if query:
-        profiles = Profile.objects.annotate(rank=SearchRank(
-            SearchVector('user__first_name', 'user__last_name',
-                         'user__username'), query)).order_by('-rank')
-        locations = Location.objects.annotate(
-            rank=SearchRank(SearchVector('name'), query)).order_by('-rank')
-        tags = Tag.objects.annotate(
-            rank=SearchRank(SearchVector('name'), query)).order_by('-rank')
-        posts = Post.objects.filter(is_published=True).annotate(
-            rank=SearchRank(
-                SearchVector('title', 'content', 'author__user__first_name',
-                             'author__user__last_name',
-                             'author__user__username'), query)).order_by(
-            '-rank')
+        profiles = search(explore_profiles(), query, 'user__username',
+                          'user__first_name', 'user__last_name')
+        locations = search(explore_locations(), query, 'name')
+        tags = search(explore_tags(), query, 'name')
+        posts = search(explore_posts(), query, 'title', 'content')
     else:
-        profiles = Profile.objects.all().annotate(posts_count=Count(
-            'blog_posts')).order_by('-posts_count')
-        locations = Location.objects.all().order_by('name')
-        tags = Tag.objects.all().order_by('name')
-        posts = Post.objects.all().annotate(likes_count=Count(
-            'postlike')).order_by('-likes_count')
-    return render(request, 'explore.html',
-                  {'profiles': profiles, 'locations': locations, 'tags': tags,
-                   'posts': posts})
+        profiles = explore_profiles().order_by(*PROFILE_ORDERINGS[sort])
+        locations = explore_locations().order_by('name')
+        tags = explore_tags().order_by('name')
+        posts = explore_posts().order_by('-hot_score', 'id')
+    per_page = page_size(request)
+    sections = {'profiles': profiles, 'locations': locations, 'tags': tags,
+                'posts': posts}
+    context = {'query': query, 'per_page': per_page, 'sort': sort}
+    for name, queryset in sections.items():
+        context[name] = Paginator(queryset, per_page).get_page(
+            request.GET.get(f'{name}_page'))
+    prefetch_tag_posts(context['tags'])
+    return render(request, 'explore.html', context)
+
+
+def explore_suggest(request):
+    """
+    Typeahead suggestions for the explore search box.
+
+    :param request: Request object with the typed text in `query`
+    :return: JSON with users, locations and tags starting with the text
+    """
+    query = request.GET.get('query', '').strip()
+    suggestions = {'users': [], 'locations': [], 'tags': []}
+    if len(query) >= getattr(settings, 'SUGGEST_MIN_LENGTH', 2):
+        try:
+            with statement_timeout(getattr(settings, 'SUGGEST_TIMEOUT', 150)):
+                suggestions = suggest(query,
+                                      getattr(settings, 'SUGGEST_LIMIT', 5))
+        except OperationalError:
+            pass
+    return JsonResponse({
+        'users': [{'name': name, 'username': username,
+                   'url': reverse('blog:view_user', args=[username])}
+                  for username, name in suggestions['users']],
+        'locations': [{'name': name,
+                       'url': reverse('blog:view_location', args=[pk])}
+                      for pk, name in suggestions['locations']],
+        'tags': [{'name': name, 'url': reverse('blog:view_tag', args=[pk])}
+                 for pk, name in suggestions['tags']],
+    })
+
+
+def metrics(request):
+    """
+    Request metrics of this process, in the Prometheus text format or as
+    JSON with '?format=json'.
+
+    Staff users can read them, as can scrapers sending METRICS_TOKEN as a
+    bearer token.
+
+    :param request: Request object
+    :return: Metrics response
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if not request.user.is_staff and not (
+            token and constant_time_compare(authorization,
+                                            f'Bearer {token}')):
+        return HttpResponse(status=403)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(registry.as_dict())
+    return HttpResponse(registry.as_prometheus(),
+                        content_type='text/plain; version=0.0.4')
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.metrics.RequestMetricsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,7 +62,7 @@ ROOT_URLCONF = 'travelcave.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'blog.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'blog.context_processors.viewer',
             ],
         },
     },
@@ -77,6 +79,33 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'travelcave.wsgi.application'
 
+# Request metrics
+# Every request is added to the histograms served at /metrics/ to staff
+# users, or to scrapers sending 'Authorization: Bearer <METRICS_TOKEN>'.
+# Statements repeated at least METRICS_DUPLICATE_THRESHOLD times in one
+# request are logged as warnings by 'blog.metrics'; set METRICS_LOG_LEVEL to
+# DEBUG to also log a line per request and per background job.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DUPLICATE_THRESHOLD = config('METRICS_DUPLICATE_THRESHOLD', default=3,
+                                     cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'blog.metrics': {
+            'handlers': ['console'],
+            'level': config('METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Summernote
 SUMMERNOTE_THEME = 'lite'
 SUMMERNOTE_CONFIG = {
@@ -86,6 +115,122 @@ SUMMERNOTE_CONFIG = {
 }
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
+# Natural Language analysis
+# NL_ANALYZER is the backend used to analyse posts. NL_ANALYZER_FALLBACK is
+# used when that backend is still unreachable on a job's last attempt; leave
+# it empty to fail instead.
+# Cached results beyond ANALYSIS_CACHE_MAX_ENTRIES are evicted after a random
+# ANALYSIS_CACHE_EVICT_PROBABILITY share of the writes, or by
+# 'manage.py analysis_cache trim'.
+NL_ANALYZER = config('NL_ANALYZER', default='blog.analyzers.GoogleAnalyzer')
+NL_ANALYZER_FALLBACK = config('NL_ANALYZER_FALLBACK',
+                              default='blog.analyzers.LocalAnalyzer')
+ANALYSIS_JOB_MAX_ATTEMPTS = config('ANALYSIS_JOB_MAX_ATTEMPTS', default=5,
+                                   cast=int)
+ANALYSIS_JOB_BACKOFF = config('ANALYSIS_JOB_BACKOFF', default=30, cast=int)
+ANALYSIS_JOB_BACKOFF_MAX = config('ANALYSIS_JOB_BACKOFF_MAX', default=3600,
+                                  cast=int)
+ANALYSIS_JOB_LEASE = config('ANALYSIS_JOB_LEASE', default=600, cast=int)
+ANALYSIS_CACHE_MAX_ENTRIES = config('ANALYSIS_CACHE_MAX_ENTRIES', default=10000,
+                                    cast=int)
+ANALYSIS_CACHE_EVICT_PROBABILITY = config('ANALYSIS_CACHE_EVICT_PROBABILITY',
+                                          default=0.01, cast=float)
+
+# Post engagement counters
+# 'direct' updates the post row on every like, comment and share. 'sharded'
+# spreads the updates over POST_COUNTER_SHARDS rows per post; run
+# 'manage.py flush_post_counters' periodically to fold them into the post.
+POST_COUNTER_MODE = config('POST_COUNTER_MODE', default='direct')
+POST_COUNTER_SHARDS = config('POST_COUNTER_SHARDS', default=8, cast=int)
+
+# Newsfeed
+FEED_PAGE_SIZE = config('FEED_PAGE_SIZE', default=20, cast=int)
+FEED_BACKFILL_LIMIT = config('FEED_BACKFILL_LIMIT', default=50, cast=int)
+ACTIVITY_PAGE_SIZE = config('ACTIVITY_PAGE_SIZE', default=20, cast=int)
+
+# Explore
+# Each section of the explore page is paginated separately; '?per_page=' is
+# capped at EXPLORE_MAX_PAGE_SIZE. Each tag and location previews its
+# EXPLORE_PREVIEW_SIZE latest posts. Typeahead suggestions are cancelled
+# after SUGGEST_TIMEOUT milliseconds on PostgreSQL.
+EXPLORE_PAGE_SIZE = config('EXPLORE_PAGE_SIZE', default=12, cast=int)
+EXPLORE_MAX_PAGE_SIZE = config('EXPLORE_MAX_PAGE_SIZE', default=48, cast=int)
+EXPLORE_PREVIEW_SIZE = config('EXPLORE_PREVIEW_SIZE', default=4, cast=int)
+SUGGEST_LIMIT = config('SUGGEST_LIMIT', default=5, cast=int)
+SUGGEST_MIN_LENGTH = config('SUGGEST_MIN_LENGTH', default=2, cast=int)
+SUGGEST_TIMEOUT = config('SUGGEST_TIMEOUT', default=150, cast=int)
+
+# Trending locations
+# Run 'manage.py refresh_trending_locations' periodically (the 'trending'
+# Procfile process) to count new likes into the rollup the home page reads.
+# The likes of the last TRENDING_RECOUNT_DAYS days are recounted on every
+# refresh, catching likes committed late or made before their post was
+# analysed.
+TRENDING_WINDOW_DAYS = config('TRENDING_WINDOW_DAYS', default=7, cast=int)
+TRENDING_RECOUNT_DAYS = config('TRENDING_RECOUNT_DAYS', default=2, cast=int)
+TRENDING_LOCATIONS_SIZE = config('TRENDING_LOCATIONS_SIZE', default=12,
+                                 cast=int)
+
+# Post ranking
+# Posts are ranked by log2 of their weighted likes, comments and shares plus
+# their age in HOT_HALF_LIFE_HOURS: a post that much newer needs half the
+# engagement to rank the same. Scores follow every like, comment and share;
+# the 'ranking' process in the Procfile recomputes them hourly, which also
+# picks up changes to these settings.
+HOT_HALF_LIFE_HOURS = config('HOT_HALF_LIFE_HOURS', default=24, cast=float)
+HOT_LIKE_WEIGHT = config('HOT_LIKE_WEIGHT', default=1.0, cast=float)
+HOT_COMMENT_WEIGHT = config('HOT_COMMENT_WEIGHT', default=2.0, cast=float)
+HOT_SHARE_WEIGHT = config('HOT_SHARE_WEIGHT', default=3.0, cast=float)
+
+# Cache
+# 'locmem' keeps a per-process LRU cache, which invalidations from other
+# processes never reach, so it is only the default in DEBUG and whole pages
+# are not cached with it otherwise. 'file' and 'db' share the cache between
+# workers; 'db' is the default outside DEBUG and needs
+# 'manage.py createcachetable' (the Procfile release step). CACHE_LOCATION is
+# the directory of the 'file' cache and the table of the 'db' cache.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+}
+CACHE_BACKEND = config('CACHE_BACKEND',
+                       default='locmem' if DEBUG else 'db')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': config('CACHE_LOCATION', default='travelcave'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=5000,
+                                  cast=int),
+        },
+    }
+}
+# Seconds anonymous pages stay cached; signals invalidate them earlier
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Profile recommendations
+# 'manage.py rebuild_recommendations' periodically scores every profile by
+# the users (RECOMMENDATION_FOLLOW_WEIGHT) and locations
+# (RECOMMENDATION_LOCATION_WEIGHT) it follows in common with the others and
+# keeps the best RECOMMENDATION_CANDIDATES (the 'recommendations' Procfile
+# process); a profile's own list is also refreshed by the worker whenever
+# its follows change.
+RECOMMENDATION_CANDIDATES = config('RECOMMENDATION_CANDIDATES', default=20,
+                                   cast=int)
+RECOMMENDATION_FOLLOW_WEIGHT = config('RECOMMENDATION_FOLLOW_WEIGHT',
+                                      default=0.7, cast=float)
+RECOMMENDATION_LOCATION_WEIGHT = config('RECOMMENDATION_LOCATION_WEIGHT',
+                                        default=0.3, cast=float)
+RECOMMENDATION_INCREMENTAL = config('RECOMMENDATION_INCREMENTAL', default=True,
+                                    cast=bool)
+
+# Profile image renditions, 'WEBP' or 'JPEG'. They are generated by the
+# worker after registration; uploads are stored without their metadata.
+IMAGE_RENDITION_FORMAT = config('IMAGE_RENDITION_FORMAT', default='WEBP')
+IMAGE_RENDITION_QUALITY = config('IMAGE_RENDITION_QUALITY', default=80,
+                                 cast=int)
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
@@ -136,10 +281,22 @@ USE_TZ = True
 # https://warehouse.python.org/project/whitenoise/
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# Media is stored on S3 by 'blog.storage.MediaStorage'. Set
+# AWS_QUERYSTRING_AUTH=False when the bucket is publicly readable, so URLs
+# are built from MEDIA_URL without signing; otherwise signed URLs are reused
+# for MEDIA_URL_CACHE_TTL seconds. 'blog.storage.LocalMediaStorage' stores
+# media in LOCAL_MEDIA_ROOT instead, served from LOCAL_MEDIA_URL in DEBUG.
+DEFAULT_FILE_STORAGE = config('DEFAULT_FILE_STORAGE',
+                              default='blog.storage.MediaStorage')
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
+AWS_QUERYSTRING_AUTH = config('AWS_QUERYSTRING_AUTH', default=True, cast=bool)
+AWS_QUERYSTRING_EXPIRE = config('AWS_QUERYSTRING_EXPIRE', default=3600,
+                                cast=int)
+MEDIA_URL_CACHE_TTL = config('MEDIA_URL_CACHE_TTL', default=600, cast=int)
+LOCAL_MEDIA_ROOT = config('LOCAL_MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+LOCAL_MEDIA_URL = config('LOCAL_MEDIA_URL', default='/media/')
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
@@ -26,3 +26,5 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(settings.LOCAL_MEDIA_URL,
+                          document_root=settings.LOCAL_MEDIA_ROOT)